@@ -0,0 +1,69 @@
+"""
+Builds a listing archive from synthetic runs and times its queries.
+
+    $ python -m benchmarks.archive --runs 100 --listings 10000
+"""
+
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+import time
+
+import numpy as np
+
+from house_finder.archive import SECONDS_PER_DAY, ListingArchive
+from house_finder.search import Listing
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--listings', type=int, default=10000,
+                        help='listings found by each run')
+    args = parser.parse_args()
+
+    random = np.random.RandomState(0)
+    clock = Clock()
+
+    with TemporaryDirectory() as directory:
+        archive = ListingArchive(directory, clock=clock)
+        prices = random.randint(400, 1500, size=args.listings * 2)
+
+        start = time.perf_counter()
+
+        for _ in range(args.runs):
+            clock.now += SECONDS_PER_DAY
+            prices = np.where(random.random_sample(len(prices)) < 0.02, prices - 25, prices)
+
+            run = archive.run()
+            found = random.choice(len(prices), size=args.listings, replace=False)
+            for _ in run.search((
+                Listing(str(i), (52.9, -1.5), int(prices[i]), '', '', '', '', '')
+                for i in found
+            ), 'derby'):
+                pass
+            run.commit()
+
+        print(f'Archived {len(archive)} rows in {time.perf_counter() - start:.1f}s')
+
+        for name, query in [
+            ('index', lambda: archive.index),
+            ('price drops', lambda: archive.price_drops(30)),
+            ('time on market', lambda: archive.time_on_market()),
+            ('history', lambda: archive.history('0')),
+        ]:
+            start = time.perf_counter()
+            query()
+            print(f'  {name:<16} {time.perf_counter() - start:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
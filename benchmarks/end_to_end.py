@@ -0,0 +1,220 @@
+"""
+Runs the whole command line tool against local stand-ins for Zoopla and
+Google Maps, and reports the wall time and peak RSS of each stage, the
+number of API calls and the cache hit ratios.
+
+    $ python -m benchmarks.end_to_end --listings 100 1000 10000 --latency 0.02
+
+Every run starts with empty caches, in a temporary directory. With --warm
+the same run is repeated straight after, against the caches it filled.
+"""
+
+from argparse import ArgumentParser
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+import threading
+import time
+
+import yaml
+
+from house_finder import cli
+from house_finder.metrics import metrics
+
+from .servers import FakeGoogleMaps, FakeZoopla
+
+
+INPUT = {
+    'search': {
+        'area': 'Derby',
+        'listing': 'rent',
+        'bedrooms': [1, 5],
+        'price': [0, 5000],
+    },
+    'objectives': [
+        {'name': 'Price', 'type': 'price'},
+        {
+            'name': 'Commute', 'type': 'travel_time', 'maximum': 3600,
+            'params': {'to': 'Rolls-Royce, Derby', 'via': 'transit', 'arriving_at': '09:00'},
+        },
+        {
+            'name': 'Station', 'type': 'travel_time', 'place_tile_size': 2000,
+            'params': {'to_any': 'train_station', 'via': 'walking'},
+        },
+    ],
+}
+
+
+class RSSSampler:
+    """
+    Samples the resident set size of this process on a background thread.
+    """
+
+    interval = 0.01
+
+    def __init__(self):
+        self.samples = []
+        self.running = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def rss(self):
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def run(self):
+        while self.running:
+            self.samples.append((time.perf_counter(), self.rss()))
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.running = False
+        self.thread.join()
+
+    def peak(self, start, end):
+        return max((rss for t, rss in self.samples if start <= t <= end), default=0)
+
+
+def write_yaml(filename, data):
+    with open(filename, 'w') as file:
+        yaml.dump(data, file)
+
+
+def run_cli(directory, zoopla, google, workers):
+    write_yaml(directory / 'input.yaml', INPUT)
+    write_yaml(directory / 'secrets.yaml', {
+        'zoopla': {'api_key': 'benchmark', 'url': zoopla.api_url},
+        'google': {
+            'api_key': 'AIzaBenchmark', 'base_url': google.url,
+            'queries_per_second': 1000,
+        },
+    })
+
+    arguments = [
+        'house_finder',
+        '-i', str(directory / 'input.yaml'),
+        '-s', str(directory / 'secrets.yaml'),
+        '-o', str(directory / 'report.html'),
+        '-w', str(workers),
+    ]
+
+    metrics.reset()
+    zoopla_requests, google_requests = zoopla.requests, google.requests
+
+    with RSSSampler() as sampler:
+        start = time.perf_counter()
+        sys.argv = arguments
+        cli.main()
+        wall_time = time.perf_counter() - start
+
+    summary = metrics.summary()
+
+    stages = {}
+    for name, spans in metrics.spans.items():
+        if name.startswith('stage.'):
+            stages[name[len('stage.'):]] = {
+                'seconds': sum(end - start for start, end in spans),
+                'peak_rss_mb': max(sampler.peak(start, end) for start, end in spans) / 1024 ** 2,
+            }
+
+    return {
+        'wall_seconds': wall_time,
+        'peak_rss_mb': sampler.peak(0, float('inf')) / 1024 ** 2,
+        'stages': stages,
+        'api_calls': {
+            name: timer['count'] for name, timer in summary['timers'].items()
+            if name.startswith(('google.', 'zoopla.'))
+        },
+        'server_requests': {
+            'zoopla': zoopla.requests - zoopla_requests,
+            'google': google.requests - google_requests,
+        },
+        'hit_ratios': summary['hit_ratios'],
+    }
+
+
+def report(name, result):
+    print(f'{name}: {result["wall_seconds"]:.2f}s, peak RSS {result["peak_rss_mb"]:.0f}MB')
+
+    for stage, stats in result['stages'].items():
+        print(f'  {stage:<24} {stats["seconds"]:>8.2f}s {stats["peak_rss_mb"]:>8.0f}MB')
+
+    calls = ', '.join(f'{k} {v}' for k, v in sorted(result['api_calls'].items()))
+    print(f'  API calls: {calls}')
+
+    ratios = ', '.join(f'{k} {v:.0%}' for k, v in sorted(result['hit_ratios'].items()))
+    print(f'  hit ratios: {ratios}')
+
+
+def load_fixtures(filename):
+    """
+    Recorded responses, as {"zoopla": {path: body}, "google": {path: body}}.
+    """
+
+    if filename is None:
+        return {}, {}
+
+    with open(filename) as file:
+        fixtures = json.load(file)
+
+    return fixtures.get('zoopla', {}), fixtures.get('google', {})
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--listings', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds added to every API response')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of Google requests which fail')
+    parser.add_argument('--rate-limit', type=int,
+                        help='Google requests allowed per second')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--fixtures', help='json file of recorded responses to replay')
+    parser.add_argument('--warm', action='store_true',
+                        help='repeat each run against the caches it filled')
+    parser.add_argument('--json', help='file path to write the results to')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ['BROWSER'] = 'true'  # don't open the report
+
+    zoopla_fixtures, google_fixtures = load_fixtures(args.fixtures)
+    results = {}
+
+    for n_listings in args.listings:
+        zoopla = FakeZoopla(n_listings, latency=args.latency, fixtures=zoopla_fixtures)
+        google = FakeGoogleMaps(
+            latency=args.latency, error_rate=args.error_rate,
+            rate_limit=args.rate_limit, fixtures=google_fixtures,
+        )
+
+        with zoopla, google, TemporaryDirectory() as directory:
+            directory = Path(directory)
+            working_directory = os.getcwd()
+            os.chdir(directory)
+
+            try:
+                results[f'{n_listings} cold'] = run_cli(directory, zoopla, google, args.workers)
+                report(f'{n_listings} listings, cold', results[f'{n_listings} cold'])
+
+                if args.warm:
+                    results[f'{n_listings} warm'] = run_cli(directory, zoopla, google, args.workers)
+                    report(f'{n_listings} listings, warm', results[f'{n_listings} warm'])
+            finally:
+                os.chdir(working_directory)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Times rendering the HTML report and measures its size.
+
+    $ python -m benchmarks.html --listings 1000 10000
+"""
+
+from argparse import ArgumentParser
+import gzip
+import io
+import os
+from tempfile import TemporaryDirectory
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from house_finder.evaluator import EvaluationResult, object_array
+from house_finder.objectives import Objective
+from house_finder.outputs.filters import RankEvaluator
+from house_finder.outputs.html import render_html
+
+
+def synthetic_result(n_listings, n_objectives, seed=0):
+    random = np.random.RandomState(seed)
+
+    listings = object_array([
+        SimpleNamespace(
+            location=(52.9 + random.uniform(-0.1, 0.1), -1.5 + random.uniform(-0.1, 0.1)),
+            address=f'{i} Example Street, Derby',
+            url=f'https://www.zoopla.co.uk/to-rent/details/{i}',
+            image_url=f'https://lid.zoocdn.com/354/255/{i}.jpg',
+        )
+        for i in range(n_listings)
+    ])
+
+    objectives = [Objective(f'Objective {j}') for j in range(n_objectives)]
+
+    score_matrix = random.randint(0, 3600, size=(n_listings, n_objectives)).astype(float)
+    presented_scores = np.vectorize(lambda x: f'{round(x / 60)}&nbsp;mins', otypes=[object])(score_matrix)
+
+    return EvaluationResult(listings, objectives, score_matrix, presented_scores), objectives
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--listings', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--objectives', type=int, default=5)
+    args = parser.parse_args()
+
+    secrets = {'google': SimpleNamespace(key='key')}
+
+    for n_listings in args.listings:
+        result, objectives = synthetic_result(n_listings, args.objectives)
+        ranked = RankEvaluator(result)
+
+        with TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'report.html')
+
+            start = time.perf_counter()
+            with open(filename, 'w') as file:
+                render_html(secrets, ranked, objectives, file)
+            elapsed = time.perf_counter() - start
+
+            with open(filename, 'rb') as file:
+                contents = file.read()
+
+        compressed = io.BytesIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as file:
+            file.write(contents)
+
+        print(f'{n_listings}x{args.objectives}: rendered in {elapsed:.2f}s, '
+              f'{len(contents) / 1024:.0f}KiB ({len(compressed.getvalue()) / 1024:.0f}KiB gzipped)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares RankEvaluator against the previous implementation, which built a
+new ParetoFront for each rank and removed its members from a list.
+
+    $ python -m benchmarks.ranking --listings 10000 --objectives 5
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+import time
+
+import numpy as np
+
+from house_finder.evaluator import EvaluatedListing, Score
+from house_finder.outputs.filters import ParetoFront, RankEvaluator
+
+
+def synthetic_evaluated_listings(n_listings, n_objectives, seed=0):
+    values = np.random.RandomState(seed).randint(0, 3600, size=(n_listings, n_objectives))
+
+    return [
+        EvaluatedListing(
+            None,
+            OrderedDict(
+                (f'objective {j}', Score(int(value), str(value)))
+                for j, value in enumerate(row)
+            ),
+            {},
+        )
+        for row in values
+    ]
+
+
+def repeated_pareto_fronts(evaluated_listings):
+    evaluated_listings = list(evaluated_listings)
+
+    fronts = []
+
+    while evaluated_listings:
+        pareto_front = ParetoFront(evaluated_listings)
+        for e in pareto_front:
+            evaluated_listings.remove(e)
+        fronts.append(pareto_front)
+
+    return fronts
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--listings', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--objectives', type=int, default=5)
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='only time the current implementation')
+    args = parser.parse_args()
+
+    for n_listings in args.listings:
+        evaluated_listings = synthetic_evaluated_listings(n_listings, args.objectives)
+
+        ranks, elapsed = timed(RankEvaluator, evaluated_listings)
+        print(f'{n_listings}x{args.objectives}: non-dominated sort took {elapsed:.2f}s '
+              f'({len(ranks)} fronts)')
+
+        if not args.skip_legacy:
+            legacy_ranks, legacy_elapsed = timed(repeated_pareto_fronts, evaluated_listings)
+            print(f'{n_listings}x{args.objectives}: repeated Pareto fronts took '
+                  f'{legacy_elapsed:.2f}s ({len(legacy_ranks)} fronts)')
+
+            assert [len(front) for front in ranks] == [len(front) for front in legacy_ranks]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Local stand-ins for the Zoopla and Google Maps APIs, for benchmarks. Each
+server runs on a background thread and can add latency, fail a fraction of
+requests and enforce a rate limit. Responses are generated from a seed, or
+replayed from fixtures recorded as JSON.
+"""
+
+from collections import deque
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+CENTRE = (52.9225, -1.4746)  # Derby
+
+
+def distance(a, b):
+    scale = math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(a[0] - b[0], (a[1] - b[1]) * scale) * 111_320
+
+
+def parse_location(string):
+    latitude, longitude = string.split(',')
+    return float(latitude), float(longitude)
+
+
+class FakeServer:
+    """
+    A threaded HTTP server which answers GET requests with 'respond'.
+
+    :param latency: Seconds added to every response
+    :param error_rate: The fraction of requests answered with a 500
+    :param rate_limit: The most requests answered per second, beyond which
+                       'rate_limited' is returned
+    :param fixtures: A dict from request path to a recorded response body,
+                     which is served instead of a generated one
+    """
+
+    def __init__(self, latency=0, error_rate=0, rate_limit=None, fixtures=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.fixtures = fixtures or {}
+        self.random = random.Random(seed)
+
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited_requests = 0
+        self.recent = deque()
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, body = server.handle(url.path, params)
+
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _is_rate_limited(self):
+        if self.rate_limit is None:
+            return False
+
+        now = time.monotonic()
+
+        with self.lock:
+            while self.recent and self.recent[0] < now - 1:
+                self.recent.popleft()
+
+            if len(self.recent) >= self.rate_limit:
+                self.rate_limited_requests += 1
+                return True
+
+            self.recent.append(now)
+            return False
+
+    def handle(self, path, params):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failed:
+            return 500, {'error': 'Internal server error'}
+
+        if self._is_rate_limited():
+            return self.rate_limited()
+
+        if path in self.fixtures:
+            return 200, self.fixtures[path]
+
+        return self.respond(path, params)
+
+    def rate_limited(self):
+        return 429, {'error': 'Rate limited'}
+
+    def respond(self, path, params):
+        raise NotImplementedError('respond must be implemented')
+
+
+class FakeZoopla(FakeServer):
+    """
+    Serves 'result_count' synthetic listings scattered around a centre,
+    a page at a time.
+    """
+
+    path = '/api/v1/property_listings.json'
+
+    def __init__(self, result_count, radius=10_000, **kwargs):
+        super().__init__(**kwargs)
+        self.result_count = result_count
+        self.radius = radius
+
+    @property
+    def api_url(self):
+        return self.url + self.path
+
+    def listing(self, i):
+        generator = random.Random(i)
+        angle = generator.uniform(0, 2 * math.pi)
+        metres = self.radius * math.sqrt(generator.random())
+
+        return {
+            'listing_id': str(i),
+            'latitude': CENTRE[0] + math.cos(angle) * metres / 111_320,
+            'longitude': CENTRE[1] + math.sin(angle) * metres / 111_320 / math.cos(math.radians(CENTRE[0])),
+            'price': str(generator.randrange(400, 1500, 25)),
+            'details_url': f'https://www.zoopla.co.uk/to-rent/details/{i}',
+            'displayable_address': f'{i} Example Street, Derby',
+            'image_url': f'https://lid.zoocdn.com/354/255/{i}.jpg',
+            'description': 'A house. ' * 20,
+            'furnished_state': generator.choice(['furnished', 'unfurnished', 'part_furnished']),
+        }
+
+    def respond(self, path, params):
+        if path != self.path:
+            return 404, {'error': 'Not found'}
+
+        page_size = int(params.get('page_size', 10))
+        page_number = int(params.get('page_number', 1))
+
+        first = (page_number - 1) * page_size
+        last = min(first + page_size, self.result_count)
+
+        return 200, {
+            'result_count': self.result_count,
+            'listing': [self.listing(i) for i in range(first, last)],
+        }
+
+
+class FakeGoogleMaps(FakeServer):
+    """
+    Answers geocoding, directions, distance matrix and nearby search
+    requests. Travel times are the straight line distance at 'speed', and
+    places are spread on a regular grid.
+    """
+
+    def __init__(self, speed=8, place_spacing=2_000, **kwargs):
+        super().__init__(**kwargs)
+        self.speed = speed
+        self.place_spacing = place_spacing
+
+    def rate_limited(self):
+        return 200, {'status': 'OVER_QUERY_LIMIT', 'error_message': 'Rate limited'}
+
+    def duration(self, origin, destination):
+        return int(distance(origin, destination) / self.speed) + 60
+
+    def respond(self, path, params):
+        if path == '/maps/api/geocode/json':
+            generator = random.Random(params.get('address'))
+            return 200, {'status': 'OK', 'results': [{'geometry': {'location': {
+                'lat': CENTRE[0] + generator.uniform(-0.05, 0.05),
+                'lng': CENTRE[1] + generator.uniform(-0.05, 0.05),
+            }}}]}
+
+        elif path == '/maps/api/directions/json':
+            duration = self.duration(
+                parse_location(params['origin']), parse_location(params['destination'])
+            )
+            return 200, {'status': 'OK', 'routes': [
+                {'legs': [{'duration': {'value': duration}}]}
+            ]}
+
+        elif path == '/maps/api/distancematrix/json':
+            origins = [parse_location(o) for o in params['origins'].split('|')]
+            destinations = [parse_location(d) for d in params['destinations'].split('|')]
+
+            return 200, {'status': 'OK', 'rows': [
+                {'elements': [
+                    {'status': 'OK', 'duration': {'value': self.duration(o, d)}}
+                    for d in destinations
+                ]}
+                for o in origins
+            ]}
+
+        elif path == '/maps/api/place/nearbysearch/json':
+            return 200, {'status': 'OK', 'results': self.places_near(
+                parse_location(params['location']), float(params.get('radius', 5_000))
+            )}
+
+        return 404, {'status': 'NOT_FOUND'}
+
+    def places_near(self, location, radius):
+        step = self.place_spacing / 111_320
+        scale = math.cos(math.radians(location[0]))
+
+        rows = range(math.floor((location[0] - radius / 111_320) / step),
+                     math.ceil((location[0] + radius / 111_320) / step) + 1)
+        columns = range(math.floor((location[1] - radius / 111_320 / scale) / step),
+                        math.ceil((location[1] + radius / 111_320 / scale) / step) + 1)
+
+        places = []
+        for row in rows:
+            for column in columns:
+                place = (row * step, column * step)
+                if distance(place, location) <= radius:
+                    places.append({
+                        'place_id': f'{row}:{column}',
+                        'geometry': {'location': {'lat': place[0], 'lng': place[1]}},
+                    })
+
+        places.sort(key=lambda place: distance(location, (
+            place['geometry']['location']['lat'], place['geometry']['location']['lng']
+        )))
+
+        return places[:20]
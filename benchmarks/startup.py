@@ -0,0 +1,68 @@
+"""
+Measures how long the command line tool takes to import, using
+`python -X importtime` in a fresh interpreter each time, and which of the
+heavy optional dependencies were imported.
+
+    $ python -m benchmarks.startup --repeat 10
+"""
+
+from argparse import ArgumentParser
+import statistics
+import subprocess
+import sys
+
+
+HEAVY_MODULES = [
+    'matplotlib', 'jinja2', 'requests_cache', 'googlemaps', 'numpy', 'asyncio',
+    'house_finder.routing',
+]
+
+
+def import_time(module):
+    """
+    :return: The cumulative import time of 'module' in seconds, and the
+             top level modules imported along with it
+    """
+
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True,
+    )
+
+    imported = set()
+    total = None
+
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        imported.add(name)
+
+        if name == module:
+            total = int(cumulative) / 1e6
+
+    return total, imported
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--module', default='house_finder.cli')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    times = []
+    for _ in range(args.repeat):
+        total, imported = import_time(args.module)
+        times.append(total)
+
+    print(f'{args.module}: median {statistics.median(times) * 1000:.0f}ms, '
+          f'min {min(times) * 1000:.0f}ms over {args.repeat} runs')
+
+    for name in HEAVY_MODULES:
+        print(f'  {name:<24} {"imported" if name in imported else "not imported"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,524 @@
+from contextlib import contextmanager
+from enum import IntEnum
+import fcntl
+from functools import cached_property
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from .journal import objective_key
+
+
+logger = logging.getLogger(__name__)
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class ListingStatus(IntEnum):
+    listed = 0
+    removed = 1  # found by the previous run of a search, but not this one
+
+
+# the dtype of every column, stored one file per column
+TABLES = {
+    'rows': {
+        'timestamp': 'f8',
+        'listing': 'i4',  # index into the listing ids
+        'query': 'i4',  # index into the queries
+        'status': 'u1',
+        'price': 'f8',
+        'latitude': 'f8',
+        'longitude': 'f8',
+    },
+    'scores': {
+        'row': 'i8',
+        'objective': 'i4',  # index into the objectives
+        'value': 'f8',
+    },
+}
+
+
+class ListingArchive:
+    """
+    An append only, columnar history of every listing every run has found:
+    one row per run and listing with its price, location and status, and
+    the scores it was given in a separate table.
+
+    Each column is a flat binary file which is memory mapped for queries, so
+    millions of rows can be analysed without loading them into Python
+    objects. Rows are indexed by listing id, in time order within each
+    listing. A run's rows are written in one go when it is committed, and
+    only count once a new meta file has replaced the old one, so anything
+    left over from a crash is ignored. Commits hold a lock on the directory
+    and reload the meta file first, so several processes can share an
+    archive and each appends after whatever the others committed.
+    """
+
+    version = 1
+
+    def __init__(self, directory, clock=time.time):
+        self.directory = Path(directory)
+        self.clock = clock
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load_meta()
+
+    def _read_meta(self):
+        try:
+            with open(self.directory / 'meta.json') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {
+                'version': self.version,
+                'rows': 0, 'scores': 0,
+                'listings': 0, 'listing_ids_bytes': 0,
+                'indexed_rows': 0,
+                'queries': [], 'objectives': [], 'runs': [],
+            }
+
+    def _load_meta(self):
+        self.meta = self._read_meta()
+
+        for name in ('tables', 'listing_ids', 'codes', 'index', 'latest_rows'):
+            self.__dict__.pop(name, None)
+
+    def _write_meta(self, meta):
+        temporary = self.directory / 'meta.json.tmp'
+
+        with open(temporary, 'w') as file:
+            json.dump(meta, file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary, self.directory / 'meta.json')
+
+    @contextmanager
+    def _lock(self):
+        """
+        Hold an exclusive lock on the archive, shared with other processes.
+        """
+
+        with open(self.directory / 'lock', 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _filename(self, table, column):
+        return self.directory / f'{table}.{column}.bin'
+
+    def _map(self, table, column, count):
+        dtype = np.dtype(TABLES[table][column])
+
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+
+        return np.memmap(self._filename(table, column), dtype=dtype, mode='r', shape=(count, ))
+
+    @cached_property
+    def tables(self):
+        return {
+            table: {
+                column: self._map(table, column, self.meta[table])
+                for column in columns
+            }
+            for table, columns in TABLES.items()
+        }
+
+    @property
+    def rows(self):
+        return self.tables['rows']
+
+    @property
+    def scores(self):
+        return self.tables['scores']
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @cached_property
+    def listing_ids(self):
+        if not self.meta['listings']:
+            return []
+
+        with open(self.directory / 'listing_ids.txt', 'rb') as file:
+            data = file.read(self.meta['listing_ids_bytes'])
+
+        # one id per line
+        return data.decode().split('\n')[:-1]
+
+    @cached_property
+    def codes(self):
+        return {listing_id: code for code, listing_id in enumerate(self.listing_ids)}
+
+    @property
+    def objective_names(self):
+        return [name for name, _ in self.meta['objectives']]
+
+    @cached_property
+    def index(self):
+        """
+        The row numbers sorted by listing, and the position in them where
+        each listing's rows start, so listing 'i' has the rows
+        order[starts[i]:starts[i + 1]].
+        """
+
+        filename = self.directory / 'index.bin'
+
+        with self._lock():
+            # another process may have committed, and indexed, more rows
+            meta = self._read_meta()
+
+            if meta['indexed_rows'] == len(self):
+                order = self._map_index(filename)
+            else:
+                # rows are appended in time order, so a stable sort keeps
+                # each listing's rows in time order
+                order = np.argsort(self.rows['listing'], kind='stable').astype('i8')
+
+                # an index of fewer rows than are committed is never saved
+                if meta['rows'] == len(self):
+                    # replaced rather than overwritten, as the old index may be mapped
+                    temporary = self.directory / 'index.bin.tmp'
+                    with open(temporary, 'wb') as file:
+                        file.write(order.tobytes())
+                    os.replace(temporary, filename)
+
+                    meta['indexed_rows'] = self.meta['indexed_rows'] = len(self)
+                    self._write_meta(meta)
+
+        starts = np.searchsorted(
+            self.rows['listing'][order], np.arange(self.meta['listings'] + 1)
+        )
+
+        return order, starts
+
+    def _map_index(self, filename):
+        if not len(self):
+            return np.empty(0, dtype='i8')
+
+        return np.memmap(filename, dtype='i8', mode='r', shape=(len(self), ))
+
+    def rows_for(self, listing_id):
+        code = self.codes.get(listing_id)
+        if code is None:
+            return np.empty(0, dtype='i8')
+
+        order, starts = self.index
+        return np.asarray(order[starts[code]:starts[code + 1]])
+
+    @cached_property
+    def latest_rows(self):
+        """
+        The most recent row of each listing.
+        """
+
+        order, starts = self.index
+        return np.asarray(order[starts[1:] - 1]) if len(order) else np.empty(0, dtype='i8')
+
+    def history(self, listing_id):
+        """
+        Every row of a listing, oldest first, as a dict of columns. Its
+        scores are a (rows, objectives) array under 'scores', with NaN where
+        there is no score.
+        """
+
+        rows = self.rows_for(listing_id)
+        history = {column: np.asarray(values[rows]) for column, values in self.rows.items()}
+
+        scores = np.full((len(rows), len(self.meta['objectives'])), np.nan)
+
+        # scores are appended in row order
+        score_rows = self.scores['row']
+        for i, row in enumerate(rows):
+            start, end = np.searchsorted(score_rows, [row, row + 1])
+            scores[i, self.scores['objective'][start:end]] = self.scores['value'][start:end]
+
+        history['scores'] = scores
+        return history
+
+    def _ids(self, codes):
+        ids = np.empty(len(codes), dtype=object)
+        ids[:] = [self.listing_ids[code] for code in codes]
+        return ids
+
+    def price_drops(self, days=30, now=None):
+        """
+        Every time a listing's price went down in the last 'days' days.
+
+        :return: A dict of arrays of the listing id, when it was seen at the
+                 lower price, and the price before and after
+        """
+
+        now = self.clock() if now is None else now
+
+        order, _ = self.index
+        order = np.asarray(order)
+        order = order[self.rows['status'][order] == ListingStatus.listed]
+
+        listings = self.rows['listing'][order]
+        prices = self.rows['price'][order]
+        timestamps = self.rows['timestamp'][order]
+
+        drops = np.flatnonzero(
+            (listings[1:] == listings[:-1])
+            & (prices[1:] < prices[:-1])
+            & (timestamps[1:] >= now - days * SECONDS_PER_DAY)
+        )
+
+        return {
+            'listing_id': self._ids(listings[drops + 1]),
+            'timestamp': timestamps[drops + 1],
+            'old_price': prices[drops],
+            'new_price': prices[drops + 1],
+        }
+
+    def time_on_market(self, now=None):
+        """
+        How long each listing has been, or was, on the market: from the first
+        run which found it, until the run which found it was removed or,
+        while it's still listed, until now.
+
+        :return: A dict of arrays of the listing id, when it was first
+                 listed, whether it's still listed and the number of days
+        """
+
+        now = self.clock() if now is None else now
+
+        order, starts = self.index
+        if not len(order):
+            return {'listing_id': self._ids([]), 'first_listed': np.empty(0),
+                    'on_market': np.empty(0, dtype=bool), 'days': np.empty(0)}
+
+        first = np.asarray(order[starts[:-1]])
+        last = self.latest_rows
+
+        on_market = self.rows['status'][last] == ListingStatus.listed
+        first_listed = self.rows['timestamp'][first]
+        ended = np.where(on_market, now, self.rows['timestamp'][last])
+
+        return {
+            'listing_id': self._ids(np.arange(self.meta['listings'])),
+            'first_listed': first_listed,
+            'on_market': on_market,
+            'days': (ended - first_listed) / SECONDS_PER_DAY,
+        }
+
+    def has_changed(self, listing):
+        """
+        Whether a listing is new, relisted, or has a different price or
+        location since it was last archived.
+        """
+
+        code = self.codes.get(listing.id)
+        if code is None:
+            return True
+
+        row = self.latest_rows[code]
+
+        return (
+            self.rows['status'][row] != ListingStatus.listed
+            or self.rows['price'][row] != listing.price
+            or self.rows['latitude'][row] != listing.location[0]
+            or self.rows['longitude'][row] != listing.location[1]
+        )
+
+    def run(self):
+        return ArchiveRun(self, self.clock())
+
+    def _append(self, table, columns, length):
+        count = self.meta[table]
+
+        for column, dtype in TABLES[table].items():
+            values = np.asarray(columns[column], dtype=dtype)
+            filename = self._filename(table, column)
+
+            with open(filename, 'ab') as file:
+                # drop anything written by a run which didn't commit
+                file.truncate(count * values.itemsize)
+                file.write(values.tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+
+        self.meta[table] = count + length
+
+    def _append_listing_ids(self, listing_ids):
+        data = ''.join(f'{listing_id}\n' for listing_id in listing_ids).encode()
+
+        with open(self.directory / 'listing_ids.txt', 'ab') as file:
+            file.truncate(self.meta['listing_ids_bytes'])
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.meta['listings'] += len(listing_ids)
+        self.meta['listing_ids_bytes'] += len(data)
+
+    def _code(self, values, value):
+        """
+        The index of 'value' in a list kept in the meta file, adding it if
+        it's new.
+        """
+
+        if value not in values:
+            values.append(value)
+
+        return values.index(value)
+
+    def _commit(self, run):
+        with self._lock():
+            # append after anything other processes have committed since
+            self._load_meta()
+            self._commit_locked(run)
+
+    def _commit_locked(self, run):
+        timestamp = run.timestamp
+
+        new_ids = [listing_id for listing_id in run.listings if listing_id not in self.codes]
+        codes = dict(self.codes)
+        codes.update((listing_id, len(self.codes) + i) for i, listing_id in enumerate(new_ids))
+
+        listed = list(run.listings.items())
+        columns = {
+            'timestamp': np.full(len(listed), timestamp),
+            'listing': [codes[listing_id] for listing_id, _ in listed],
+            'query': [self._code(self.meta['queries'], row.query) for _, row in listed],
+            'status': np.full(len(listed), ListingStatus.listed),
+            'price': [row.price for _, row in listed],
+            'latitude': [row.latitude for _, row in listed],
+            'longitude': [row.longitude for _, row in listed],
+        }
+
+        removed = self._removed_rows(run, columns)
+        for column in columns:
+            columns[column] = np.concatenate([
+                np.asarray(columns[column], dtype=TABLES['rows'][column]), removed[column]
+            ])
+
+        first_row = len(self)
+        row_numbers = {listing_id: first_row + i for i, listing_id in enumerate(run.listings)}
+
+        # objectives are kept as [name, key] pairs
+        scores = sorted(
+            (row_numbers[listing_id], self._code(self.meta['objectives'], list(objective)), value)
+            for (listing_id, objective), value in run.scores.items()
+            if listing_id in row_numbers
+        )
+
+        self._append_listing_ids(new_ids)
+        self._append('rows', columns, len(columns['timestamp']))
+        self._append('scores', {
+            'row': [row for row, _, _ in scores],
+            'objective': [objective for _, objective, _ in scores],
+            'value': [value for _, _, value in scores],
+        }, len(scores))
+
+        self.meta['runs'].append({
+            'timestamp': timestamp,
+            'start': first_row, 'end': len(self),
+            'queries': sorted({self._code(self.meta['queries'], query) for query in run.queries}),
+        })
+        self._write_meta(self.meta)
+        self._load_meta()
+
+        logger.info(
+            f'Archived {len(listed)} listings, {len(removed["timestamp"])} removed '
+            f'and {len(scores)} scores'
+        )
+
+    def _removed_rows(self, run, columns):
+        """
+        Rows marking the listings each search found last time, but not this
+        time, as removed.
+        """
+
+        removed_rows = []
+
+        for query in run.queries:
+            code = self._code(self.meta['queries'], query)
+
+            previous = [r for r in self.meta['runs'] if code in r['queries']]
+            if not previous:
+                continue
+
+            rows = np.arange(previous[-1]['start'], previous[-1]['end'])
+            removed_rows.append(rows[
+                (self.rows['query'][rows] == code)
+                & (self.rows['status'][rows] == ListingStatus.listed)
+                & ~np.isin(self.rows['listing'][rows], columns['listing'])
+            ])
+
+        rows = np.concatenate([np.empty(0, dtype='i8')] + removed_rows)
+        # a listing found by more than one search is only removed once
+        rows = rows[np.unique(self.rows['listing'][rows], return_index=True)[1]]
+
+        removed = {column: np.asarray(values[rows]) for column, values in self.rows.items()}
+        removed['timestamp'] = np.full(len(rows), run.timestamp)
+        removed['status'] = np.full(len(rows), ListingStatus.removed, dtype='u1')
+
+        return removed
+
+
+class ArchivedListing(NamedTuple):
+    price: float
+    latitude: float
+    longitude: float
+    query: str
+
+
+class ArchiveRun:
+    """
+    Collects one run's listings and scores in memory, to be added to a
+    `ListingArchive` together by `commit`. A listing found by several
+    searches is archived once, under the first. Only the archived columns
+    of each listing are kept, not the listing itself.
+    """
+
+    def __init__(self, archive, timestamp):
+        self.archive = archive
+        self.timestamp = timestamp
+
+        self.listings = {}  # listing id to ArchivedListing
+        self.queries = []
+        self.scores = {}  # (listing id, objective) to value
+        self.changed = 0
+
+    def search(self, listings, query):
+        """
+        Archive the listings of a search as they pass through.
+        """
+
+        query = json.dumps(query, default=str)
+        if query not in self.queries:
+            self.queries.append(query)
+
+        for listing in listings:
+            if listing.id not in self.listings:
+                self.listings[listing.id] = ArchivedListing(
+                    listing.price, listing.location[0], listing.location[1], query
+                )
+                self.changed += self.archive.has_changed(listing)
+
+            yield listing
+
+    def record_scores(self, result):
+        """
+        :param result: An `EvaluationResult`, whose missing scores are skipped
+        """
+
+        for j, objective in enumerate(result.objectives):
+            key = (objective.name, objective_key(objective))
+
+            for listing, value in zip(result.listings, result.score_matrix[:, j]):
+                if not np.isnan(value):
+                    self.scores[(listing.id, key)] = float(value)
+
+    def commit(self):
+        self.archive._commit(self)
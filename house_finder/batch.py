@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import json
+import logging
+from pathlib import Path
+from typing import List, NamedTuple
+
+from .evaluator import NOT_COMPUTED, EvaluationResult, Evaluator
+from .metrics import metrics
+from .objectives import Objective
+from .search import Query
+
+
+logger = logging.getLogger(__name__)
+
+
+class Spec(NamedTuple):
+    name: str
+    query: Query
+    objectives: List[Objective]
+
+    @classmethod
+    def from_config(cls, name, config, maps):
+        objectives = [Objective.from_dict(objective, maps) for objective in config['objectives']]
+
+        if maps.travel_time_backend is not None:
+            maps.travel_time_backend.check_objectives(objectives)
+
+        return cls(name, Query.from_config(config['search']), objectives)
+
+
+def spec_name(file_path):
+    return Path(file_path).stem
+
+
+class BatchEvaluator:
+    """
+    Evaluates many specs together. Listings are fetched for every search and
+    deduplicated, and objectives with the same definition in several specs
+    are treated as one. Each distinct objective is then evaluated in one
+    go over every listing any of its specs still needs, so requests are
+    batched across specs, before the scores are split back out per spec.
+
+    Objectives are evaluated cheapest first, and a listing stops being
+    needed by a spec once it fails one of that spec's objectives, as in
+    `Evaluator`.
+    """
+
+    def __init__(self, specs, workers=1, store=None):
+        self.specs = specs
+        self.workers = workers
+        self.store = store
+
+        self.objectives = OrderedDict()
+        self.objective_keys = {}
+
+        for spec in specs:
+            keys = [self.objective_key(objective) for objective in spec.objectives]
+
+            for key, objective in zip(keys, spec.objectives):
+                self.objectives.setdefault(key, objective)
+
+            self.objective_keys[spec.name] = keys
+
+    def objective_key(self, objective):
+        if objective.definition is None:
+            return id(objective)
+
+        return json.dumps(objective.definition, sort_keys=True, default=str)
+
+    def fetch(self, search):
+        """
+        :param search: A function from a `Query` to an iterable of listings
+        :return: Every distinct listing by id, and the ids found per spec
+        """
+
+        listings = OrderedDict()
+        members = {}
+
+        for spec in self.specs:
+            ids = []
+            for listing in search(spec.query):
+                listings.setdefault(listing.id, listing)
+                ids.append(listing.id)
+            members[spec.name] = list(OrderedDict.fromkeys(ids))
+
+        logger.info(
+            f'Found {len(listings)} distinct listings in '
+            f'{sum(len(ids) for ids in members.values())} search results.'
+        )
+
+        return listings, members
+
+    def __call__(self, search):
+        """
+        :return: An `EvaluationResult` per spec name
+        """
+
+        listings, members = self.fetch(search)
+
+        alive = {name: set(ids) for name, ids in members.items()}
+        scores = {}
+
+        order = sorted(
+            self.objectives.items(),
+            key=lambda item: item[1].estimate_cost(list(listings.values())),
+        )
+
+        for key, objective in order:
+            users = [spec for spec in self.specs if key in self.objective_keys[spec.name]]
+            needed = set().union(*(alive[spec.name] for spec in users))
+            needed_listings = [listing for id, listing in listings.items() if id in needed]
+
+            logger.info(
+                f'Evaluating {objective.name} for {len(needed_listings)} listings '
+                f'across {len(users)} specs.'
+            )
+
+            metrics.count('batch.work_items', len(needed_listings))
+
+            evaluator = Evaluator(needed_listings, [objective], self.workers, self.store)
+
+            for listing, evaluated_listing in zip(needed_listings, evaluator):
+                scores[listing.id, key] = evaluated_listing.scores[objective.name]
+
+            for spec in users:
+                alive[spec.name] = {
+                    id for id in alive[spec.name]
+                    if Evaluator.satisfies(objective, scores[id, key])
+                }
+
+        return OrderedDict(
+            (spec.name, self.split(spec, listings, members[spec.name], scores))
+            for spec in self.specs
+        )
+
+    def split(self, spec, listings, ids, scores):
+        keys = self.objective_keys[spec.name]
+
+        evaluated_listings = [
+            Evaluator.build_evaluated_listing(listings[id], spec.objectives, [
+                scores.get((id, key), NOT_COMPUTED) for key in keys
+            ])
+            for id in ids
+        ]
+
+        return EvaluationResult.from_evaluated_listings(evaluated_listings, spec.objectives)
@@ -1,72 +1,716 @@
-from collections import abc
+import atexit
+from collections import Counter, OrderedDict, abc
+from functools import cached_property
 import json
 import logging
+import math
 from pathlib import Path
+import pickle
 import shelve
+import sqlite3
+import threading
+import time
+import weakref
 
-import requests_cache
+from .metrics import metrics
 
 
 logger = logging.getLogger(__name__)
 
 
-class DictCache(abc.MutableMapping):
+class CacheStatistics:
     """
-    A cache that looks like a dictionary. Uses 'shelve' underneath but allows
-    dict keys.
+    Thread safe hit and miss counters for one kind of cached lookup. Named
+    statistics are also counted in the application wide metrics.
     """
 
-    def __init__(self, filename):
-        self.shelf = shelve.open(filename)
+    def __init__(self, name=None):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self, count=1):
+        with self._lock:
+            self.hits += count
+
+        if self.name:
+            metrics.count(f'cache.{self.name}.hits', count)
+
+    def miss(self, count=1):
+        with self._lock:
+            self.misses += count
+
+        if self.name:
+            metrics.count(f'cache.{self.name}.misses', count)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        return f'{self.hits} hits, {self.misses} misses ({self.hit_ratio:.0%} hit ratio)'
+
+
+class LRUCache:
+    """
+    A thread safe, in-memory least recently used cache, bounded by both the
+    number of entries and their total size in bytes as reported by the
+    caller.
+    """
+
+    def __init__(self, max_entries=10_000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self.entries[key]
+            except KeyError:
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, size):
+        with self._lock:
+            self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        if key in self.entries:
+            _, size = self.entries.pop(key)
+            self.size -= size
+
+
+_MISSING = object()
+
+
+def _flush_on_exit(reference):
+    cache = reference()
+    if cache is not None:
+        cache.flush()
+
+
+def namespace(key):
+    """
+    The kind of entry a key is for, which is the single top level key of a
+    dict key such as {'travel_time': {...}}.
+    """
+
+    if isinstance(key, dict) and len(key) == 1:
+        return next(iter(key))
+    else:
+        return ''
+
+
+class SQLiteDictCache(abc.MutableMapping):
+    """
+    A cache that looks like a dictionary, stored in an indexed SQLite table
+    which is safe to share between processes.
+
+    The database is in WAL mode, so readers never block on a writer, and
+    waits for other processes' locks rather than failing. Writes are held in
+    memory and written in one short transaction every 'batch_size' writes,
+    on 'flush' and when the program exits, so the write lock is never held
+    while waiting on anything else. Recently used entries are kept decoded
+    in an `LRUCache` in front of the database.
+
+    Entries in a namespace with a TTL in 'ttls' are treated as missing once
+    they are older than it. With 'max_bytes' set, `evict` removes the least
+    recently ('lru') or least frequently ('lfu') used entries until the
+    cache fits.
+
+    Hits and misses are recorded per namespace across runs. Reading back a
+    value this cache wrote itself isn't counted as a hit.
+
+    With 'read_only' set the database is opened read only, its schema is
+    never migrated and reads aren't recorded, so inspecting a cache doesn't
+    change it.
+    """
+
+    batch_size = 100
+    busy_timeout = 30  # seconds
+    schema_version = 1
+
+    def __init__(self, filename, batch_size=None, front_cache=None, ttls=None,
+                 max_bytes=None, eviction_policy='lru', clock=time.time, read_only=False):
+        if eviction_policy not in ('lru', 'lfu'):
+            raise ValueError(f'Unknown eviction policy: {eviction_policy}')
+
+        self.read_only = read_only
+
+        if read_only:
+            self.connection = sqlite3.connect(
+                f'file:{filename}?mode=ro', uri=True,
+                timeout=self.busy_timeout, check_same_thread=False,
+            )
+        else:
+            self.connection = sqlite3.connect(
+                filename, timeout=self.busy_timeout, check_same_thread=False
+            )
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.accesses = Counter()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.front_cache = front_cache if front_cache is not None else LRUCache()
+
+        self.ttls = ttls or {}
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+        self.clock = clock
+
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+        if read_only:
+            self._check_schema()
+        else:
+            self._migrate_schema()
+
+        atexit.register(_flush_on_exit, weakref.ref(self))
+
+    def _migrate_schema(self):
+        """
+        Bring the tables up to 'schema_version', tracked in SQLite's
+        user_version. Version 0 only had keys and values.
+        """
+
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+
+            try:
+                version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL)'
+                )
+
+                if version < 1:
+                    self._migrate_to_version_1()
+
+                self.connection.execute(f'PRAGMA user_version = {self.schema_version}')
+            except BaseException:
+                self.connection.rollback()
+                raise
+            else:
+                self.connection.commit()
+
+    def _check_schema(self):
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+
+        if version != self.schema_version:
+            raise ValueError(
+                f'The cache has schema version {version}, not {self.schema_version}, '
+                f'and must be opened writable to migrate it'
+            )
+
+    def _migrate_to_version_1(self):
+        for column in [
+            "namespace TEXT NOT NULL DEFAULT ''",
+            'size INTEGER NOT NULL DEFAULT 0',
+            'created REAL NOT NULL DEFAULT 0',
+            'accessed REAL NOT NULL DEFAULT 0',
+            'hits INTEGER NOT NULL DEFAULT 0',
+        ]:
+            self.connection.execute(f'ALTER TABLE entries ADD COLUMN {column}')
+
+        now = self.clock()
+        rows = self.connection.execute('SELECT key, length(value) FROM entries').fetchall()
+
+        def key_namespace(raw_key):
+            try:
+                return namespace(json.loads(raw_key))
+            except ValueError:
+                return ''
+
+        self.connection.executemany(
+            'UPDATE entries SET namespace = ?, size = ?, created = ?, accessed = ? WHERE key = ?',
+            [(key_namespace(key), size, now, now, key) for key, size in rows],
+        )
+
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace, created)'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS statistics ('
+            'namespace TEXT PRIMARY KEY, '
+            'hits INTEGER NOT NULL DEFAULT 0, '
+            'misses INTEGER NOT NULL DEFAULT 0)'
+        )
 
     def __del__(self):
-        self.shelf.close()
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.flush()
+                self.connection.close()
+                self.connection = None
+
+    @property
+    def pending_writes(self):
+        return len(self.pending) + len(self.accesses)
+
+    def flush(self):
+        with self.lock:
+            if self.read_only:
+                self.accesses.clear()
+                self.hits.clear()
+                self.misses.clear()
+
+            if self.connection is None or not (self.pending_writes or self.hits or self.misses):
+                return
+
+            now = self.clock()
+
+            with metrics.timer('cache.flush'), self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO entries '
+                    '(key, value, namespace, size, created, accessed, hits) '
+                    'VALUES (?, ?, ?, ?, ?, ?, 0)',
+                    [
+                        (key, value, key_namespace, len(value), created, created)
+                        for key, (value, key_namespace, created) in self.pending.items()
+                    ],
+                )
+
+                self.connection.executemany(
+                    'UPDATE entries SET accessed = ?, hits = hits + ? WHERE key = ?',
+                    [(now, count, key) for key, count in self.accesses.items()],
+                )
+
+                self.connection.executemany(
+                    'INSERT INTO statistics (namespace, hits, misses) VALUES (?, ?, ?) '
+                    'ON CONFLICT (namespace) DO UPDATE SET '
+                    'hits = hits + excluded.hits, misses = misses + excluded.misses',
+                    [
+                        (key_namespace, self.hits[key_namespace], self.misses[key_namespace])
+                        for key_namespace in set(self.hits) | set(self.misses)
+                    ],
+                )
+
+            self.pending.clear()
+            self.accesses.clear()
+            self.hits.clear()
+            self.misses.clear()
 
     def _make_key(self, key):
         if isinstance(key, dict):
-            return json.dumps(key, sort_keys=True)
+            return json.dumps(key, sort_keys=True, separators=(',', ':'))
         else:
             return key
 
+    def _encode(self, value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, value):
+        return pickle.loads(value)
+
+    def _expires(self, key_namespace, created):
+        ttl = self.ttls.get(key_namespace)
+        return math.inf if ttl is None else created + ttl
+
+    def _load(self, key):
+        """
+        :return: The raw value for a key, when it expires and whether it was
+                 written by this cache, or None if there isn't one
+        """
+
+        if key in self.pending:
+            value, key_namespace, created = self.pending[key]
+            return value, self._expires(key_namespace, created), True
+
+        row = self.connection.execute(
+            'SELECT value, namespace, created FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        value, key_namespace, created = row
+        return value, self._expires(key_namespace, created), False
+
+    def _get(self, raw_key):
+        """
+        :return: The decoded value for a key and whether it was written by
+                 this cache, or _MISSING
+        """
+
+        entry = self.front_cache.get(raw_key, _MISSING)
+
+        if entry is _MISSING:
+            with metrics.timer('cache.get'), self.lock:
+                loaded = self._load(raw_key)
+
+            if loaded is None:
+                return _MISSING
+
+            raw_value, expires, written = loaded
+            entry = (self._decode(raw_value), expires, written)
+            self.front_cache.put(raw_key, entry, len(raw_value))
+
+        value, expires, written = entry
+
+        if expires <= self.clock():
+            self.front_cache.discard(raw_key)
+            return _MISSING
+
+        return value, written
+
     def __getitem__(self, key):
-        return self.shelf[self._make_key(key)]
+        raw_key = self._make_key(key)
+        key_namespace = namespace(key)
+
+        found = self._get(raw_key)
+
+        with self.lock:
+            if found is _MISSING:
+                self.misses[key_namespace] += 1
+                raise KeyError(key)
+
+            value, written = found
+
+            # reading back a value this cache wrote isn't a hit
+            if not written:
+                self.hits[key_namespace] += 1
+
+            self.accesses[raw_key] += 1
+
+            if self.pending_writes >= self.batch_size:
+                self.flush()
+
+        return value
 
     def __setitem__(self, key, value):
-        self.shelf[self._make_key(key)] = value
-        self.shelf.sync()
+        raw_key = self._make_key(key)
+        raw_value = self._encode(value)
+        key_namespace = namespace(key)
+        created = self.clock()
+
+        with metrics.timer('cache.set'), self.lock:
+            self.pending[raw_key] = (raw_value, key_namespace, created)
+            self.accesses.pop(raw_key, None)
+            self.front_cache.put(
+                raw_key, (value, self._expires(key_namespace, created), True), len(raw_value)
+            )
+
+            if self.pending_writes >= self.batch_size:
+                self.flush()
 
     def __delitem__(self, key):
-        del self.shelf[self._make_key(key)]
+        raw_key = self._make_key(key)
+
+        with self.lock:
+            self.flush()
+            self.front_cache.discard(raw_key)
+
+            with self.connection:
+                cursor = self.connection.execute(
+                    'DELETE FROM entries WHERE key = ?', (raw_key,)
+                )
+
+            if cursor.rowcount == 0:
+                raise KeyError(key)
 
     def __contains__(self, key):
-        return self._make_key(key) in self.shelf
+        return self.contains(key)
+
+    def contains(self, key, record=True):
+        """
+        Whether there is an entry for a key. A missing key counts as a miss
+        unless 'record' is unset, for checks which aren't really lookups.
+        """
+
+        with metrics.timer('cache.contains'):
+            found = self._get(self._make_key(key)) is not _MISSING
+
+        if not found and record:
+            with self.lock:
+                self.misses[namespace(key)] += 1
+
+        return found
 
     def __iter__(self):
-        return iter(self.shelf)
+        with self.lock:
+            self.flush()
+            keys = self.connection.execute('SELECT key FROM entries').fetchall()
+
+        return (key for key, in keys)
 
     def __len__(self):
-        return len(self.shelf)
+        with self.lock:
+            self.flush()
+            return self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def remove_expired(self):
+        """
+        Delete every entry which has outlived its namespace's TTL.
+
+        :return: The number of entries deleted
+        """
+
+        now = self.clock()
+        removed = 0
+
+        with self.lock:
+            self.flush()
+
+            with self.connection:
+                for key_namespace, ttl in self.ttls.items():
+                    if ttl is None:
+                        continue
+
+                    removed += self.connection.execute(
+                        'DELETE FROM entries WHERE namespace = ? AND created <= ?',
+                        (key_namespace, now - ttl),
+                    ).rowcount
+
+            self.front_cache.clear()
+
+        return removed
+
+    def evict(self):
+        """
+        Delete entries, least recently or least frequently used first, until
+        the cache is no bigger than 'max_bytes'.
+
+        :return: The number of entries deleted
+        """
+
+        if self.max_bytes is None:
+            return 0
+
+        if self.eviction_policy == 'lfu':
+            order = 'hits ASC, accessed ASC'
+        else:
+            order = 'accessed ASC'
+
+        with self.lock:
+            self.flush()
+
+            total = self.connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM entries'
+            ).fetchone()[0]
+
+            if total <= self.max_bytes:
+                return 0
+
+            evicted = []
+            for key, size in self.connection.execute(
+                f'SELECT key, size FROM entries ORDER BY {order}'
+            ):
+                if total <= self.max_bytes:
+                    break
+
+                evicted.append((key,))
+                total -= size
+
+            with self.connection:
+                self.connection.executemany('DELETE FROM entries WHERE key = ?', evicted)
+
+            self.front_cache.clear()
+
+        logger.info(f'Evicted {len(evicted)} cache entries')
+        return len(evicted)
+
+    def compact(self):
+        """
+        Remove expired entries, evict down to 'max_bytes' and give the space
+        back to the file system.
+
+        :return: The number of entries removed
+        """
+
+        removed = self.remove_expired() + self.evict()
+
+        with self.lock:
+            self.connection.execute('VACUUM')
+            self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        return removed
+
+    def stats(self):
+        """
+        :return: The entry count, size in bytes, expired entry count and the
+                 hits and misses recorded across runs for each namespace
+        """
+
+        now = self.clock()
+
+        with self.lock:
+            self.flush()
+
+            rows = self.connection.execute(
+                'SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) '
+                'FROM entries GROUP BY namespace'
+            ).fetchall()
+
+            statistics = {
+                key_namespace: (hits, misses)
+                for key_namespace, hits, misses in self.connection.execute(
+                    'SELECT namespace, hits, misses FROM statistics'
+                )
+            }
+
+            expired = {}
+            for key_namespace, ttl in self.ttls.items():
+                if ttl is not None:
+                    expired[key_namespace] = self.connection.execute(
+                        'SELECT COUNT(*) FROM entries WHERE namespace = ? AND created <= ?',
+                        (key_namespace, now - ttl),
+                    ).fetchone()[0]
+
+        results = {}
+
+        for key_namespace, entries, size in rows:
+            hits, misses = statistics.get(key_namespace, (0, 0))
+            results[key_namespace] = {
+                'entries': entries,
+                'bytes': size,
+                'expired': expired.get(key_namespace, 0),
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            }
+
+        for key_namespace, (hits, misses) in statistics.items():
+            results.setdefault(key_namespace, {
+                'entries': 0, 'bytes': 0, 'expired': 0, 'hits': hits, 'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            })
+
+        return results
+
+    def migrate_from_shelve(self, filename):
+        """
+        Copy every entry out of an old 'DictCache' shelve file.
+        """
+
+        shelf = shelve.open(filename, flag='r')
+
+        try:
+            with self.lock:
+                for raw_key in shelf:
+                    try:
+                        key = json.loads(raw_key)
+                    except ValueError:
+                        key = raw_key
+                    else:
+                        if not isinstance(key, dict):
+                            key = raw_key
+
+                    self[key] = shelf[raw_key]
+
+                self.flush()
+
+                return len(shelf)
+        finally:
+            shelf.close()
 
 
 class Cache:
     """
     An application wide cache, it provides a dict cache as a 'data' attribute
-    and a requests session cache as a 'requests_session' attribute.
+    and a requests session cache, created when first used, as a
+    'requests_session' attribute.
     """
 
     expiration = 24 * 60 * 60  # 1 day
 
+    # how long data cache entries are kept for, by namespace, in seconds
+    ttls = {
+        'latitude_longitude': 180 * expiration,
+        'nearby_place_finder': 30 * expiration,
+        'area_places_finder': 30 * expiration,
+        'travel_time': 7 * expiration,
+        'isochrone': 7 * expiration,
+        'evaluation': 7 * expiration,
+    }
+
+    max_bytes = 1024 ** 3  # 1 GiB
+    eviction_policy = 'lru'
+
     def __init__(self, directory: str = 'caches'):
         directory = Path(directory)
+        self.directory = directory
 
         directory.mkdir(parents=True, exist_ok=True)
 
         logger.debug(f'Loading caches from {directory}')
 
-        self.requests_session = requests_cache.CachedSession(
-            cache_name=str(directory / 'requests'),
+        self.data = SQLiteDictCache(
+            str(directory / 'data.sqlite'),
+            ttls=self.ttls,
+            max_bytes=self.max_bytes,
+            eviction_policy=self.eviction_policy,
+        )
+
+        self._migrate_shelve(directory)
+        self.data.evict()
+
+    @classmethod
+    def read_only_data(cls, directory: str = 'caches'):
+        """
+        Open the data cache in 'directory' read only, without migrating or
+        evicting anything, to inspect it.
+        """
+
+        filename = Path(directory) / 'data.sqlite'
+        if not filename.exists():
+            raise FileNotFoundError(f'There is no data cache in {directory}')
+
+        return SQLiteDictCache(str(filename), ttls=cls.ttls, read_only=True)
+
+    @cached_property
+    def requests_session(self):
+        import requests_cache
+
+        return requests_cache.CachedSession(
+            cache_name=str(self.directory / 'requests'),
             backend='sqlite',
             expire_after=self.expiration,
+            wal=True,
         )
 
-        self.data = DictCache(str(directory / 'data.db'))
+    def _migrate_shelve(self, directory):
+        shelve_files = list(directory.glob('data.db*'))
+        if not shelve_files or len(self.data) > 0:
+            return
+
+        logger.info(f'Migrating the data cache from {directory / "data.db"}')
+
+        count = self.data.migrate_from_shelve(str(directory / 'data.db'))
+
+        logger.info(f'Migrated {count} cache entries')
@@ -1,14 +1,22 @@
 from argparse import ArgumentParser
+import datetime
 import logging
+from pathlib import Path
+import sys
 
+import numpy as np
 import yaml
 
+from .archive import ListingArchive
+from .batch import BatchEvaluator, Spec, spec_name
 from .cache import Cache
-from .evaluator import Evaluator
-from .maps import Maps
-from .objectives import Objective
-from .outputs import output_html, output_plot
-from .search import Query, Zoopla
+from .evaluator import EvaluationStore, Evaluator
+from .journal import RunJournal
+from .maps import Maps, backend_from_config
+from .metrics import metrics
+from .outputs import outputs
+from .outputs.filters import NORMALISATIONS, SCALARISATIONS, ScalarisedRankEvaluator, TopK
+from .search import Zoopla
 from .secrets import Secrets
 
 
@@ -18,43 +26,253 @@ logger = logging.getLogger(__name__)
 
 def parse_arguments():
     parser = ArgumentParser()
-    parser.add_argument('--input', '-i', help='input yaml file with search specifications')
+    parser.add_argument('--input', '-i', nargs='+',
+                        help='input yaml files with search specifications, '
+                             'several are evaluated together as a batch')
     parser.add_argument('--secrets', '-s', help='yaml file containing passcodes and keys')
-    parser.add_argument('--output', '-o', help='output file path')
+    parser.add_argument('--output', '-o',
+                        help='output file path, which may contain {name} to be '
+                             'replaced by the name of each input file')
+    parser.add_argument('--format', '-f', choices=outputs.names(),
+                        help='output an html report or a scatter matrix plot, '
+                             'by default chosen from the output file extension')
+    parser.add_argument('--annotate', action='store_true',
+                        help='label the Pareto front with addresses on plots')
+    parser.add_argument('--rank', choices=['pareto', *SCALARISATIONS], default='pareto',
+                        help='rank listings into Pareto fronts, or by the weighted '
+                             'sum or Chebyshev distance of their normalised scores')
+    parser.add_argument('--normalise', choices=NORMALISATIONS, default='minmax',
+                        help='how scores are normalised for the scalarised rankings')
+    parser.add_argument('--top', type=int,
+                        help='only keep the best TOP listings as they are evaluated, '
+                             'with a scalarised ranking')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='number of threads used to evaluate listings')
+    parser.add_argument('--recompute', action='store_true',
+                        help='ignore scores stored by previous runs')
+    parser.add_argument('--resume', action='store_true',
+                        help='carry on from where an interrupted run of the same '
+                             'inputs stopped')
+    parser.add_argument('--profile', action='store_true',
+                        help='log timings and counters at the end of the run')
+    parser.add_argument('--metrics-json', help='file path to write timings and counters to')
+
     args = parser.parse_args()
 
-    return load_yaml(args.input), load_yaml(args.secrets), args.output
+    if len(args.input) > 1 and '{name}' not in args.output:
+        parser.error('--output must contain {name} when there are several inputs')
+
+    if args.top is not None and args.rank == 'pareto':
+        parser.error('--top needs a scalarised --rank, weighted_sum or chebyshev')
+
+    if args.top is not None and args.top < 1:
+        parser.error('--top must be at least 1')
+
+    return args
+
+
+PLOT_EXTENSIONS = ('.png', '.svg', '.pdf')
+
+
+def output_format(args, filename):
+    if args.format:
+        return args.format
+    elif filename.lower().endswith(PLOT_EXTENSIONS):
+        return 'plot'
+    else:
+        return 'html'
 
 
 def load_yaml(file_path):
     with open(file_path) as file:
-        return yaml.load(file)
+        return yaml.safe_load(file)
+
+
+def output(args, secrets, result, objectives, name, statistics=None):
+    valid_evaluated_listings = result[result.is_valid & result.satisfies_constraints]
+
+    logger.info(f'{len(valid_evaluated_listings)} listings satisfy the constraints.')
+
+    filename = args.output.format(name=name)
+
+    output_function = outputs.load(output_format(args, filename))
+
+    with metrics.timer('stage.output'):
+        if args.rank == 'pareto':
+            ranked = None
+        else:
+            ranked = ScalarisedRankEvaluator(
+                valid_evaluated_listings, args.rank, args.normalise, statistics
+            )
+
+        output_function(
+            valid_evaluated_listings, objectives, filename,
+            secrets=secrets, annotate=args.annotate, ranked=ranked,
+        )
+
+
+def cache_main(argv):
+    parser = ArgumentParser(prog='house_finder cache')
+    parser.add_argument('command', choices=['stats', 'compact'])
+    parser.add_argument('--directory', '-d', default='caches',
+                        help='directory the caches are stored in')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compact':
+        data = Cache(args.directory).data
+        removed = data.compact()
+        logger.info(f'Removed {removed} expired or evicted entries')
+    else:
+        try:
+            data = Cache.read_only_data(args.directory)
+        except FileNotFoundError as e:
+            parser.error(str(e))
+
+    print(f'{"namespace":<24} {"entries":>10} {"bytes":>12} {"expired":>10} {"hit ratio":>10}')
+
+    for name, stats in sorted(data.stats().items()):
+        print(
+            f'{name or "(none)":<24} {stats["entries"]:>10} {stats["bytes"]:>12} '
+            f'{stats["expired"]:>10} {stats["hit_ratio"]:>10.0%}'
+        )
+
+    data.close()
+
+
+def archive_main(argv):
+    parser = ArgumentParser(prog='house_finder archive')
+    parser.add_argument('command', choices=['price-drops', 'time-on-market'])
+    parser.add_argument('--directory', '-d', default='caches',
+                        help='directory the caches are stored in')
+    parser.add_argument('--days', type=int, default=30,
+                        help='how far back to look for price drops')
+    parser.add_argument('--limit', type=int, default=20, help='number of listings to show')
+    args = parser.parse_args(argv)
+
+    archive = ListingArchive(Path(args.directory) / 'archive')
+
+    if args.command == 'price-drops':
+        drops = archive.price_drops(args.days)
+        order = np.argsort(drops['new_price'] - drops['old_price'], kind='stable')[:args.limit]
+
+        print(f'{"listing":<12} {"date":<12} {"old price":>10} {"new price":>10}')
+
+        for i in order:
+            date = datetime.date.fromtimestamp(drops['timestamp'][i])
+            print(
+                f'{drops["listing_id"][i]:<12} {date.isoformat():<12} '
+                f'{drops["old_price"][i]:>10.0f} {drops["new_price"][i]:>10.0f}'
+            )
+    else:
+        listings = archive.time_on_market()
+        order = np.argsort(-listings['days'], kind='stable')[:args.limit]
+
+        print(f'{"listing":<12} {"first listed":<12} {"days":>8} {"status":>10}')
+
+        for i in order:
+            date = datetime.date.fromtimestamp(listings['first_listed'][i])
+            print(
+                f'{listings["listing_id"][i]:<12} {date.isoformat():<12} '
+                f'{listings["days"][i]:>8.0f} '
+                f'{"listed" if listings["on_market"][i] else "removed":>10}'
+            )
 
 
 def main():
-    input_config, secrets_config, output = parse_arguments()
+    if sys.argv[1:2] == ['cache']:
+        return cache_main(sys.argv[2:])
+
+    if sys.argv[1:2] == ['archive']:
+        return archive_main(sys.argv[2:])
+
+    args = parse_arguments()
+    input_configs = [load_yaml(file_path) for file_path in args.input]
 
-    secrets = Secrets.from_config(secrets_config)
+    routing_configs = [input_config.get('routing') for input_config in input_configs]
+    if any(config != routing_configs[0] for config in routing_configs):
+        raise ValueError('Every input in a batch must use the same routing')
+
+    secrets = Secrets.from_config(load_yaml(args.secrets))
     cache = Cache()
-    maps = Maps(secrets['google'], cache)
+    maps = Maps(
+        secrets['google'], cache,
+        travel_time_backend=backend_from_config(routing_configs[0]),
+    )
     zoopla = Zoopla(secrets['zoopla'], cache)
 
-    query = Query.from_config(input_config['search'])
+    with metrics.timer('stage.objectives'):
+        specs = [
+            Spec.from_config(spec_name(file_path), input_config, maps)
+            for file_path, input_config in zip(args.input, input_configs)
+        ]
+
+    journal = RunJournal.for_run(cache.directory, input_configs, resume=args.resume)
+
+    store = EvaluationStore(cache, recompute=args.recompute, routing=maps.routing_key)
+    journal_store = journal.store(store)
+
+    archive_run = ListingArchive(cache.directory / 'archive').run()
+
+    def search(query):
+        return archive_run.search(journal.search(zoopla.search, query), query)
+
+    if args.top is None:
+        collectors = {}
+    else:
+        collectors = {
+            spec.name: TopK(spec.objectives, args.top, args.rank, args.normalise)
+            for spec in specs
+        }
+
+    journal.set_stage('search_and_evaluate')
+
+    with metrics.timer('stage.search_and_evaluate'):
+        if len(specs) == 1:
+            evaluated_listings = Evaluator(
+                search(specs[0].query), specs[0].objectives, args.workers, journal_store,
+                collectors.get(specs[0].name),
+            )
+            results = {specs[0].name: evaluated_listings.result}
+        else:
+            results = BatchEvaluator(specs, args.workers, journal_store)(search)
+
+            for name, collector in collectors.items():
+                collector.extend(results[name])
+
+    for name, collector in collectors.items():
+        logger.info(f'Kept the best {len(collector)} of {collector.seen} listings.')
+        results[name] = collector.result
+
+    if not collectors:
+        for name, result in results.items():
+            logger.info(f'Found {len(result)} listings.')
+
+    for result in results.values():
+        archive_run.record_scores(result)
+    archive_run.commit()
 
-    objectives = [
-        Objective.from_dict(config, maps) for config in input_config['objectives']
-    ]
+    logger.info(f'{archive_run.changed} listings are new or changed since the last run.')
 
-    listings = zoopla.search(query)
+    logger.info(
+        f'Resumed {journal_store.resumed} journalled scores, '
+        f'reused {store.statistics.hits} stored scores and '
+        f'recomputed {store.statistics.misses}.'
+    )
+    logger.info(f'Travel time cache: {maps.travel_time_statistics}')
 
-    logger.info(f'Found {len(listings)} listings.')
+    journal.set_stage('output')
 
-    evaluated_listings = Evaluator(listings, objectives)
+    for spec in specs:
+        collector = collectors.get(spec.name)
+        output(
+            args, secrets, results[spec.name], spec.objectives, spec.name,
+            collector.statistics if collector else None,
+        )
 
-    valid_evaluated_listings = [
-        e for e in evaluated_listings if e.is_valid and e.satisfies_constaints
-    ]
+    journal.finish()
 
-    logger.info(f'{len(listings)} listings satisfy the constraints.')
+    if args.profile:
+        metrics.log_summary()
 
-    output_html(secrets, valid_evaluated_listings, objectives, output)
+    if args.metrics_json:
+        metrics.dump_json(args.metrics_json)
@@ -1,10 +1,17 @@
-from collections import OrderedDict, UserList
+from collections import OrderedDict, UserList, abc
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+import hashlib
+import itertools
+import json
 import logging
 from typing import Callable, Dict, NamedTuple, Optional
 
-from cached_property import cached_property
+import numpy as np
 import progressbar
 
+from .cache import CacheStatistics
+from .metrics import metrics
 from .objectives import Objective
 from .search import Listing
 
@@ -12,6 +19,28 @@ from .search import Listing
 logger = logging.getLogger(__name__)
 
 
+class NotComputed:
+    """
+    Marks a score which was skipped because the listing had already failed
+    another objective's constraint.
+    """
+
+    def __bool__(self):
+        return False
+
+    def __str__(self):
+        return 'not computed'
+
+    def __repr__(self):
+        return 'NOT_COMPUTED'
+
+    def __reduce__(self):
+        return 'NOT_COMPUTED'
+
+
+NOT_COMPUTED = NotComputed()
+
+
 class Score(NamedTuple):
     value: int
     presented_value: str
@@ -38,25 +67,328 @@ class EvaluatedListing(NamedTuple):
         return all(f(self.scores[obj].value) for obj, f in self.constraints.items())
 
 
+class EvaluationStore:
+    """
+    Remembers scores between runs. Scores are keyed on the listing's id and
+    contents, on the objective's definition and on where travel times come
+    from, 'routing', so only new or changed listings, or changed objectives
+    or routing, are evaluated again. Objectives without a definition, i.e.
+    not loaded from a config, are never stored.
+    """
+
+    def __init__(self, cache, recompute=False, routing='google'):
+        self.cache = cache
+        self.recompute = recompute
+        self.routing = routing
+        self.statistics = CacheStatistics('evaluation')
+
+    def _hash(self, value):
+        return hashlib.sha1(
+            json.dumps(value, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def _make_key(self, listing, objective):
+        return {
+            'evaluation': {
+                'listing_id': listing.id,
+                'listing_hash': self._hash(list(listing)),
+                'objective_hash': self._hash(objective.definition),
+                'routing_hash': self._hash(self.routing),
+            }
+        }
+
+    def get(self, listing, objective):
+        if objective.definition is None:
+            return None
+
+        key = self._make_key(listing, objective)
+
+        if not self.recompute and key in self.cache.data:
+            self.statistics.hit()
+            return self.cache.data[key]
+
+        self.statistics.miss()
+        return None
+
+    def put(self, listing, objective, score):
+        if objective.definition is not None:
+            self.cache.data[self._make_key(listing, objective)] = score
+
+
+def object_array(items):
+    array = np.empty(len(items), dtype=object)
+    array[:] = items
+    return array
+
+
+class EvaluationResult(abc.Sequence):
+    """
+    Evaluated listings stored column-wise. Scores are a (listings, objectives)
+    float64 matrix with NaN for missing scores, and the listings, presented
+    scores and a mask of which scores were computed at all sit alongside it
+    as parallel arrays.
+
+    Indexing with an integer gives an `EvaluatedListing` view for templates,
+    indexing with a boolean mask or index array gives a new result.
+    """
+
+    def __init__(self, listings, objectives, score_matrix, presented_scores, computed=None):
+        self.listings = listings
+        self.objectives = objectives
+        self.score_matrix = score_matrix
+        self.presented_scores = presented_scores
+
+        if computed is None:
+            computed = np.ones(score_matrix.shape, dtype=bool)
+        self.computed = computed
+
+        self.objective_names = [objective.name for objective in objectives]
+        self.maxima = np.array([
+            objective.maximum if objective.maximum else np.inf
+            for objective in objectives
+        ], dtype=float)
+
+    @classmethod
+    def from_evaluated_listings(cls, evaluated_listings, objectives):
+        evaluated_listings = list(evaluated_listings)
+        names = [objective.name for objective in objectives]
+
+        score_matrix = np.full((len(evaluated_listings), len(names)), np.nan)
+        presented_scores = np.full(score_matrix.shape, None, dtype=object)
+        computed = np.ones(score_matrix.shape, dtype=bool)
+
+        for i, evaluated_listing in enumerate(evaluated_listings):
+            for j, name in enumerate(names):
+                score = evaluated_listing.scores[name]
+                if score is NOT_COMPUTED:
+                    computed[i, j] = False
+                elif score is not None:
+                    score_matrix[i, j] = score.value
+                    presented_scores[i, j] = score.presented_value
+
+        listings = object_array([e.listing for e in evaluated_listings])
+
+        return cls(listings, objectives, score_matrix, presented_scores, computed)
+
+    @classmethod
+    def concatenate(cls, results, objectives):
+        results = list(results)
+        n_objectives = len(objectives)
+
+        return cls(
+            object_array([listing for result in results for listing in result.listings]),
+            objectives,
+            np.concatenate([np.empty((0, n_objectives))] + [r.score_matrix for r in results]),
+            np.concatenate([np.empty((0, n_objectives), dtype=object)] + [r.presented_scores for r in results]),
+            np.concatenate([np.empty((0, n_objectives), dtype=bool)] + [r.computed for r in results]),
+        )
+
+    @cached_property
+    def locations(self):
+        return np.array(
+            [listing.location for listing in self.listings], dtype=float
+        ).reshape(-1, 2)
+
+    @property
+    def missing(self):
+        return np.isnan(self.score_matrix)
+
+    @property
+    def is_valid(self):
+        return ~self.missing.any(axis=1)
+
+    @property
+    def satisfies_constraints(self):
+        return np.all(self.score_matrix < self.maxima, axis=1)
+
+    @property
+    def total_scores(self):
+        return self.score_matrix.sum(axis=1)
+
+    def column(self, name):
+        return self.score_matrix[:, self.objective_names.index(name)]
+
+    def __len__(self):
+        return len(self.listings)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self._view(index)
+
+        return self.__class__(
+            self.listings[index], self.objectives,
+            self.score_matrix[index], self.presented_scores[index],
+            self.computed[index],
+        )
+
+    def _view(self, i):
+        scores = OrderedDict()
+
+        for j, name in enumerate(self.objective_names):
+            if not self.computed[i, j]:
+                scores[name] = NOT_COMPUTED
+            elif np.isnan(self.score_matrix[i, j]):
+                scores[name] = None
+            else:
+                scores[name] = Score(self.score_matrix[i, j], self.presented_scores[i, j])
+
+        constraints = {
+            objective.name: objective.constraint_function
+            for objective in self.objectives
+        }
+
+        return EvaluatedListing(self.listings[i], scores, constraints)
+
+
 class Evaluator(UserList):
+    """
+    Scores every listing against every objective. Listings can be any
+    iterable, including a generator which is still loading, and are evaluated
+    in chunks as they arrive. Each (listing, objective) pair is calculated on
+    a thread pool, but the results are always in the same order as the
+    listings.
 
-    def __init__(self, listings, objectives):
-        self.data = [
-            self.evaluate_listing(listing, objectives)
-            for listing in progressbar.progressbar(listings)
-        ]
+    Given an `EvaluationStore`, scores from previous runs are reused and
+    only the missing ones are prefetched and calculated.
+
+    Objectives are evaluated cheapest first and a listing is dropped from
+    the rest of the chunk's work as soon as it has no score for an objective
+    or fails its constraint. Skipped scores are `NOT_COMPUTED`.
+
+    Given a 'collector', such as a `TopK`, each evaluated chunk is passed to
+    its `extend` instead of being kept.
+    """
+
+    chunk_size = 100
+
+    def __init__(self, listings, objectives, workers=1, store=None, collector=None):
+        try:
+            max_value = len(listings)
+        except TypeError:
+            max_value = progressbar.UnknownLength
+
+        self.objectives = objectives
+        self.store = store
+        self.data = []
+
+        if collector is None:
+            collector = self.data
+
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                progressbar.ProgressBar(max_value=max_value) as bar:
+            for chunk in self.chunks(listings):
+                collector.extend(self.evaluate_chunk(executor, bar, chunk, objectives))
+
+    @cached_property
+    def result(self):
+        return EvaluationResult.from_evaluated_listings(self.data, self.objectives)
+
+    def chunks(self, listings):
+        iterator = iter(listings)
+
+        while True:
+            chunk = list(itertools.islice(iterator, self.chunk_size))
+            if not chunk:
+                break
+
+            yield chunk
+
+    def evaluate_chunk(self, executor, bar, listings, objectives):
+        scores = [[NOT_COMPUTED] * len(objectives) for _ in listings]
+        remaining = list(range(len(listings)))
+
+        for j, objective in self.order_by_cost(listings, objectives):
+            remaining_before = len(remaining)
+
+            stored_scores = {
+                i: self.stored_score(listings[i], objective) for i in remaining
+            }
+
+            pending = [i for i in remaining if stored_scores[i] is None]
+
+            if objective.supports_calculate_many:
+                calculated = self.evaluate_scores(
+                    [listings[i] for i in pending], objective
+                )
+                calculated = dict(zip(pending, calculated))
+            else:
+                with metrics.timer('evaluator.prefetch'):
+                    objective.prefetch([listings[i] for i in pending], executor)
+
+                futures = {
+                    i: executor.submit(self.evaluate_score, listings[i], objective)
+                    for i in pending
+                }
+                calculated = {i: future.result() for i, future in futures.items()}
+
+            for i in remaining:
+                scores[i][j] = calculated[i] if i in calculated else stored_scores[i]
+
+            remaining = [i for i in remaining if self.satisfies(objective, scores[i][j])]
+
+            metrics.count('evaluator.rejected', remaining_before - len(remaining))
+
+        for listing, row in zip(listings, scores):
+            bar.increment()
+            yield self.build_evaluated_listing(listing, objectives, row)
+
+    def order_by_cost(self, listings, objectives):
+        return sorted(
+            enumerate(objectives),
+            key=lambda item: item[1].estimate_cost(listings),
+        )
+
+    @staticmethod
+    def satisfies(objective, score):
+        return score is not None and objective.constraint_function(score.value)
 
     def evaluate_listing(self, listing, objectives):
         logger.debug(f'Evaluating {listing.address}')
 
-        scores = OrderedDict()
+        scores = [self.evaluate_score(listing, objective) for objective in objectives]
+
+        return self.build_evaluated_listing(listing, objectives, scores)
+
+    def stored_score(self, listing, objective):
+        if self.store is None:
+            return None
+
+        return self.store.get(listing, objective)
 
-        for objective in objectives:
+    def evaluate_score(self, listing, objective):
+        with metrics.timer('evaluator.calculate'):
             value = objective.calculate(listing)
-            if value is None:
-                scores[objective.name] = None
-            else:
-                scores[objective.name] = Score(value, objective.present(value))
+
+        return self.build_score(listing, objective, value)
+
+    def evaluate_scores(self, listings, objective):
+        if not listings:
+            return []
+
+        with metrics.timer('evaluator.calculate_many'):
+            values = objective.calculate_many(listings)
+
+        return [
+            self.build_score(listing, objective, value)
+            for listing, value in zip(listings, values)
+        ]
+
+    def build_score(self, listing, objective, value):
+        if value is None:
+            return None
+
+        score = Score(value, objective.present(value))
+
+        if self.store is not None:
+            self.store.put(listing, objective, score)
+
+        return score
+
+    @staticmethod
+    def build_evaluated_listing(listing, objectives, scores):
+        scores = OrderedDict(
+            (objective.name, score) for objective, score in zip(objectives, scores)
+        )
 
         constraints = {
             objective.name: objective.constraint_function
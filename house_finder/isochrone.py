@@ -0,0 +1,190 @@
+import logging
+import math
+
+import numpy as np
+
+from .maps import METRES_PER_DEGREE, NoTravelTimeError
+
+
+logger = logging.getLogger(__name__)
+
+
+# an upper bound on the average speed of each mode in metres per second,
+# used to decide how far out to sample
+MAXIMUM_SPEEDS = {
+    'walking': 2.0,
+    'bicycling': 7.0,
+    'driving': 30.0,
+    'transit': 25.0,
+}
+
+
+class Isochrone:
+    """
+    A polygon around everywhere reachable within some travel time. Vertices
+    are (latitude, longitude) pairs.
+    """
+
+    def __init__(self, polygon):
+        self.polygon = np.asarray(polygon, dtype=float).reshape(-1, 2)
+
+    def _project(self, locations):
+        """
+        Project locations into metres on a plane around the polygon.
+        """
+
+        origin = self.polygon.mean(axis=0)
+        scale = math.cos(math.radians(origin[0]))
+
+        return np.column_stack([
+            (locations[:, 1] - origin[1]) * scale * METRES_PER_DEGREE,
+            (locations[:, 0] - origin[0]) * METRES_PER_DEGREE,
+        ])
+
+    def contains(self, locations, margin=0):
+        """
+        :param locations: A sequence of (latitude, longitude) pairs
+        :param margin: Also include locations within this many metres of the
+                       boundary
+        :return: A boolean array, True for each location inside the polygon
+        """
+
+        locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            return np.ones(len(locations), dtype=bool)
+
+        points = self._project(locations)
+        vertices = self._project(self.polygon)
+
+        x, y = points[:, 0, np.newaxis], points[:, 1, np.newaxis]
+        x1, y1 = vertices[:, 0], vertices[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+        # ray casting, counting the edges crossed by a ray to the right
+        straddles = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside = np.sum(straddles & (x < crossing), axis=1) % 2 == 1
+
+        if margin:
+            dx, dy = x2 - x1, y2 - y1
+            lengths = np.maximum(dx ** 2 + dy ** 2, 1e-12)
+            t = np.clip(((x - x1) * dx + (y - y1) * dy) / lengths, 0, 1)
+            distances = np.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+            inside |= distances.min(axis=1) <= margin
+
+        return inside
+
+
+def offset(location, bearing, metres):
+    """
+    The location 'metres' away from another along a bearing in radians.
+    """
+
+    latitude, longitude = location
+    scale = max(math.cos(math.radians(latitude)), 0.01)
+
+    return (
+        latitude + math.cos(bearing) * metres / METRES_PER_DEGREE,
+        longitude + math.sin(bearing) * metres / METRES_PER_DEGREE / scale,
+    )
+
+
+def star_polygon(location, radii):
+    """
+    A polygon with one vertex per radius, at evenly spaced bearings.
+    """
+
+    return [
+        offset(location, 2 * math.pi * i / len(radii), radius)
+        for i, radius in enumerate(radii)
+    ]
+
+
+class IsochroneFinder:
+    """
+    Finds the area reachable to or from a location within a travel time. The
+    travel time backend is asked directly if it supports isochrones,
+    otherwise a grid of points along evenly spaced bearings is routed in one
+    batch and each bearing is cut off at the first ring beyond the furthest
+    reachable point, so the polygon errs on the side of being too large.
+    """
+
+    bearings = 16
+    rings = 8
+
+    def __init__(self, maps, cache):
+        self.maps = maps
+        self.cache = cache
+
+    def __call__(self, location, mode, maximum, arrival_time=None, departure_time=None, reverse=False):
+        """
+        :return: An `Isochrone`, or None if one could not be found
+        """
+
+        cache_key = {
+            'isochrone': {
+                'location': location, 'mode': mode, 'maximum': maximum,
+                'arrival_time': arrival_time, 'departure_time': departure_time,
+                'reverse': reverse, 'routing': self.maps.routing_key,
+            }
+        }
+
+        if cache_key in self.cache.data:
+            return Isochrone(self.cache.data[cache_key])
+
+        backend = self.maps.travel_time_backend
+
+        try:
+            if backend is not None and hasattr(backend, 'isochrone'):
+                polygon = backend.isochrone(
+                    location, mode, maximum, arrival_time, departure_time, reverse
+                )
+            else:
+                polygon = self._sample(
+                    location, mode, maximum, arrival_time, departure_time, reverse
+                )
+        except NoTravelTimeError:
+            polygon = None
+
+        if polygon is None:
+            logger.warning(f'Could not find an isochrone around {location}')
+            return None
+
+        logger.debug(f'Found a {len(polygon)} sided isochrone around {location}')
+
+        self.cache.data[cache_key] = polygon
+        return Isochrone(polygon)
+
+    def _sample(self, location, mode, maximum, arrival_time, departure_time, reverse):
+        furthest = maximum * MAXIMUM_SPEEDS.get(mode, MAXIMUM_SPEEDS['driving'])
+        distances = [furthest * (ring + 1) / self.rings for ring in range(self.rings)]
+
+        points = [
+            offset(location, 2 * math.pi * bearing / self.bearings, metres)
+            for bearing in range(self.bearings)
+            for metres in distances
+        ]
+
+        times = self.maps.calculate_one_to_many_travel_times(
+            location, points, mode, arrival_time, departure_time, reverse=reverse
+        )
+
+        # nothing reachable at all is more likely a failed request than an
+        # island, so don't rule anything out
+        if all(time is None for time in times):
+            return None
+
+        radii = []
+
+        for bearing in range(self.bearings):
+            row = times[bearing * self.rings:(bearing + 1) * self.rings]
+            reachable = [
+                ring for ring, time in enumerate(row)
+                if time is not None and time <= maximum
+            ]
+
+            last = reachable[-1] if reachable else -1
+            radii.append(distances[min(last + 1, self.rings - 1)])
+
+        return star_polygon(location, radii)
@@ -0,0 +1,252 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import pickle
+import threading
+import weakref
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_key(input_configs):
+    """
+    Identifies a run by its inputs, so only a run of the same inputs is
+    resumed.
+    """
+
+    return hashlib.sha1(
+        json.dumps(input_configs, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def objective_key(objective):
+    if objective.definition is None:
+        return objective.name
+
+    return json.dumps(objective.definition, sort_keys=True, default=str)
+
+
+def _flush_on_exit(reference):
+    journal = reference()
+    if journal is not None:
+        journal.flush()
+
+
+class RunJournal:
+    """
+    An append only log of a run's progress: the current stage, the listings
+    each search found and every score calculated. Records are pickled one
+    after another and synced to disk in batches, and a record cut short by a
+    crash is ignored when the journal is read back.
+
+    When resuming, the previous journal is read into memory and rewritten,
+    so finished searches aren't repeated and finished scores are answered
+    from memory. Failed scores aren't journalled, so they are tried again.
+    The rewritten journal only replaces the previous one once it's complete,
+    so being interrupted again while rewriting loses nothing.
+    """
+
+    batch_size = 100
+
+    def __init__(self, filename, key, resume=False):
+        self.filename = Path(filename)
+        self.key = key
+
+        self.stage = None
+        self.listings = {}
+        self.searched = set()
+        self.scores = {}
+
+        if resume:
+            self._load()
+
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.filename.with_name(f'{self.filename.name}.tmp')
+        self.file = open(temporary, 'wb')
+        self.lock = threading.RLock()
+        self.pending = []
+
+        self._write(('run', self.key))
+        if self.stage is not None:
+            self._write(('stage', self.stage))
+        for query, listings in self.listings.items():
+            self._write(('listings', query, listings))
+        for query in self.searched:
+            self._write(('searched', query))
+        if self.scores:
+            self._write(('scores', list(self.scores.items())))
+        self.flush()
+
+        # the journal is appended to from here on through the same file
+        os.replace(temporary, self.filename)
+
+        atexit.register(_flush_on_exit, weakref.ref(self))
+
+    @classmethod
+    def for_run(cls, directory, input_configs, resume=False):
+        key = run_key(input_configs)
+        return cls(Path(directory) / 'journals' / f'{key}.journal', key, resume)
+
+    def _records(self):
+        with open(self.filename, 'rb') as file:
+            while True:
+                try:
+                    yield pickle.load(file)
+                except EOFError:
+                    return
+                except (pickle.UnpicklingError, ValueError, AttributeError, ImportError):
+                    logger.warning(f'Ignoring a damaged record at the end of {self.filename}')
+                    return
+
+    def _load(self):
+        if not self.filename.exists():
+            logger.info('There is no journal to resume from, starting a new run')
+            return
+
+        records = self._records()
+
+        if next(records, None) != ('run', self.key):
+            logger.warning('The journal is for different inputs, starting a new run')
+            return
+
+        for record in records:
+            kind = record[0]
+
+            if kind == 'stage':
+                self.stage = record[1]
+            elif kind == 'listings':
+                self.listings.setdefault(record[1], []).extend(record[2])
+            elif kind == 'searched':
+                self.searched.add(record[1])
+            elif kind == 'scores':
+                self.scores.update(record[1])
+
+        # a search which didn't finish is started again
+        self.listings = {
+            query: listings for query, listings in self.listings.items()
+            if query in self.searched
+        }
+
+        logger.info(
+            f'Resuming from the {self.stage} stage with '
+            f'{sum(len(listings) for listings in self.listings.values())} listings '
+            f'and {len(self.scores)} scores'
+        )
+
+    def _write(self, record):
+        pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def flush(self):
+        with self.lock:
+            if self.file.closed:
+                return
+
+            if self.pending:
+                self._write(('scores', self.pending))
+                self.pending = []
+
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def set_stage(self, stage):
+        with self.lock:
+            self.stage = stage
+            self._write(('stage', stage))
+            self.flush()
+
+    def search(self, search, query):
+        """
+        The listings for a query, replayed from the journal if the search
+        finished before, otherwise searched for again and journalled.
+        """
+
+        if query in self.searched:
+            logger.info(f'Reusing {len(self.listings[query])} journalled listings')
+            yield from self.listings[query]
+            return
+
+        chunk = []
+
+        for listing in search(query):
+            chunk.append(listing)
+
+            if len(chunk) >= self.batch_size:
+                self._record_listings(query, chunk)
+                chunk = []
+
+            yield listing
+
+        self._record_listings(query, chunk)
+
+        with self.lock:
+            self.searched.add(query)
+            self._write(('searched', query))
+            self.flush()
+
+    def _record_listings(self, query, listings):
+        if not listings:
+            return
+
+        with self.lock:
+            self.listings.setdefault(query, []).extend(listings)
+            self._write(('listings', query, listings))
+            self.flush()
+
+    def store(self, inner=None):
+        return JournalStore(self, inner)
+
+    def record_score(self, listing, objective, score):
+        with self.lock:
+            key = (listing.id, objective_key(objective))
+            self.scores[key] = score
+            self.pending.append((key, score))
+
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def finish(self):
+        """
+        Close and delete the journal once the run has completed.
+        """
+
+        with self.lock:
+            self.file.close()
+            self.filename.unlink()
+
+
+class JournalStore:
+    """
+    An `EvaluationStore` which answers from the journal first and journals
+    every new score, passing everything else on to 'inner' if given.
+    """
+
+    def __init__(self, journal, inner=None):
+        self.journal = journal
+        self.inner = inner
+        self.resumed = 0
+
+    def get(self, listing, objective):
+        score = self.journal.scores.get((listing.id, objective_key(objective)))
+
+        if score is not None:
+            self.resumed += 1
+            return score
+
+        if self.inner is None:
+            return None
+
+        score = self.inner.get(listing, objective)
+        if score is not None:
+            self.journal.record_score(listing, objective, score)
+
+        return score
+
+    def put(self, listing, objective, score):
+        self.journal.record_score(listing, objective, score)
+
+        if self.inner is not None:
+            self.inner.put(listing, objective, score)
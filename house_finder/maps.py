@@ -1,29 +1,90 @@
+from collections import defaultdict
 import datetime
 import json
 import logging
+import math
+import threading
+import time
 
 import googlemaps
 
+from .cache import CacheStatistics
+from .metrics import metrics
+from .plugins import Registry
+from .secrets import KeyPool, KeysExhaustedError
+
 
 logger = logging.getLogger(__name__)
 
 
+METRES_PER_DEGREE = 111_320
+
+
 class NoTravelTimeError(Exception):
     pass
 
 
+def quantise_location(location, radius):
+    """
+    Snap a (latitude, longitude) pair to the centre of a grid cell roughly
+    'radius' metres across, so nearby locations share the same cache keys.
+    """
+
+    latitude, longitude = location
+
+    latitude_step = radius / METRES_PER_DEGREE
+    latitude = round(latitude / latitude_step) * latitude_step
+
+    longitude_step = latitude_step / max(math.cos(math.radians(latitude)), 0.01)
+    longitude = round(longitude / longitude_step) * longitude_step
+
+    return round(latitude, 6), round(longitude, 6)
+
+
 class TravelTimeCalulator:
+    """
+    Calculates one travel time at a time using the Directions API. Requests
+    which a `TravelTimeMatrixCalculator` batch has already counted in
+    'statistics' aren't counted again the next time they're looked up.
+    """
 
-    def __init__(self, maps, cache):
+    def __init__(self, maps, cache, statistics):
         self.maps = maps
         self.cache = cache
+        self.statistics = statistics
+
+        self.counted = set()
+        self._counted_lock = threading.Lock()
+
+    @staticmethod
+    def cell(kwargs):
+        return json.dumps(kwargs, sort_keys=True, default=str)
+
+    def mark_counted(self, cells):
+        with self._counted_lock:
+            self.counted.update(cells)
+
+    def _take_counted(self, cell):
+        with self._counted_lock:
+            if cell in self.counted:
+                self.counted.remove(cell)
+                return True
+
+        return False
 
     def __call__(self, **kwargs):
         cache_key = {'travel_time': kwargs}
+        counted = self._take_counted(self.cell(kwargs))
 
         if cache_key in self.cache.data:
+            if not counted:
+                self.statistics.hit()
+
             return self.cache.data[cache_key]
 
+        if not counted:
+            self.statistics.miss()
+
         params = self._create_search_params(**kwargs)
 
         try:
@@ -35,6 +96,10 @@ class TravelTimeCalulator:
 
         return duration
 
+    def is_cached(self, **kwargs):
+        # only a probe, so it isn't counted as a miss
+        return self.cache.data.contains({'travel_time': kwargs}, record=False)
+
     def _format_time(self, string):
         hour, minute = [int(x) for x in string.split(':')]
         return int(
@@ -45,7 +110,7 @@ class TravelTimeCalulator:
 
     def calculate_time(self, params):
         return self._extract_duration(
-            self.maps.query(lambda gmaps: gmaps.directions(**params))
+            self.maps.query(lambda gmaps: gmaps.directions(**params), 'directions')
         )
 
     def _extract_duration(self, results):
@@ -73,20 +138,212 @@ class TravelTimeCalulator:
         return params
 
 
+class TravelTimeMatrixCalculator:
+    """
+    Calculates many travel times at once using the Distance Matrix API. Each
+    cell of the matrix is written back to the cache under the same key that
+    `TravelTimeCalulator` uses, so later single lookups are cache hits.
+
+    Requests which are already cached, or which share a cell with another
+    request in the same batch, count as hits in 'statistics'. Cells requested
+    from Google count as misses. Either way they aren't counted again when
+    they're then looked up with `TravelTimeCalulator`.
+    """
+
+    max_dimension = 25  # origins or destinations per request
+    max_elements = 100  # origins times destinations per request
+
+    def __init__(self, maps, cache, statistics):
+        self.maps = maps
+        self.cache = cache
+        self.statistics = statistics
+
+    def __call__(self, requests):
+        """
+        Takes an iterable of keyword argument dicts, as would be passed to
+        `TravelTimeCalulator`, and fills the cache for any that are missing.
+        """
+
+        self.maps.calculate_travel_time.mark_counted(self._calculate(requests))
+
+    def _calculate(self, requests):
+        """
+        :return: The cells of every request, which have all been counted
+        """
+
+        groups = defaultdict(list)
+        seen = set()
+
+        for kwargs in requests:
+            cache_key = {'travel_time': kwargs}
+            cell = self.maps.calculate_travel_time.cell(kwargs)
+
+            if cell in seen:
+                self.statistics.hit()
+                continue
+
+            seen.add(cell)
+
+            if cache_key in self.cache.data:
+                self.statistics.hit()
+                continue
+
+            self.statistics.miss()
+
+            group_key = (kwargs['mode'], kwargs['arrival_time'], kwargs['departure_time'])
+            groups[group_key].append(kwargs)
+
+        for (mode, arrival_time, departure_time), group in groups.items():
+            for origins, destinations in self._pack(group):
+                self._calculate_matrix(
+                    origins, destinations, mode, arrival_time, departure_time
+                )
+
+        return seen
+
+    def one_to_many(self, location, others, mode, arrival_time=None, departure_time=None, reverse=False):
+        """
+        The travel times from one location to each of 'others', or from each
+        of them to it when 'reverse' is set. Missing times are None.
+        """
+
+        requests = [
+            {
+                'origin': other if reverse else location,
+                'destination': location if reverse else other,
+                'mode': mode,
+                'arrival_time': arrival_time,
+                'departure_time': departure_time,
+            }
+            for other in others
+        ]
+
+        # read straight back, so never looked up again
+        self._calculate(requests)
+
+        results = []
+        for kwargs in requests:
+            cache_key = {'travel_time': kwargs}
+            results.append(self.cache.data[cache_key] if cache_key in self.cache.data else None)
+
+        return results
+
+    def _pack(self, group):
+        """
+        Pack the group into as few requests as will fit it. Whichever side
+        has the fewest distinct locations is fixed, and each fixed location's
+        others are split into chunks of at most 'max_dimension'. Chunks are
+        then put into the first request they fit in, so one request can hold
+        several fixed locations, as long as neither side grows beyond
+        'max_dimension' and there are no more than 'max_elements' cells. Any
+        extra cells this creates are cached along with the rest.
+
+        :return: An iterable of (origins, destinations) pairs
+        """
+
+        origins = {tuple(kwargs['origin']) for kwargs in group}
+        destinations = {tuple(kwargs['destination']) for kwargs in group}
+
+        if len(destinations) <= len(origins):
+            fixed_side, other_side = 'destination', 'origin'
+        else:
+            fixed_side, other_side = 'origin', 'destination'
+
+        others_by_fixed = defaultdict(dict)
+        fixed_locations = {}
+        for kwargs in group:
+            fixed = tuple(kwargs[fixed_side])
+            fixed_locations[fixed] = kwargs[fixed_side]
+            others_by_fixed[fixed][tuple(kwargs[other_side])] = kwargs[other_side]
+
+        requests = []  # [fixed locations, others by key]
+        for fixed, others in others_by_fixed.items():
+            others = list(others.items())
+
+            for i in range(0, len(others), self.max_dimension):
+                chunk = dict(others[i:i + self.max_dimension])
+
+                for request in requests:
+                    if self._fits(request, chunk):
+                        break
+                else:
+                    request = [[], {}]
+                    requests.append(request)
+
+                request[0].append(fixed_locations[fixed])
+                request[1].update(chunk)
+
+        for fixed, others in requests:
+            others = list(others.values())
+
+            if fixed_side == 'destination':
+                yield others, fixed
+            else:
+                yield fixed, others
+
+    def _fits(self, request, chunk):
+        fixed, others = request
+        n_others = len(others.keys() | chunk.keys())
+
+        return (
+            len(fixed) < self.max_dimension
+            and n_others <= self.max_dimension
+            and (len(fixed) + 1) * n_others <= self.max_elements
+        )
+
+    def _calculate_matrix(self, origins, destinations, mode, arrival_time, departure_time):
+        params = self.maps.calculate_travel_time._create_search_params(
+            origins, destinations, mode, arrival_time, departure_time
+        )
+
+        params['origins'] = params.pop('origin')
+        params['destinations'] = params.pop('destination')
+
+        logger.debug(f'Calculating a {len(origins)}x{len(destinations)} travel time matrix')
+
+        try:
+            results = self.maps.query(
+                lambda gmaps: gmaps.distance_matrix(**params), 'distance_matrix'
+            )
+        except googlemaps.exceptions.TransportError:
+            return
+
+        for origin, row in zip(origins, results['rows']):
+            for destination, element in zip(destinations, row['elements']):
+                if element.get('status') != 'OK':
+                    continue
+
+                cache_key = {
+                    'travel_time': {
+                        'origin': origin,
+                        'destination': destination,
+                        'mode': mode,
+                        'arrival_time': arrival_time,
+                        'departure_time': departure_time,
+                    }
+                }
+
+                self.cache.data[cache_key] = element['duration']['value']
+
+
 class LatitudeLongitudeFinder:
 
     def __init__(self, maps, cache):
         self.maps = maps
         self.cache = cache
+        self.statistics = CacheStatistics('latitude_longitude')
 
     def __call__(self, query):
         query = query.strip()
 
         cache_key = {'latitude_longitude': query}
         if cache_key in self.cache.data:
+            self.statistics.hit()
             return self.cache.data[cache_key]
 
-        results = self.maps.query(lambda gmaps: gmaps.geocode(query))
+        self.statistics.miss()
+
+        results = self.maps.query(lambda gmaps: gmaps.geocode(query), 'geocode')
 
         location = results[0]['geometry']['location']
         lat_long = (location['lat'], location['lng'])
@@ -102,6 +359,7 @@ class NearbyPlacesFinder:
     def __init__(self, maps, cache):
         self.maps = maps
         self.cache = cache
+        self.statistics = CacheStatistics('nearby_places')
 
     def __call__(self, location, place_type):
         place_type = place_type.strip()
@@ -113,12 +371,15 @@ class NearbyPlacesFinder:
         }
 
         if cache_key in self.cache.data:
+            self.statistics.hit()
             return self.cache.data[cache_key]
 
+        self.statistics.miss()
+
         results = self.maps.query(lambda gmaps: gmaps.places_nearby(
             location=location, type=place_type, rank_by='distance',
             keyword=place_type,
-        ))
+        ), 'places_nearby')
 
         results = results['results']
 
@@ -128,32 +389,199 @@ class NearbyPlacesFinder:
         return results
 
 
+class AreaPlacesFinder:
+    """
+    Finds every place of a type within a bounding box by splitting it into
+    square tiles, aligned to a global grid so that overlapping areas share
+    cached tiles, and searching each tile once.
+
+    Results come 20 to a page, ranked by prominence rather than distance, so
+    every page of a tile is fetched, up to the 60 results the API allows.
+    """
+
+    max_pages = 3
+    page_delay = 2  # seconds before a next page token can be used
+
+    def __init__(self, maps, cache):
+        self.maps = maps
+        self.cache = cache
+        self.statistics = CacheStatistics('area_places')
+
+    def __call__(self, bounds, place_type, tile_size):
+        place_type = place_type.strip()
+
+        (min_latitude, min_longitude), (max_latitude, max_longitude) = bounds
+
+        latitude_step = tile_size / METRES_PER_DEGREE
+
+        # pad by a tile so the closest place to a listing near the edge of the
+        # area is still found
+        first_row = math.floor(min_latitude / latitude_step) - 1
+        last_row = math.floor(max_latitude / latitude_step) + 1
+
+        results = []
+
+        for row in range(first_row, last_row + 1):
+            latitude = (row + 0.5) * latitude_step
+            longitude_step = latitude_step / max(math.cos(math.radians(latitude)), 0.01)
+
+            first_column = math.floor(min_longitude / longitude_step) - 1
+            last_column = math.floor(max_longitude / longitude_step) + 1
+
+            for column in range(first_column, last_column + 1):
+                longitude = (column + 0.5) * longitude_step
+                results.extend(self._search_tile(
+                    (row, column), (latitude, longitude), place_type, tile_size
+                ))
+
+        return results
+
+    def _search_tile(self, tile, centre, place_type, tile_size):
+        cache_key = {
+            'area_places_finder': {
+                'tile': tile, 'tile_size': tile_size, 'place_type': place_type
+            }
+        }
+
+        if cache_key in self.cache.data:
+            self.statistics.hit()
+            return self.cache.data[cache_key]
+
+        self.statistics.miss()
+
+        logger.debug(f'Finding {place_type} places in tile {tile}')
+
+        results = []
+        page_token = None
+
+        for _ in range(self.max_pages):
+            if page_token is not None:
+                time.sleep(self.page_delay)
+
+            page = self.maps.query(lambda gmaps: gmaps.places_nearby(
+                location=centre, radius=math.ceil(tile_size * math.sqrt(2) / 2),
+                type=place_type, keyword=place_type, page_token=page_token,
+            ), 'places_nearby')
+
+            results.extend(page['results'])
+
+            page_token = page.get('next_page_token')
+            if page_token is None:
+                break
+        else:
+            logger.warning(
+                f'Tile {tile} has more than {len(results)} {place_type} places, '
+                f'some may be missed, use a smaller place_tile_size'
+            )
+
+        self.cache.data[cache_key] = results
+        return results
+
+
+# travel time backends other than Google, each created from the 'routing'
+# section of a search config
+travel_time_backends = Registry('routing backend', {
+    'offline': 'house_finder.routing:OfflineTravelTimeBackend.from_config',
+})
+
+
+def backend_from_config(config):
+    """
+    Create a travel time backend from the 'routing' section of a search
+    config, or return None to use Google.
+    """
+
+    if not config or config.get('backend', 'google') == 'google':
+        return None
+
+    return travel_time_backends.load(config['backend'])(config)
+
+
 class Maps:
 
-    def __init__(self, secret, cache):
+    max_concurrent_requests = 8
+    max_rate_limited_attempts = 10
+
+    def __init__(self, secret, cache, max_concurrent_requests=None, travel_time_backend=None):
         self.secret = secret
+        self.key_pool = KeyPool.from_secret(secret)
+
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._request_semaphore = threading.BoundedSemaphore(
+            max_concurrent_requests or self.max_concurrent_requests
+        )
 
-        self.calculate_travel_time = TravelTimeCalulator(self, cache)
+        self.travel_time_statistics = CacheStatistics('travel_time')
+        self.travel_time_backend = travel_time_backend
+
+        if travel_time_backend is None:
+            self.calculate_travel_time = TravelTimeCalulator(
+                self, cache, self.travel_time_statistics
+            )
+            self.calculate_travel_times = TravelTimeMatrixCalculator(
+                self, cache, self.travel_time_statistics
+            )
+            self.calculate_one_to_many_travel_times = self.calculate_travel_times.one_to_many
+        else:
+            self.calculate_travel_time = travel_time_backend
+            self.calculate_travel_times = travel_time_backend.prefetch
+            self.calculate_one_to_many_travel_times = travel_time_backend.one_to_many
         self.find_latitude_longitude = LatitudeLongitudeFinder(self, cache)
         self.find_nearby_places = NearbyPlacesFinder(self, cache)
+        self.find_places_in_area = AreaPlacesFinder(self, cache)
 
-        self.set_gmaps()
+        from .isochrone import IsochroneFinder
+        self.find_isochrone = IsochroneFinder(self, cache)
+
+    @property
+    def routing_key(self):
+        """
+        Identifies where travel times come from, for cache keys.
+        """
+
+        if self.travel_time_backend is None:
+            return 'google'
+
+        return self.travel_time_backend.key
+
+    def query(self, function, name='query'):
+        """
+        Call 'function' with a googlemaps client, using whichever key the key
+        pool schedules. Rate limited requests are retried on another key,
+        until `max_rate_limited_attempts` in a row have been rate limited,
+        when `KeysExhaustedError` is raised.
+        """
+
+        for _ in range(self.max_rate_limited_attempts):
+            key = self.key_pool.acquire()
 
-    def query(self, function):
-        while True:
             try:
-                result = function(self.gmaps)
+                with self._request_semaphore, metrics.timer(f'google.{name}'):
+                    result = function(self.gmaps_for(key))
             except googlemaps.exceptions._OverQueryLimit:
-                self.rotate_gmaps()
+                metrics.count('google.over_query_limit')
+                self.key_pool.report_rate_limited(key)
             else:
+                self.key_pool.report_success(key)
                 return result
 
-    def rotate_gmaps(self):
-        self.secret.rotate()
-        self.set_gmaps()
-
-    def set_gmaps(self):
-        self.gmaps = googlemaps.Client(
-            key=self.secret.key,
-            retry_over_query_limit=False,
+        raise KeysExhaustedError(
+            f'Rate limited {self.max_rate_limited_attempts} times in a row'
         )
+
+    def gmaps_for(self, key):
+        with self._clients_lock:
+            if key not in self._clients:
+                options = {}
+                if 'base_url' in self.secret.options:
+                    options['base_url'] = self.secret.options['base_url']
+
+                self._clients[key] = googlemaps.Client(
+                    key=key,
+                    retry_over_query_limit=False,
+                    queries_per_second=math.ceil(self.key_pool.queries_per_second),
+                    **options,
+                )
+
+            return self._clients[key]
@@ -0,0 +1,128 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Thread safe counters and timers for a run. Timers keep every duration so
+    that percentiles and a latency histogram can be reported at the end, and
+    the start and end of every span so they can be lined up with other
+    measurements.
+    """
+
+    histogram_buckets = [0.001, 0.01, 0.1, 1, 10]  # upper bounds in seconds
+
+    def __init__(self):
+        self.counters = Counter()
+        self.durations = defaultdict(list)
+        self.spans = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record(self, name, duration, start=None):
+        with self._lock:
+            self.durations[name].append(duration)
+
+            if start is not None:
+                self.spans[name].append((start, start + duration))
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, start)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.durations.clear()
+            self.spans.clear()
+
+    def _histogram(self, durations):
+        histogram = {}
+        remaining = durations
+
+        for bound in self.histogram_buckets:
+            histogram[f'<{bound}s'] = sum(1 for d in remaining if d < bound)
+            remaining = [d for d in remaining if d >= bound]
+
+        histogram[f'>={self.histogram_buckets[-1]}s'] = len(remaining)
+        return histogram
+
+    def _timer_summary(self, durations):
+        durations = sorted(durations)
+
+        def percentile(p):
+            return durations[min(int(p * len(durations)), len(durations) - 1)]
+
+        return {
+            'count': len(durations),
+            'total': sum(durations),
+            'mean': sum(durations) / len(durations),
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': durations[-1],
+            'histogram': self._histogram(durations),
+        }
+
+    def summary(self):
+        with self._lock:
+            counters = dict(self.counters)
+            durations = {name: list(values) for name, values in self.durations.items()}
+
+        prefixes = {
+            name.rsplit('.', 1)[0]
+            for name in counters
+            if name.endswith(('.hits', '.misses'))
+        }
+
+        hit_ratios = {}
+        for prefix in sorted(prefixes):
+            hits = counters.get(f'{prefix}.hits', 0)
+            total = hits + counters.get(f'{prefix}.misses', 0)
+            hit_ratios[prefix] = hits / total if total else 0.0
+
+        return {
+            'counters': counters,
+            'hit_ratios': hit_ratios,
+            'timers': {
+                name: self._timer_summary(values)
+                for name, values in sorted(durations.items())
+            },
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+
+        for name, timer in summary['timers'].items():
+            logger.info(
+                f'{name}: {timer["count"]} calls, {timer["total"]:.2f}s total, '
+                f'p50 {timer["p50"] * 1000:.1f}ms, p95 {timer["p95"] * 1000:.1f}ms, '
+                f'max {timer["max"] * 1000:.1f}ms'
+            )
+
+        for name, value in sorted(summary['counters'].items()):
+            logger.info(f'{name}: {value}')
+
+        for name, ratio in sorted(summary['hit_ratios'].items()):
+            logger.info(f'{name} hit ratio: {ratio:.0%}')
+
+    def dump_json(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.summary(), file, indent=2, sort_keys=True)
+
+
+# the application wide metrics
+metrics = Metrics()
@@ -1,12 +1,54 @@
+from enum import IntEnum
+
+
+class Cost(IntEnum):
+    """
+    A rough estimate of how expensive an objective is to calculate.
+    """
+
+    local = 0
+    cached = 1
+    network = 2
+
+
 class Objective:
 
+    # whether calculate_many is implemented
+    supports_calculate_many = False
+
     def __init__(self, name, maximum=None):
         self.name = name
         self.maximum = maximum
 
+        # the config this objective was loaded from, if any
+        self.definition = None
+
+        # used by the scalarised rankings: how much this objective counts,
+        # and the score it's best to be closest to, if not the lowest
+        self.weight = 1
+        self.closest_to = None
+
     def calculate(self, listing):
         raise NotImplementedError('calculate must be implemented')
 
+    def calculate_many(self, listings):
+        """
+        Calculate the scores for many listings in one go, returning a list in
+        the same order. Only used when 'supports_calculate_many' is set.
+        """
+
+        raise NotImplementedError('calculate_many is not supported')
+
+    def prefetch(self, listings, executor=None):
+        """
+        Optionally do any expensive work for many listings at once, so that
+        the following calls to `calculate` are cheap. Work which can't be
+        batched can be spread over 'executor', if given.
+        """
+
+    def estimate_cost(self, listings):
+        return Cost.network
+
     def present(self, score):
         raise NotImplementedError('present must be implemented')
 
@@ -23,6 +65,11 @@ class Objective:
         from .travel_time import TravelTimeObjective
 
         if config['type'] == 'travel_time':
-            return TravelTimeObjective.from_dict(maps, config)
+            objective = TravelTimeObjective.from_dict(maps, config)
         elif config['type'] == 'price':
-            return PriceObjective.from_dict(config)
+            objective = PriceObjective.from_dict(config)
+
+        objective.definition = config
+        objective.weight = config.get('weight', 1)
+        objective.closest_to = config.get('closest_to')
+        return objective
@@ -1,4 +1,4 @@
-from .objective import Objective
+from .objective import Cost, Objective
 
 
 class PriceObjective(Objective):
@@ -6,6 +6,9 @@ class PriceObjective(Objective):
     def calculate(self, listing):
         return listing.price
 
+    def estimate_cost(self, listings):
+        return Cost.local
+
     def present(self, score):
         return f'£{score}'
 
@@ -1,10 +1,16 @@
+from collections import defaultdict
 import datetime
 from enum import Enum
+from functools import cached_property
 import json
 import logging
 
-from .objective import Objective
-from ..maps import NoTravelTimeError
+import numpy as np
+
+from .objective import Cost, Objective
+from ..maps import NoTravelTimeError, quantise_location
+from ..metrics import metrics
+from ..places import PlaceIndex
 
 
 class Direction(Enum):
@@ -14,29 +20,56 @@ class Direction(Enum):
 
 class TravelTimeObjective(Objective):
 
-    def __init__(self, name, maximum, maps, direction, mode, arrival_time=None, departure_time=None):
+    supports_calculate_many = True
+
+    def __init__(self, name, maximum, maps, direction, mode, arrival_time=None, departure_time=None, snap_radius=None):
         super().__init__(name, maximum)
         self.maps = maps
         self.direction = direction
         self.mode = mode
         self.arrival_time = arrival_time
         self.departure_time = departure_time
+        self.snap_radius = snap_radius
 
     def calculate(self, origin, destination):
-        if self.direction == Direction.to_listing:
-            origin, destination = destination, origin
-
         try:
             return self.maps.calculate_travel_time(
-                origin=origin,
-                destination=destination,
-                mode=self.mode,
-                arrival_time=self.arrival_time,
-                departure_time=self.departure_time
+                **self.travel_time_params(origin, destination)
             )
         except NoTravelTimeError:
             return None
 
+    def calculate_many_from(self, location, listings):
+        """
+        The travel times between one location and many listings, in whichever
+        direction this objective goes.
+        """
+
+        return self.maps.calculate_one_to_many_travel_times(
+            location,
+            [self.listing_location(listing) for listing in listings],
+            self.mode, self.arrival_time, self.departure_time,
+            reverse=self.direction == Direction.from_listing,
+        )
+
+    def listing_location(self, listing):
+        if self.snap_radius:
+            return quantise_location(listing.location, self.snap_radius)
+        else:
+            return listing.location
+
+    def travel_time_params(self, origin, destination):
+        if self.direction == Direction.to_listing:
+            origin, destination = destination, origin
+
+        return {
+            'origin': origin,
+            'destination': destination,
+            'mode': self.mode,
+            'arrival_time': self.arrival_time,
+            'departure_time': self.departure_time,
+        }
+
     def present(self, score):
         minutes = round(score / 60)
         return f'{minutes}&nbsp;mins'
@@ -50,13 +83,82 @@ class TravelTimeObjective(Objective):
 
 
 class SingleTravelTimeObjective(TravelTimeObjective):
+    """
+    The travel time to or from a fixed location. With 'isochrone' set and a
+    'maximum', listings well outside the area reachable within the maximum
+    are given no travel time without being routed.
+    """
+
+    # how far outside an isochrone, in metres, listings are still routed
+    isochrone_margin = 500
 
-    def __init__(self, name, maximum, maps, location, direction, mode, arrival_time=None, departure_time=None):
-        super().__init__(name, maximum, maps, direction, mode, arrival_time, departure_time)
+    def __init__(self, name, maximum, maps, location, direction, mode, arrival_time=None, departure_time=None, snap_radius=None, isochrone=False):
+        super().__init__(name, maximum, maps, direction, mode, arrival_time, departure_time, snap_radius)
         self.location = location
+        self.use_isochrone = isochrone and bool(maximum)
+
+    @cached_property
+    def isochrone(self):
+        if not self.use_isochrone:
+            return None
+
+        return self.maps.find_isochrone(
+            self.location, self.mode, self.maximum,
+            self.arrival_time, self.departure_time,
+            reverse=self.direction == Direction.from_listing,
+        )
+
+    def reachable(self, listings):
+        """
+        :return: A boolean array, False for listings which can't be reached
+                 within the maximum
+        """
+
+        if self.isochrone is None or not listings:
+            return np.ones(len(listings), dtype=bool)
+
+        locations = [self.listing_location(listing) for listing in listings]
+        reachable = self.isochrone.contains(locations, margin=self.isochrone_margin)
+
+        metrics.count('isochrone.rejected', int(np.sum(~reachable)))
+        return reachable
 
     def calculate(self, listing):
-        return super().calculate(listing.location, self.location)
+        if not self.reachable([listing])[0]:
+            return None
+
+        return super().calculate(self.listing_location(listing), self.location)
+
+    def calculate_many(self, listings):
+        reachable = self.reachable(listings)
+        results = [None] * len(listings)
+
+        indices = [i for i in range(len(listings)) if reachable[i]]
+        times = self.calculate_many_from(self.location, [listings[i] for i in indices])
+
+        for i, time in zip(indices, times):
+            results[i] = time
+
+        return results
+
+    def prefetch(self, listings, executor=None):
+        reachable = self.reachable(listings)
+
+        self.maps.calculate_travel_times(
+            self.travel_time_params(self.listing_location(listing), self.location)
+            for listing, is_reachable in zip(listings, reachable) if is_reachable
+        )
+
+    def estimate_cost(self, listings):
+        if all(
+            self.maps.calculate_travel_time.is_cached(
+                **self.travel_time_params(self.listing_location(listing), self.location)
+            )
+            for listing in listings
+        ):
+            return Cost.cached
+        else:
+            return Cost.network
 
     @classmethod
     def from_dict(cls, maps, config):
@@ -73,27 +175,112 @@ class SingleTravelTimeObjective(TravelTimeObjective):
             config['name'], config.get('maximum'), maps,
             lat_long, direction, config['params']['via'],
             config['params'].get('arriving_at'),
-            config['params'].get('leaving_at')
+            config['params'].get('leaving_at'),
+            config.get('snap_radius'),
+            config.get('isochrone', False),
         )
 
 
 class MultipleTravelTimeObjective(TravelTimeObjective):
+    """
+    The travel time to or from the closest place of a type. By default the
+    closest place is looked up around each listing. With a 'place_tile_size'
+    the places for the whole area are fetched once, tile by tile, and the
+    closest one is found locally using a `PlaceIndex`.
+    """
 
-    def __init__(self, name, maximum, maps, place_type, direction, mode, arrival_time=None, departure_time=None):
-        super().__init__(name, maximum, maps, direction, mode, arrival_time, departure_time)
+    def __init__(self, name, maximum, maps, place_type, direction, mode, arrival_time=None, departure_time=None, snap_radius=None, place_tile_size=None):
+        super().__init__(name, maximum, maps, direction, mode, arrival_time, departure_time, snap_radius)
         self.place_type = place_type
+        self.place_tile_size = place_tile_size
+        self.place_index = PlaceIndex()
+        self.closest_places = {}
 
     def calculate(self, listing):
-        nearby_places = self.maps.find_nearby_places(listing.location, self.place_type)
+        location = self.closest_place(listing)
+        if location is None:
+            return None
+
+        return super().calculate(self.listing_location(listing), location)
+
+    @property
+    def supports_calculate_many(self):
+        # without a place index each closest place is a separate request,
+        # which `prefetch` spreads over the evaluator's workers
+        return bool(self.place_tile_size)
+
+    def calculate_many(self, listings):
+        self.resolve_closest_places(listings)
+
+        listings_by_place = defaultdict(list)
+        for i, listing in enumerate(listings):
+            location = self.closest_place(listing)
+            if location is not None:
+                listings_by_place[location].append(i)
+
+        # every place at once, so they can share requests, after which each
+        # place's travel times are already known
+        self.maps.calculate_travel_times(
+            self.travel_time_params(self.listing_location(listings[i]), location)
+            for location, indices in listings_by_place.items()
+            for i in indices
+        )
+
+        results = [None] * len(listings)
+
+        for location, indices in listings_by_place.items():
+            times = self.calculate_many_from(location, [listings[i] for i in indices])
+            for i, time in zip(indices, times):
+                results[i] = time
+
+        return results
+
+    def prefetch(self, listings, executor=None):
+        if self.place_tile_size:
+            self.resolve_closest_places(listings)
+
+        # without a place index each closest place is a request of its own
+        lookup = map if executor is None or self.place_tile_size else executor.map
+
+        params = []
+
+        for listing, location in zip(listings, lookup(self.closest_place, listings)):
+            if location is not None:
+                params.append(self.travel_time_params(self.listing_location(listing), location))
+
+        self.maps.calculate_travel_times(params)
+
+    def resolve_closest_places(self, listings):
+        locations = [self.listing_location(listing) for listing in listings]
+        if not locations:
+            return
+
+        latitudes, longitudes = zip(*locations)
+        bounds = (min(latitudes), min(longitudes)), (max(latitudes), max(longitudes))
+
+        self.place_index.add(
+            self.maps.find_places_in_area(bounds, self.place_type, self.place_tile_size)
+        )
+
+        for location, closest_place in zip(locations, self.place_index.closest(locations)):
+            self.closest_places[location] = closest_place
+
+    def closest_place(self, listing):
+        if self.place_tile_size:
+            location = self.listing_location(listing)
+            if location not in self.closest_places:
+                self.resolve_closest_places([listing])
+
+            return self.closest_places[location]
+
+        nearby_places = self.maps.find_nearby_places(self.listing_location(listing), self.place_type)
 
         try:
             closest_place = nearby_places[0]
         except IndexError:
             return None
 
-        location = closest_place['geometry']['location']['lat'], closest_place['geometry']['location']['lng']
-
-        return super().calculate(listing.location, location)
+        return closest_place['geometry']['location']['lat'], closest_place['geometry']['location']['lng']
 
     @classmethod
     def from_dict(cls, maps, config):
@@ -109,4 +296,6 @@ class MultipleTravelTimeObjective(TravelTimeObjective):
             name, direction, config['params']['via'],
             config['params'].get('arriving_at'),
             config['params'].get('leaving_at'),
+            config.get('snap_radius'),
+            config.get('place_tile_size'),
         )
@@ -1,2 +1,16 @@
-from .html import output_html
-from .plot import output_plot
+from ..plugins import Registry
+
+
+# each output is called as output(evaluated_listings, objectives, filename,
+# **options), and ignores any options it doesn't use
+outputs = Registry('output', {
+    'html': 'house_finder.outputs.html:output_html',
+    'plot': 'house_finder.outputs.plot:output_plot',
+})
+
+
+def __getattr__(name):
+    if name.startswith('output_') and name[len('output_'):] in outputs:
+        return outputs.load(name[len('output_'):])
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,13 +1,74 @@
 from collections import UserList
+from functools import cached_property
 import logging
 
-from cached_property import cached_property
 import numpy as np
 
+from ..evaluator import EvaluationResult
+
 
 logger = logging.getLogger(__name__)
 
 
+def score_table(evaluated_listings):
+    if isinstance(evaluated_listings, EvaluationResult):
+        return evaluated_listings.score_matrix
+
+    return np.array([
+        [score.value for score in e.scores.values()]
+        for e in evaluated_listings
+    ], dtype=float)
+
+
+def non_dominated_sort(score_table):
+    """
+    Assigns every point to a Pareto front in one pass, using the efficient
+    non-dominated sort with binary search (ENS-BS). A point is dominated by
+    another if it has a higher cost in every column.
+
+    Points are visited in order of their total cost, so anything which could
+    dominate a point has already been placed. Each point then goes into the
+    first front with no member dominating it. Fronts are ordered so that this
+    can be found with a binary search over them.
+
+    :param score_table: An (n_points, n_costs) array
+    :return: A (n_points, ) integer array with the index of each point's
+             front, starting from 0 for the Pareto front itself
+    """
+
+    n_points, n_costs = score_table.shape
+
+    fronts = np.empty(n_points, dtype=int)
+    front_members = []  # an over-allocated array of costs for each front
+    front_sizes = []
+
+    for i in np.argsort(score_table.sum(axis=1), kind='stable'):
+        point = score_table[i]
+
+        low, high = 0, len(front_members)
+        while low < high:
+            middle = (low + high) // 2
+            members = front_members[middle][:front_sizes[middle]]
+            if np.any(np.all(members < point, axis=1)):
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == len(front_members):
+            front_members.append(np.empty((64, n_costs)))
+            front_sizes.append(0)
+        elif front_sizes[low] == len(front_members[low]):
+            front_members[low] = np.concatenate(
+                [front_members[low], np.empty_like(front_members[low])]
+            )
+
+        front_members[low][front_sizes[low]] = point
+        front_sizes[low] += 1
+        fronts[i] = low
+
+    return fronts
+
+
 class ParetoFront(UserList):
 
     def __init__(self, evaluated_listings):
@@ -20,10 +81,7 @@ class ParetoFront(UserList):
 
     @cached_property
     def score_table(self):
-        return np.array([
-            [score.value for score in e.scores.values()]
-            for e in self.evaluated_listings
-        ])
+        return score_table(self.evaluated_listings)
 
     @cached_property
     def _pareto_front(self):
@@ -39,18 +97,211 @@ class ParetoFront(UserList):
 
 
 class RankEvaluator(UserList):
+    """
+    Splits evaluated listings into successive Pareto fronts, best first.
+    Given an `EvaluationResult` each front is also an `EvaluationResult`,
+    otherwise each front is a list.
+    """
 
     def __init__(self, evaluated_listings):
         logger.info("It's Pareto time!")
 
-        evaluated_listings = list(evaluated_listings)  # make a copy
+        if not isinstance(evaluated_listings, EvaluationResult):
+            evaluated_listings = list(evaluated_listings)
 
-        self.data = []
+        if len(evaluated_listings):
+            fronts = non_dominated_sort(score_table(evaluated_listings))
+        else:
+            fronts = np.array([], dtype=int)
 
-        while evaluated_listings:
-            pareto_front = ParetoFront(evaluated_listings)
-            for e in pareto_front:
-                evaluated_listings.remove(e)
-            self.data.append(pareto_front)
+        self.data = [
+            self._select(evaluated_listings, fronts == front)
+            for front in range(fronts.max(initial=-1) + 1)
+        ]
 
         logger.info(f'Filtered down to {len(self.data)} pareto fronts.')
+
+    def _select(self, evaluated_listings, mask):
+        if isinstance(evaluated_listings, EvaluationResult):
+            return evaluated_listings[mask]
+        else:
+            return [e for e, selected in zip(evaluated_listings, mask) if selected]
+
+
+NORMALISATIONS = ('minmax', 'zscore')
+SCALARISATIONS = ('weighted_sum', 'chebyshev')
+
+
+def distances(score_table, objectives):
+    """
+    How far each score is from the best score. That is the distance from
+    an objective's 'closest_to' if it has a numeric one, otherwise the
+    score itself, so lower is better.
+    """
+
+    targets = np.array([
+        objective.closest_to
+        if isinstance(objective.closest_to, (int, float)) else np.nan
+        for objective in objectives
+    ], dtype=float)
+
+    return np.where(np.isnan(targets), score_table, np.abs(score_table - targets))
+
+
+class ScoreStatistics:
+    """
+    The minimum, maximum, mean and variance of each column of a score table,
+    which can be updated a chunk at a time.
+    """
+
+    def __init__(self, n_objectives):
+        self.count = 0
+        self.minimum = np.full(n_objectives, np.inf)
+        self.maximum = np.full(n_objectives, -np.inf)
+        self.mean = np.zeros(n_objectives)
+        self.sum_of_squares = np.zeros(n_objectives)  # of differences from the mean
+
+    @classmethod
+    def of(cls, score_table):
+        statistics = cls(score_table.shape[1])
+        statistics.update(score_table)
+        return statistics
+
+    def update(self, score_table):
+        if not len(score_table):
+            return
+
+        count = len(score_table)
+        mean = score_table.mean(axis=0)
+        sum_of_squares = ((score_table - mean) ** 2).sum(axis=0)
+
+        # combine the two sets of moments, as in Chan et al.
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.sum_of_squares = self.sum_of_squares + sum_of_squares + delta ** 2 * self.count * count / total
+        self.count = total
+
+        self.minimum = np.minimum(self.minimum, score_table.min(axis=0))
+        self.maximum = np.maximum(self.maximum, score_table.max(axis=0))
+
+    @property
+    def standard_deviation(self):
+        return np.sqrt(self.sum_of_squares / max(self.count, 1))
+
+    def normalise(self, score_table, normalisation='minmax'):
+        if normalisation == 'minmax':
+            offset, scale = self.minimum, self.maximum - self.minimum
+        elif normalisation == 'zscore':
+            offset, scale = self.mean, self.standard_deviation
+        else:
+            raise ValueError(f'Unknown normalisation: {normalisation}')
+
+        # a column where every score is the same doesn't affect the ranking
+        scale = np.where(scale > 0, scale, 1)
+
+        return (score_table - offset) / scale
+
+
+def scalarise(score_table, objectives, statistics, method='weighted_sum', normalisation='minmax'):
+    """
+    Reduce each row of a score table to a single cost, lower being better,
+    after normalising each objective's distances from its best score.
+
+    'weighted_sum' adds up the weighted normalised distances, 'chebyshev'
+    takes the largest weighted distance from the best normalised distance
+    seen, so a listing must do reasonably on every objective to rank well.
+
+    :param statistics: `ScoreStatistics` of the distances to normalise by
+    """
+
+    weights = np.array([objective.weight for objective in objectives], dtype=float)
+    normalised = statistics.normalise(distances(score_table, objectives), normalisation)
+
+    if method == 'weighted_sum':
+        return normalised @ weights
+    elif method == 'chebyshev':
+        ideal = statistics.normalise(statistics.minimum, normalisation)
+        return np.max(weights * (normalised - ideal), axis=1, initial=-np.inf)
+    else:
+        raise ValueError(f'Unknown ranking method: {method}')
+
+
+class ScalarisedRankEvaluator(UserList):
+    """
+    Orders an `EvaluationResult` by its scalarised cost, best first, as a
+    list of single listing results, so it can stand in for the fronts of a
+    `RankEvaluator`. The normalisation comes from 'statistics' if given,
+    otherwise from the listings themselves.
+    """
+
+    def __init__(self, evaluated_listings, method='weighted_sum', normalisation='minmax', statistics=None):
+        objectives = evaluated_listings.objectives
+        score_table = evaluated_listings.score_matrix
+
+        if statistics is None:
+            statistics = ScoreStatistics.of(distances(score_table, objectives))
+
+        costs = scalarise(score_table, objectives, statistics, method, normalisation)
+
+        self.data = [
+            evaluated_listings[i:i + 1] for i in np.argsort(costs, kind='stable')
+        ]
+
+
+class TopK:
+    """
+    Keeps only the best 'k' valid listings which satisfy their constraints,
+    by scalarised cost, as chunks of evaluated listings stream in, so memory
+    stays bounded however many listings a search returns.
+
+    Normalisation needs statistics of every listing, which are kept as
+    running totals. Each chunk is ranked along with the kept listings using
+    the statistics so far, so the final order is exact, but which listings
+    were kept can differ slightly from ranking everything at the end while
+    the statistics are still settling.
+    """
+
+    def __init__(self, objectives, k, method='weighted_sum', normalisation='minmax'):
+        self.objectives = objectives
+        self.k = k
+        self.method = method
+        self.normalisation = normalisation
+
+        self.statistics = ScoreStatistics(len(objectives))
+        self.result = EvaluationResult.concatenate([], objectives)
+        self.seen = 0
+
+    def extend(self, evaluated_listings):
+        if not isinstance(evaluated_listings, EvaluationResult):
+            evaluated_listings = EvaluationResult.from_evaluated_listings(
+                evaluated_listings, self.objectives
+            )
+
+        self.seen += len(evaluated_listings)
+
+        chunk = evaluated_listings[
+            evaluated_listings.is_valid & evaluated_listings.satisfies_constraints
+        ]
+        self.statistics.update(distances(chunk.score_matrix, self.objectives))
+
+        candidates = EvaluationResult.concatenate([self.result, chunk], self.objectives)
+        costs = scalarise(
+            candidates.score_matrix, self.objectives, self.statistics,
+            self.method, self.normalisation,
+        )
+
+        if len(candidates) > self.k:
+            best = np.argpartition(costs, self.k - 1)[:self.k]
+        else:
+            best = np.arange(len(candidates))
+
+        self.result = candidates[best[np.argsort(costs[best], kind='stable')]]
+
+    def __len__(self):
+        return len(self.result)
+
+    def ranked(self):
+        return ScalarisedRankEvaluator(
+            self.result, self.method, self.normalisation, self.statistics
+        )
@@ -1,44 +1,95 @@
+import json
 import logging
 from pathlib import Path
 import webbrowser
 
 from jinja2 import Environment, PackageLoader, select_autoescape
+from markupsafe import Markup
 
+from ..metrics import metrics
 from .filters import RankEvaluator
 
 
 logger = logging.getLogger(__name__)
 
 
-def average(things):
-    return sum(things) / len(things)
+def calculate_centre(evaluated_listings):
+    return tuple(evaluated_listings.locations.mean(axis=0))
 
 
-def calculate_centre(evaluated_listings):
-    return (
-        average([e.listing.location[0] for e in evaluated_listings]),
-        average([e.listing.location[1] for e in evaluated_listings]),
-    )
+def listings_payload(ranked_evaluated_listings, objectives):
+    """
+    The data the page builds its markers from, as compact JSON which is safe
+    to embed in a script element. Each listing is a row of latitude,
+    longitude, rank, address, url, image url and one presented score per
+    objective.
+    """
 
+    rows = []
 
-def output_html(secrets, evaluated_listings, objectives, filename):
-    logger.info(f'Outputing {len(evaluated_listings)} listings to {filename}')
+    for rank, evaluated_listings in enumerate(ranked_evaluated_listings):
+        for evaluated_listing in evaluated_listings:
+            listing = evaluated_listing.listing
+            rows.append([
+                round(float(listing.location[0]), 6),
+                round(float(listing.location[1]), 6),
+                rank,
+                listing.address,
+                listing.url,
+                listing.image_url,
+                [
+                    str(evaluated_listing.scores[objective.name] or '')
+                    for objective in objectives
+                ],
+            ])
 
-    ranked_evaluted_listings = RankEvaluator(evaluated_listings)
+    payload = json.dumps({
+        'objectives': [objective.name for objective in objectives],
+        'listings': rows,
+    }, separators=(',', ':'))
 
-    env = Environment(
+    return Markup(payload.replace('</', '<\\/'))
+
+
+def create_environment():
+    return Environment(
         loader=PackageLoader('house_finder', 'outputs'),
-        autoescape=select_autoescape(['html', 'xml'])
+        autoescape=select_autoescape(['html', 'xml']),
+        trim_blocks=True,
+        lstrip_blocks=True,
     )
 
-    template = env.get_template('template.html')
 
-    with open(filename, 'w') as file:
-        file.write(template.render(
-            secrets=secrets,
-            ranked_evaluted_listings=ranked_evaluted_listings,
-            objectives=objectives,
-            centre=calculate_centre(ranked_evaluted_listings[0]),
-        ))
+def render_html(secrets, ranked_evaluated_listings, objectives, file):
+    """
+    Stream the report into an open file, without building the whole document
+    in memory.
+    """
+
+    template = create_environment().get_template('template.html')
+
+    file.writelines(template.generate(
+        secrets=secrets,
+        ranked_evaluted_listings=ranked_evaluated_listings,
+        objectives=objectives,
+        centre=calculate_centre(ranked_evaluated_listings[0]),
+        payload=listings_payload(ranked_evaluated_listings, objectives),
+    ))
+
+
+def output_html(evaluated_listings, objectives, filename, secrets, ranked=None, **options):
+    """
+    :param ranked: The listings already split into ranks, best first, by
+                   default they're ranked into Pareto fronts
+    """
+
+    logger.info(f'Outputing {len(evaluated_listings)} listings to {filename}')
+
+    with metrics.timer('output.rank'):
+        if ranked is None:
+            ranked = RankEvaluator(evaluated_listings)
+
+    with metrics.timer('output.render'), open(filename, 'w') as file:
+        render_html(secrets, ranked, objectives, file)
 
     webbrowser.open(Path(filename).resolve().as_uri())
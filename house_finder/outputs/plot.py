@@ -1,30 +1,74 @@
-import matplotlib
-matplotlib.use('TkAgg')
+import logging
 
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
 
+from ..metrics import metrics
+from .filters import non_dominated_sort, score_table
 
-def output_plot(evaluated_listings, objectives):
-    nrows = ncols = len(objectives)
-    index = 0
 
-    for objective1 in objectives:
-        for objective2 in objectives:
-            index += 1
+logger = logging.getLogger(__name__)
 
-            on1 = objective1.name
-            on2 = objective2.name
 
-            if on1 == on2:
-                continue
+def output_plot(evaluated_listings, objectives, filename, annotate=False, **options):
+    """
+    Save a scatter matrix of every pair of objectives, with points coloured
+    by Pareto rank, to an image or PDF. The format comes from the extension
+    of 'filename'. With 'annotate' set the Pareto front is labelled with
+    addresses.
+    """
 
-            plt.subplot(nrows, ncols, index)
+    logger.info(f'Plotting {len(evaluated_listings)} listings to {filename}')
 
-            for e in evaluated_listings:
-                x, y = e.scores[on1], e.scores[on2]
-                plt.plot(x, y, 'o')
-                plt.annotate(e.listing.address, [x, y])
-                plt.xlabel(on1)
-                plt.ylabel(on2)
+    names = [objective.name for objective in objectives]
+    scores = score_table(evaluated_listings).reshape(-1, len(names))
 
-    plt.show()
+    with metrics.timer('output.rank'):
+        if len(scores):
+            ranks = non_dominated_sort(scores)
+        else:
+            ranks = np.array([], dtype=int)
+
+    size = 3 * len(names)
+    figure = Figure(figsize=(size, size), constrained_layout=True)
+    FigureCanvasAgg(figure)
+
+    axes = figure.subplots(len(names), len(names), squeeze=False)
+
+    # draw the best ranks last so they sit on top
+    order = np.argsort(-ranks, kind='stable')
+
+    with metrics.timer('output.render'):
+        for i, y_name in enumerate(names):
+            for j, x_name in enumerate(names):
+                ax = axes[i, j]
+
+                if i == j:
+                    ax.hist(scores[:, i][~np.isnan(scores[:, i])], bins=30)
+                else:
+                    points = ax.scatter(
+                        scores[order, j], scores[order, i], c=ranks[order],
+                        cmap='viridis_r', s=8, linewidths=0,
+                    )
+
+                    if annotate:
+                        annotate_front(ax, evaluated_listings, scores[:, j], scores[:, i], ranks)
+
+                if i == len(names) - 1:
+                    ax.set_xlabel(x_name)
+                if j == 0:
+                    ax.set_ylabel(y_name)
+
+        if len(names) > 1 and len(scores):
+            figure.colorbar(points, ax=axes, label='Pareto rank', shrink=0.6)
+
+        figure.savefig(filename)
+
+
+def annotate_front(ax, evaluated_listings, x, y, ranks):
+    for index in np.flatnonzero(ranks == 0):
+        ax.annotate(
+            evaluated_listings[int(index)].listing.address, (x[index], y[index]),
+            fontsize='x-small',
+        )
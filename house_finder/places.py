@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class PlaceIndex:
+    """
+    An in-memory index of places which finds the closest place to many
+    locations at once. Distances use an equirectangular projection, which is
+    accurate enough over the size of a town.
+    """
+
+    def __init__(self):
+        self.places = {}
+
+    def __len__(self):
+        return len(self.places)
+
+    def add(self, places):
+        for place in places:
+            location = place['geometry']['location']
+            location = (location['lat'], location['lng'])
+            self.places[place.get('place_id', location)] = location
+
+    def closest(self, locations):
+        """
+        :param locations: A sequence of (latitude, longitude) pairs
+        :return: The location of the closest place to each, or None if there
+                 are no places
+        """
+
+        if not self.places:
+            return [None] * len(locations)
+
+        places = np.array(list(self.places.values()), dtype=float)
+        locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+
+        scale = np.cos(np.radians(locations[:, 0]))[:, np.newaxis]
+        latitude_distances = locations[:, np.newaxis, 0] - places[np.newaxis, :, 0]
+        longitude_distances = (locations[:, np.newaxis, 1] - places[np.newaxis, :, 1]) * scale
+
+        indices = np.argmin(latitude_distances ** 2 + longitude_distances ** 2, axis=1)
+
+        return [tuple(places[i]) for i in indices]
@@ -0,0 +1,45 @@
+from functools import reduce
+from importlib import import_module
+
+
+class Registry:
+    """
+    Named plugins of one kind, such as outputs or travel time backends. A
+    plugin is registered as the path to it, 'package.module:attribute', and
+    only imported the first time it's loaded, so a run only pays for the
+    dependencies of the plugins it uses.
+    """
+
+    def __init__(self, kind, plugins=None):
+        self.kind = kind
+        self.plugins = dict(plugins or {})
+        self.loaded = {}
+
+    def register(self, name, plugin):
+        """
+        :param plugin: The path to the plugin, or the plugin itself
+        """
+
+        self.plugins[name] = plugin
+        self.loaded.pop(name, None)
+
+    def names(self):
+        return list(self.plugins)
+
+    def __contains__(self, name):
+        return name in self.plugins
+
+    def load(self, name):
+        if name not in self.loaded:
+            try:
+                plugin = self.plugins[name]
+            except KeyError:
+                raise ValueError(f'Unknown {self.kind}: {name}') from None
+
+            if isinstance(plugin, str):
+                module_name, attributes = plugin.split(':')
+                plugin = reduce(getattr, attributes.split('.'), import_module(module_name))
+
+            self.loaded[name] = plugin
+
+        return self.loaded[name]
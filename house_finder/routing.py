@@ -0,0 +1,381 @@
+from collections import defaultdict
+import heapq
+import logging
+import math
+import threading
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from .isochrone import star_polygon
+from .maps import METRES_PER_DEGREE, NoTravelTimeError
+
+
+logger = logging.getLogger(__name__)
+
+
+# metres per second, by mode and highway type
+SPEEDS = {
+    'walking': defaultdict(lambda: 1.4),
+    'bicycling': defaultdict(lambda: 4.2),
+    'driving': defaultdict(lambda: 11.0, {
+        'motorway': 27.0, 'motorway_link': 17.0,
+        'trunk': 22.0, 'trunk_link': 14.0,
+        'primary': 17.0, 'primary_link': 11.0,
+        'secondary': 14.0, 'secondary_link': 11.0,
+        'tertiary': 11.0, 'tertiary_link': 8.0,
+        'residential': 8.0, 'living_street': 3.0, 'service': 4.0,
+    }),
+}
+
+# highway types which each mode may not use
+EXCLUDED_HIGHWAYS = {
+    'walking': {'motorway', 'motorway_link', 'trunk', 'trunk_link'},
+    'bicycling': {'motorway', 'motorway_link', 'steps'},
+    'driving': {
+        'footway', 'path', 'pedestrian', 'steps', 'cycleway', 'bridleway',
+        'track', 'corridor', 'elevator', 'platform',
+    },
+}
+
+
+class RoadGraph:
+    """
+    A road network with a weighted adjacency list per travel mode, in both
+    directions so times can be found to or from a point.
+    """
+
+    def __init__(self, locations, edges):
+        """
+        :param locations: An (n_nodes, 2) array of (latitude, longitude)
+        :param edges: An iterable of (from, to, metres, highway, oneway)
+        """
+
+        self.locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+
+        self.forward = {mode: defaultdict(list) for mode in SPEEDS}
+        self.backward = {mode: defaultdict(list) for mode in SPEEDS}
+
+        for start, end, metres, highway, oneway in edges:
+            for mode, speeds in SPEEDS.items():
+                if highway in EXCLUDED_HIGHWAYS[mode]:
+                    continue
+
+                seconds = metres / speeds[highway]
+
+                self.forward[mode][start].append((end, seconds))
+                self.backward[mode][end].append((start, seconds))
+
+                # one way streets only restrict driving
+                if not oneway or mode != 'driving':
+                    self.forward[mode][end].append((start, seconds))
+                    self.backward[mode][start].append((end, seconds))
+
+    @classmethod
+    def from_osm(cls, filename):
+        """
+        Load the highways out of an OpenStreetMap XML extract.
+        """
+
+        node_locations = {}
+        ways = []
+
+        for _, element in ElementTree.iterparse(filename):
+            if element.tag == 'node':
+                node_locations[element.get('id')] = (
+                    float(element.get('lat')), float(element.get('lon'))
+                )
+            elif element.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                if 'highway' in tags:
+                    refs = [nd.get('ref') for nd in element.iter('nd')]
+                    oneway = tags.get('oneway') in ('yes', 'true', '1')
+                    ways.append((refs, tags['highway'], oneway))
+
+            if element.tag in ('node', 'way', 'relation'):
+                element.clear()
+
+        indices = {}
+        locations = []
+
+        def index(ref):
+            if ref not in indices:
+                indices[ref] = len(locations)
+                locations.append(node_locations[ref])
+            return indices[ref]
+
+        edges = []
+        for refs, highway, oneway in ways:
+            refs = [ref for ref in refs if ref in node_locations]
+            for start, end in zip(refs, refs[1:]):
+                edges.append((
+                    index(start), index(end),
+                    distance(node_locations[start], node_locations[end]),
+                    highway, oneway,
+                ))
+
+        logger.info(f'Loaded a road graph with {len(locations)} nodes from {filename}')
+
+        return cls(locations, edges)
+
+    def nearest_node(self, location):
+        """
+        :return: The index of the closest node and the distance to it in metres
+        """
+
+        latitude, longitude = location
+        scale = math.cos(math.radians(latitude))
+
+        squared = (
+            (self.locations[:, 0] - latitude) ** 2
+            + ((self.locations[:, 1] - longitude) * scale) ** 2
+        )
+
+        node = int(np.argmin(squared))
+        return node, math.sqrt(squared[node]) * METRES_PER_DEGREE
+
+    def shortest_times(self, source, mode, reverse=False):
+        """
+        Dijkstra's algorithm from one node to every other node, or from every
+        node to one node when 'reverse' is set.
+
+        :return: An (n_nodes, ) array of seconds, inf where unreachable
+        """
+
+        adjacency = (self.backward if reverse else self.forward)[mode]
+
+        times = np.full(len(self.locations), np.inf)
+        times[source] = 0
+        queue = [(0.0, source)]
+
+        while queue:
+            time, node = heapq.heappop(queue)
+            if time > times[node]:
+                continue
+
+            for neighbour, seconds in adjacency[node]:
+                new_time = time + seconds
+                if new_time < times[neighbour]:
+                    times[neighbour] = new_time
+                    heapq.heappush(queue, (new_time, neighbour))
+
+        return times
+
+
+def distance(a, b):
+    """
+    The approximate distance between two (latitude, longitude) pairs in metres.
+    """
+
+    scale = math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(a[0] - b[0], (a[1] - b[1]) * scale) * METRES_PER_DEGREE
+
+
+class TravelTimeBackend:
+    """
+    Calculates travel times for `Maps.calculate_travel_time`. Backends are
+    called with the same keyword arguments as `TravelTimeCalulator` and raise
+    `NoTravelTimeError` when there is no route.
+    """
+
+    modes = None  # the travel modes supported, None for every mode
+    config = None  # the 'routing' config the backend was created from, if any
+
+    @property
+    def key(self):
+        """
+        Identifies the backend and its config, so results from different
+        backends are cached separately.
+        """
+
+        return {'backend': self.__class__.__name__, 'config': self.config}
+
+    def check_objectives(self, objectives):
+        """
+        Raise a `ValueError` if any objective travels by a mode this backend
+        doesn't support, as it would otherwise give no travel time at all.
+        """
+
+        if self.modes is None:
+            return
+
+        for objective in objectives:
+            mode = getattr(objective, 'mode', None)
+            if mode is not None and mode not in self.modes:
+                raise ValueError(
+                    f"Objective '{objective.name}' travels by {mode}, but the "
+                    f"{self.__class__.__name__} only supports {', '.join(self.modes)}"
+                )
+
+    def __call__(self, origin, destination, mode, arrival_time=None, departure_time=None):
+        raise NotImplementedError('__call__ must be implemented')
+
+    def prefetch(self, requests):
+        """
+        Optionally calculate many travel times at once, taking an iterable of
+        keyword argument dicts.
+        """
+
+    def one_to_many(self, location, others, mode, arrival_time=None, departure_time=None, reverse=False):
+        """
+        The travel times from one location to each of 'others', or from each
+        of them to it when 'reverse' is set. Missing times are None.
+        """
+
+        results = []
+
+        for other in others:
+            origin, destination = (other, location) if reverse else (location, other)
+
+            try:
+                results.append(self(origin, destination, mode, arrival_time, departure_time))
+            except NoTravelTimeError:
+                results.append(None)
+
+        return results
+
+    def is_cached(self, **kwargs):
+        return False
+
+
+class OfflineTravelTimeBackend(TravelTimeBackend):
+    """
+    Walking, cycling and driving times over a local `RoadGraph`. Each search
+    finds the times from one point to every node (or every node to one
+    point), so one search answers every listing for an objective. Departure
+    and arrival times are ignored, there is no traffic or timetable data.
+    """
+
+    isochrone_sectors = 16
+    modes = tuple(SPEEDS)
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = {}
+        self.searches = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        backend = cls(RoadGraph.from_osm(config['graph']))
+        backend.config = config
+        return backend
+
+    def _node(self, location, mode):
+        """
+        :return: The closest node to a location and the time taken to get
+                 there, at the mode's default speed
+        """
+
+        location = tuple(location)
+
+        if location not in self.nodes:
+            self.nodes[location] = self.graph.nearest_node(location)
+
+        node, metres = self.nodes[location]
+        return node, metres / SPEEDS[mode].default_factory()
+
+    def _times(self, mode, node, reverse):
+        key = (mode, node, reverse)
+
+        with self._lock:
+            if key not in self.searches:
+                self.searches[key] = self.graph.shortest_times(node, mode, reverse)
+
+            return self.searches[key]
+
+    def _check_mode(self, mode):
+        if mode not in SPEEDS:
+            raise NoTravelTimeError(f'{mode} is not supported offline')
+
+    def __call__(self, origin, destination, mode, arrival_time=None, departure_time=None):
+        self._check_mode(mode)
+
+        origin_node, origin_seconds = self._node(origin, mode)
+        destination_node, destination_seconds = self._node(destination, mode)
+
+        if (mode, origin_node, False) in self.searches:
+            times = self._times(mode, origin_node, reverse=False)
+            seconds = times[destination_node]
+        else:
+            times = self._times(mode, destination_node, reverse=True)
+            seconds = times[origin_node]
+
+        if math.isinf(seconds):
+            raise NoTravelTimeError()
+
+        return int(round(seconds + origin_seconds + destination_seconds))
+
+    def prefetch(self, requests):
+        """
+        Search from whichever side of each mode's requests has the fewest
+        distinct locations.
+        """
+
+        requests_by_mode = defaultdict(list)
+        for kwargs in requests:
+            if kwargs['mode'] in SPEEDS:
+                requests_by_mode[kwargs['mode']].append(kwargs)
+
+        for mode, group in requests_by_mode.items():
+            origins = {tuple(kwargs['origin']) for kwargs in group}
+            destinations = {tuple(kwargs['destination']) for kwargs in group}
+
+            if len(origins) < len(destinations):
+                for origin in origins:
+                    self._times(mode, self._node(origin, mode)[0], reverse=False)
+            else:
+                for destination in destinations:
+                    self._times(mode, self._node(destination, mode)[0], reverse=True)
+
+    def one_to_many(self, location, others, mode, arrival_time=None, departure_time=None, reverse=False):
+        if mode not in SPEEDS:
+            return [None] * len(others)
+
+        node, seconds = self._node(location, mode)
+        times = self._times(mode, node, reverse)
+
+        results = []
+
+        for other in others:
+            other_node, other_seconds = self._node(other, mode)
+
+            if math.isinf(times[other_node]):
+                results.append(None)
+            else:
+                results.append(int(round(times[other_node] + seconds + other_seconds)))
+
+        return results
+
+    def isochrone(self, location, mode, maximum, arrival_time=None, departure_time=None, reverse=False):
+        """
+        A polygon around every node reachable within 'maximum' seconds, with
+        one vertex per bearing at the furthest reachable node in that sector.
+        """
+
+        self._check_mode(mode)
+
+        node, seconds = self._node(location, mode)
+        times = self._times(mode, node, reverse) + seconds
+
+        reachable = times <= maximum
+        locations = self.graph.locations[reachable]
+
+        scale = math.cos(math.radians(location[0]))
+        north = (locations[:, 0] - location[0]) * METRES_PER_DEGREE
+        east = (locations[:, 1] - location[1]) * scale * METRES_PER_DEGREE
+
+        bearings = np.mod(np.arctan2(east, north), 2 * math.pi)
+        indices = np.round(bearings / (2 * math.pi) * self.isochrone_sectors).astype(int) % self.isochrone_sectors
+
+        # any time left over at a node can be spent getting off the network
+        reach = np.hypot(north, east) + (maximum - times[reachable]) * SPEEDS[mode].default_factory()
+
+        # without using the network at all
+        radii = np.full(self.isochrone_sectors, maximum * SPEEDS[mode].default_factory())
+        np.maximum.at(radii, indices, reach)
+
+        return star_polygon(location, list(radii))
+
+    def is_cached(self, **kwargs):
+        return True
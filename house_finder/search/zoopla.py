@@ -1,5 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import logging
+import math
+import threading
 
+from requests.adapters import HTTPAdapter
+
+from ..metrics import metrics
 from .listing import Listing
 
 
@@ -10,10 +17,22 @@ class Zoopla:
     """Search various property sites to find listings."""
 
     url = 'http://api.zoopla.co.uk/api/v1/property_listings.json'
+    page_size = 100
+    max_concurrent_requests = 2
 
-    def __init__(self, secret, cache):
+    def __init__(self, secret, cache, max_concurrent_requests=None):
         self.secret = secret
         self.cache = cache
+        self.url = secret.options.get('url', self.url)
+
+        if max_concurrent_requests is not None:
+            self.max_concurrent_requests = max_concurrent_requests
+
+        self._request_semaphore = threading.BoundedSemaphore(self.max_concurrent_requests)
+
+        self.cache.requests_session.mount(
+            'http://', HTTPAdapter(pool_maxsize=self.max_concurrent_requests)
+        )
 
     def params_for_query(self, query):
         return {
@@ -27,8 +46,7 @@ class Zoopla:
             'new_homes': query.new,
 
             'api_key': self.secret.key,
-            'page_size': 100,
-            'page_number': 1,
+            'page_size': self.page_size,
         }
 
     def build_listing(self, listing):
@@ -61,26 +79,52 @@ class Zoopla:
 
             yield listing
 
+    def _load_page(self, params, page_number):
+        logger.debug(f'Loading page #{page_number}')
+
+        with self._request_semaphore, metrics.timer('zoopla.page'):
+            response = self.cache.requests_session.get(
+                self.url, params={**params, 'page_number': page_number}
+            )
+
+        return response.json()
+
     def _search(self, query):
-        logger.info('Searching Zoopla...')
+        """
+        Load the first page to find out how many results there are, then load
+        the remaining pages concurrently. Listings are yielded in page order
+        as soon as each page arrives.
+        """
 
-        session = self.cache.requests_session
+        logger.info('Searching Zoopla...')
 
         params = self.params_for_query(query)
 
-        while True:
-            logger.debug(f'Loading page #{params["page_number"]}')
+        json = self._load_page(params, 1)
 
-            response = session.get(self.url, params=params)
-            json = response.json()
+        page_count = math.ceil(json.get('result_count', 0) / self.page_size)
+        logger.debug(f'Expecting {page_count} pages of results')
 
-            if not json['listing']:
-                break
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            pages = executor.map(
+                lambda page_number: self._load_page(params, page_number),
+                range(2, page_count + 1),
+            )
 
-            for listing in self.filter_listings(query, json['listing']):
-                yield self.build_listing(listing)
+            for json in itertools.chain([json], pages):
+                metrics.count('zoopla.listings', len(json['listing']))
 
-            params['page_number'] += 1
+                for listing in self.filter_listings(query, json['listing']):
+                    yield self.build_listing(listing)
 
     def search(self, query):
-        return list(set(self._search(query)))
+        """
+        A generator of every listing matching the query, without duplicates.
+        """
+
+        seen_ids = set()
+
+        for listing in self._search(query):
+            if listing.id not in seen_ids:
+                seen_ids.add(listing.id)
+                yield listing
@@ -1,12 +1,19 @@
+import datetime
+import random
+import threading
+import time
+
+
 class KeysExhaustedError(RuntimeError):
     pass
 
 
 class Secret:
 
-    def __init__(self, keys):
+    def __init__(self, keys, options=None):
         self.available_keys = keys
         self.used_keys = []
+        self.options = options or {}
         self.rotate()
 
     def rotate(self):
@@ -18,12 +25,134 @@ class Secret:
         except IndexError:
             raise KeysExhaustedError()
 
+    @property
+    def all_keys(self):
+        return self.used_keys + [self.key] + self.available_keys
+
     @classmethod
     def from_config(cls, config):
+        options = {
+            k: v for k, v in config.items() if k not in ('api_key', 'api_keys')
+        }
+
         if 'api_key' in config:
-            return cls([config['api_key']])
+            return cls([config['api_key']], options)
         else:
-            return cls(config['api_keys'])
+            return cls(list(config['api_keys']), options)
+
+
+class KeyState:
+
+    def __init__(self, key, queries_per_second, now):
+        self.key = key
+        self.tokens = queries_per_second
+        self.refilled_at = now
+        self.cooldown_until = now
+        self.failures = 0
+        self.used_today = 0
+        self.day = None
+
+
+class KeyPool:
+    """
+    Spreads requests over several API keys. Each key has a token bucket which
+    limits it to 'queries_per_second' and an optional 'daily_quota'. A key
+    which hits a rate limit is cooled down with jittered exponential backoff
+    and then put back into service, rather than being discarded.
+    """
+
+    def __init__(self, keys, queries_per_second=10, daily_quota=None, cooldown=1,
+                 max_cooldown=15 * 60, clock=time.monotonic, sleep=time.sleep,
+                 today=datetime.date.today):
+        if not keys:
+            raise KeysExhaustedError()
+
+        self.queries_per_second = queries_per_second
+        self.daily_quota = daily_quota
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.clock = clock
+        self.sleep = sleep
+        self.today = today
+
+        self._lock = threading.Lock()
+        self._states = [KeyState(key, queries_per_second, clock()) for key in keys]
+
+    def _refill(self, state, now):
+        elapsed = now - state.refilled_at
+        state.tokens = min(
+            self.queries_per_second, state.tokens + elapsed * self.queries_per_second
+        )
+        state.refilled_at = now
+
+    def _has_quota(self, state, today):
+        if state.day != today:
+            state.day = today
+            state.used_today = 0
+
+        return self.daily_quota is None or state.used_today < self.daily_quota
+
+    def _wait_time(self, state, now):
+        if state.cooldown_until > now:
+            return state.cooldown_until - now
+        else:
+            return (1 - state.tokens) / self.queries_per_second
+
+    def acquire(self):
+        """
+        Wait until a key may be used and return it. Raises
+        `KeysExhaustedError` once every key has used its daily quota.
+        """
+
+        while True:
+            with self._lock:
+                now = self.clock()
+                today = self.today()
+
+                states = [s for s in self._states if self._has_quota(s, today)]
+                if not states:
+                    raise KeysExhaustedError()
+
+                ready = [s for s in states if s.cooldown_until <= now]
+                for state in ready:
+                    self._refill(state, now)
+
+                candidates = [s for s in ready if s.tokens >= 1]
+                if candidates:
+                    state = max(candidates, key=lambda s: s.tokens)
+                    state.tokens -= 1
+                    state.used_today += 1
+                    return state.key
+
+                wait = min(self._wait_time(s, now) for s in states)
+
+            self.sleep(max(wait, 0.001))
+
+    def _state(self, key):
+        return next(s for s in self._states if s.key == key)
+
+    def report_success(self, key):
+        with self._lock:
+            self._state(key).failures = 0
+
+    def report_rate_limited(self, key):
+        with self._lock:
+            state = self._state(key)
+            state.failures += 1
+            state.tokens = 0
+
+            backoff = min(self.cooldown * 2 ** (state.failures - 1), self.max_cooldown)
+            state.cooldown_until = self.clock() + backoff * random.uniform(0.5, 1)
+
+    @classmethod
+    def from_secret(cls, secret):
+        options = {
+            k: v for k, v in secret.options.items()
+            if k in ('queries_per_second', 'daily_quota', 'cooldown', 'max_cooldown')
+        }
+
+        return cls(secret.all_keys, **options)
 
 
 class Secrets:
@@ -0,0 +1,182 @@
+import multiprocessing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import unittest
+
+import numpy as np
+
+from house_finder.archive import SECONDS_PER_DAY, ListingArchive, ListingStatus
+from house_finder.evaluator import EvaluationResult, object_array
+from house_finder.objectives import Objective
+from house_finder.search import Listing
+
+
+def listing(id, price, location=(52.9, -1.5)):
+    return Listing(id, location, price, '', '', '', '', '')
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1_600_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestListingArchive(unittest.TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+        self.clock = FakeClock()
+        self.archive = ListingArchive(self.directory, clock=self.clock)
+
+    def archive_run(self, listings, query='derby', days_later=0, scores=None):
+        self.clock.now += days_later * SECONDS_PER_DAY
+
+        run = self.archive.run()
+        list(run.search(listings, query))
+
+        if scores is not None:
+            run.record_scores(scores)
+
+        run.commit()
+        return run
+
+    def test_price_drops(self):
+        self.archive_run([listing('a', 100), listing('b', 200)])
+        self.archive_run([listing('a', 90), listing('b', 200)], days_later=10)
+        self.archive_run([listing('a', 80), listing('b', 150)], days_later=40)
+
+        drops = self.archive.price_drops(days=30)
+
+        self.assertEqual(sorted(drops['listing_id']), ['a', 'b'])
+        self.assertEqual(
+            sorted(zip(drops['old_price'], drops['new_price'])), [(90, 80), (200, 150)]
+        )
+
+        self.assertEqual(list(self.archive.history('a')['price']), [100, 90, 80])
+
+    def test_time_on_market(self):
+        self.archive_run([listing('a', 100), listing('b', 200)])
+        self.archive_run([listing('a', 100)], days_later=5)
+        self.archive_run([listing('a', 100)], days_later=5)
+
+        listings = self.archive.time_on_market()
+        days = dict(zip(listings['listing_id'], listings['days']))
+        on_market = dict(zip(listings['listing_id'], listings['on_market']))
+
+        self.assertEqual(days, {'a': 10, 'b': 5})
+        self.assertEqual(on_market, {'a': True, 'b': False})
+
+        # only marked as removed once
+        self.assertEqual(
+            list(self.archive.history('b')['status']),
+            [ListingStatus.listed, ListingStatus.removed],
+        )
+
+    def test_has_changed(self):
+        run = self.archive_run([listing('a', 100), listing('b', 200)])
+        self.assertEqual(run.changed, 2)
+
+        run = self.archive_run([listing('a', 100), listing('b', 210), listing('c', 300)])
+        self.assertEqual(run.changed, 2)
+
+        self.assertFalse(self.archive.has_changed(listing('a', 100)))
+        self.assertTrue(self.archive.has_changed(listing('a', 100, (53, -1.5))))
+
+    def test_scores(self):
+        objectives = [Objective('Price'), Objective('Commute')]
+        listings = [listing('a', 100), listing('b', 200)]
+        scores = EvaluationResult(
+            object_array(listings), objectives,
+            np.array([[100, np.nan], [200, 600]]), np.full((2, 2), '', dtype=object),
+        )
+
+        self.archive_run(listings, scores=scores)
+
+        self.assertEqual(self.archive.objective_names, ['Price', 'Commute'])
+        np.testing.assert_array_equal(self.archive.history('a')['scores'], [[100, np.nan]])
+        np.testing.assert_array_equal(self.archive.history('b')['scores'], [[200, 600]])
+
+    def test_ignores_uncommitted_writes(self):
+        self.archive_run([listing('a', 100)])
+
+        with open(self.directory / 'rows.price.bin', 'ab') as file:
+            file.write(b'\0' * 64)
+        with open(self.directory / 'listing_ids.txt', 'a') as file:
+            file.write('z\n')
+
+        archive = ListingArchive(self.directory, clock=self.clock)
+        self.assertEqual(len(archive), 1)
+        self.assertEqual(archive.listing_ids, ['a'])
+
+        self.archive = archive
+        self.archive_run([listing('b', 200)], query='burton')
+
+        self.assertEqual(len(self.archive), 2)
+        self.assertEqual(list(self.archive.history('b')['price']), [200])
+
+    def test_matches_a_scan(self):
+        random = np.random.RandomState(0)
+        prices = {}
+
+        for _ in range(5):
+            listings = [
+                listing(str(i), int(random.choice([100, 110, 120])))
+                for i in random.choice(300, size=200, replace=False)
+            ]
+            self.archive_run(listings, days_later=3)
+
+            for l in listings:
+                prices.setdefault(l.id, []).append((self.clock.now, l.price))
+
+        expected = sorted(
+            (listing_id, now)
+            for listing_id, history in prices.items()
+            for (_, before), (now, after) in zip(history, history[1:])
+            if after < before
+        )
+
+        drops = self.archive.price_drops(days=30)
+        self.assertEqual(sorted(zip(drops['listing_id'], drops['timestamp'])), expected)
+
+    def test_archives_opened_before_other_commits(self):
+        self.archive_run([listing('1', 100)], query='derby')
+
+        first = ListingArchive(self.directory, clock=self.clock)
+        second = ListingArchive(self.directory, clock=self.clock)
+
+        self.archive = first
+        self.archive_run([listing('2', 200)], query='burton')
+        self.archive = second
+        self.archive_run([listing('3', 300)], query='belper')
+
+        archive = ListingArchive(self.directory, clock=self.clock)
+        self.assertEqual(len(archive), 3)
+        self.assertEqual(archive.listing_ids, ['1', '2', '3'])
+        self.assertEqual(list(archive.history('2')['price']), [200])
+        self.assertEqual(list(archive.history('3')['price']), [300])
+
+    def test_concurrent_processes(self):
+        with multiprocessing.get_context('spawn').Pool(4) as pool:
+            pool.starmap(archive_runs, [(str(self.directory), i) for i in range(4)])
+
+        archive = ListingArchive(self.directory, clock=self.clock)
+        self.assertEqual(len(archive), 4 * 10)
+        self.assertEqual(len(archive.meta['runs']), 4 * 10)
+        self.assertEqual(
+            list(archive.history('3')['price']), list(range(0, 100, 10))
+        )
+
+
+def archive_runs(directory, process):
+    archive = ListingArchive(directory)
+
+    for i in range(10):
+        run = archive.run()
+        list(run.search([listing(str(process), i * 10)], f'query {process}'))
+        run.commit()
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+import unittest
+
+import numpy as np
+
+from house_finder.batch import BatchEvaluator, Spec
+from house_finder.objectives import Cost, Objective
+
+
+class CountingObjective(Objective):
+
+    def __init__(self, name, maximum=None):
+        super().__init__(name, maximum)
+        self.definition = {'name': name, 'maximum': maximum}
+        self.calculated = []
+
+    def calculate(self, listing):
+        self.calculated.append(listing.id)
+        return getattr(listing, self.name)
+
+    def estimate_cost(self, listings):
+        return Cost.local if self.name == 'price' else Cost.network
+
+    def present(self, score):
+        return str(score)
+
+
+def listing(id, price, time):
+    return SimpleNamespace(id=id, address=id, location=(0, 0), price=price, time=time)
+
+
+LISTINGS = {
+    'derby': [listing('a', 500, 10), listing('b', 900, 20)],
+    'burton': [listing('b', 900, 20), listing('c', 600, 30)],
+}
+
+
+class TestBatchEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        # the travel time objective is shared, the price objectives are not
+        self.time_objectives = [CountingObjective('time'), CountingObjective('time')]
+        self.specs = [
+            Spec('derby', 'derby', [CountingObjective('price', 1000), self.time_objectives[0]]),
+            Spec('burton', 'burton', [CountingObjective('price', 800), self.time_objectives[1]]),
+        ]
+
+        self.results = BatchEvaluator(self.specs)(lambda query: LISTINGS[query])
+
+    def test_shares_work(self):
+        calculated = self.time_objectives[0].calculated + self.time_objectives[1].calculated
+
+        # b is too expensive for burton, but still needed by derby
+        self.assertEqual(sorted(calculated), ['a', 'b', 'c'])
+
+    def test_splits_results(self):
+        derby, burton = self.results['derby'], self.results['burton']
+
+        self.assertEqual([l.id for l in derby.listings], ['a', 'b'])
+        np.testing.assert_array_equal(derby.score_matrix, [[500, 10], [900, 20]])
+
+        self.assertEqual([l.id for l in burton.listings], ['b', 'c'])
+        np.testing.assert_array_equal(burton.score_matrix, [[900, 20], [600, 30]])
+        self.assertEqual(list(burton.satisfies_constraints), [False, True])
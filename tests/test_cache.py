@@ -0,0 +1,291 @@
+import multiprocessing
+from pathlib import Path
+import pickle
+import shelve
+import sqlite3
+from tempfile import TemporaryDirectory
+import unittest
+
+from house_finder.cache import Cache, LRUCache, SQLiteDictCache
+
+
+class TestSQLiteDictCache(unittest.TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_dict_keys(self):
+        cache = SQLiteDictCache(':memory:')
+
+        cache[{'a': 1, 'b': 2}] = (1.5, 2.5)
+
+        self.assertIn({'b': 2, 'a': 1}, cache)
+        self.assertEqual(cache[{'b': 2, 'a': 1}], (1.5, 2.5))
+        self.assertNotIn({'a': 1}, cache)
+
+        with self.assertRaises(KeyError):
+            cache[{'a': 1}]
+
+    def test_delete(self):
+        cache = SQLiteDictCache(':memory:')
+
+        cache['a'] = 1
+        del cache['a']
+
+        self.assertEqual(len(cache), 0)
+
+        with self.assertRaises(KeyError):
+            del cache['a']
+
+    def test_batches_writes(self):
+        filename = str(self.directory / 'data.sqlite')
+        cache = SQLiteDictCache(filename, batch_size=3)
+        other = SQLiteDictCache(filename)
+
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(len(other), 0)
+
+        cache['c'] = 3
+        self.assertEqual(len(other), 3)
+
+        cache['d'] = 4
+        cache.close()
+        self.assertEqual(other['d'], 4)
+
+        other.close()
+
+    def test_migrate_from_shelve(self):
+        filename = str(self.directory / 'data.db')
+
+        with shelve.open(filename) as shelf:
+            shelf['{"latitude_longitude": "Derby"}'] = (52.9, -1.5)
+            shelf['plain'] = 'value'
+
+        cache = SQLiteDictCache(':memory:')
+
+        self.assertEqual(cache.migrate_from_shelve(filename), 2)
+        self.assertEqual(cache[{'latitude_longitude': 'Derby'}], (52.9, -1.5))
+        self.assertEqual(cache['plain'], 'value')
+
+    def test_front_cache(self):
+        filename = str(self.directory / 'data.sqlite')
+        cache = SQLiteDictCache(filename, batch_size=1)
+        other = SQLiteDictCache(filename)
+
+        cache['a'] = 1
+        self.assertEqual(other['a'], 1)
+
+        # only the front cache is read once a key has been seen
+        with other.lock:
+            other.connection.execute('DELETE FROM entries')
+            other.connection.commit()
+        self.assertEqual(other['a'], 1)
+
+        cache.close()
+        other.close()
+
+    def test_concurrent_processes(self):
+        filename = str(self.directory / 'data.sqlite')
+
+        with multiprocessing.get_context('spawn').Pool(4) as pool:
+            pool.starmap(write_entries, [(filename, i) for i in range(4)])
+
+        cache = SQLiteDictCache(filename)
+        self.assertEqual(len(cache), 4 * 200)
+        self.assertEqual(cache[{'process': 3, 'entry': 199}], 199)
+        cache.close()
+
+
+def write_entries(filename, process):
+    cache = SQLiteDictCache(filename, batch_size=10)
+
+    for entry in range(200):
+        cache[{'process': process, 'entry': entry}] = entry
+
+    cache.close()
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+
+        cache.put('a', 1, 1)
+        cache.put('b', 2, 1)
+        cache.get('a')
+        cache.put('c', 3, 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_bounded_by_size(self):
+        cache = LRUCache(max_bytes=10)
+
+        cache.put('a', 1, 6)
+        cache.put('b', 2, 6)
+        cache.put('c', 3, 20)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.size, 6)
+
+
+ENTRY_SIZE = len(pickle.dumps('x' * 10, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCachePolicies(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_ttls(self):
+        cache = SQLiteDictCache(':memory:', ttls={'travel_time': 10}, clock=self.clock)
+
+        cache[{'travel_time': 1}] = 1
+        cache[{'latitude_longitude': 1}] = 1
+        cache.flush()
+
+        self.clock.now += 11
+
+        self.assertNotIn({'travel_time': 1}, cache)
+        self.assertIn({'latitude_longitude': 1}, cache)
+
+        self.assertEqual(cache.stats()['travel_time']['expired'], 1)
+        self.assertEqual(cache.remove_expired(), 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_lru_eviction(self):
+        cache = SQLiteDictCache(':memory:', max_bytes=2 * ENTRY_SIZE, clock=self.clock)
+
+        for key in 'abc':
+            cache[key] = 'x' * 10
+            self.clock.now += 1
+
+        cache['a']
+        cache['d'] = 'x' * 10
+
+        self.assertEqual(cache.evict(), 2)
+        self.assertEqual(sorted(cache), ['a', 'd'])
+
+    def test_lfu_eviction(self):
+        cache = SQLiteDictCache(
+            ':memory:', max_bytes=2 * ENTRY_SIZE, eviction_policy='lfu', clock=self.clock
+        )
+
+        for key in 'abc':
+            cache[key] = 'x' * 10
+        cache.flush()
+
+        for key in 'aab':
+            cache[key]
+            self.clock.now += 1
+
+        cache.compact()
+        self.assertEqual(sorted(cache), ['a', 'b'])
+
+    def test_stats(self):
+        with TemporaryDirectory() as directory:
+            filename = str(Path(directory) / 'data.sqlite')
+
+            writer = SQLiteDictCache(filename)
+            writer[{'travel_time': 1}] = 1
+            writer.close()
+
+            cache = SQLiteDictCache(filename)
+            cache[{'travel_time': 1}]
+            self.assertNotIn({'travel_time': 2}, cache)
+
+            stats = cache.stats()['travel_time']
+            self.assertEqual(stats['entries'], 1)
+            self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+            cache.close()
+
+    def test_stats_ignore_reading_back_writes(self):
+        cache = SQLiteDictCache(':memory:', batch_size=1)
+
+        cache[{'travel_time': 1}] = 1
+        cache[{'travel_time': 1}]
+        cache.contains({'travel_time': 2}, record=False)
+
+        stats = cache.stats()['travel_time']
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+
+    def test_migrates_schema(self):
+        with TemporaryDirectory() as directory:
+            filename = str(Path(directory) / 'data.sqlite')
+
+            connection = sqlite3.connect(filename)
+            connection.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+            connection.execute(
+                'INSERT INTO entries VALUES (?, ?)',
+                ('{"travel_time":1}', pickle.dumps(5)),
+            )
+            connection.commit()
+            connection.close()
+
+            cache = SQLiteDictCache(filename)
+
+            self.assertEqual(cache[{'travel_time': 1}], 5)
+            self.assertEqual(cache.stats()['travel_time']['entries'], 1)
+            self.assertEqual(
+                cache.connection.execute('PRAGMA user_version').fetchone()[0],
+                SQLiteDictCache.schema_version,
+            )
+
+            cache.close()
+
+    def test_read_only(self):
+        with TemporaryDirectory() as directory:
+            filename = str(Path(directory) / 'data.sqlite')
+
+            cache = SQLiteDictCache(filename)
+            cache[{'travel_time': 1}] = 5
+            cache.close()
+
+            cache = Cache.read_only_data(directory)
+
+            self.assertEqual(cache[{'travel_time': 1}], 5)
+            self.assertNotIn({'travel_time': 2}, cache)
+
+            stats = cache.stats()['travel_time']
+            self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+
+            cache[{'travel_time': 2}] = 6
+            with self.assertRaises(sqlite3.OperationalError):
+                cache.flush()
+
+            cache.pending.clear()
+            cache.close()
+
+    def test_read_only_does_not_migrate(self):
+        with TemporaryDirectory() as directory:
+            filename = str(Path(directory) / 'data.sqlite')
+
+            connection = sqlite3.connect(filename)
+            connection.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL)')
+            connection.commit()
+            connection.close()
+
+            with self.assertRaises(ValueError):
+                SQLiteDictCache(filename, read_only=True)
+
+            connection = sqlite3.connect(filename)
+            self.assertEqual(connection.execute('PRAGMA user_version').fetchone()[0], 0)
+            connection.close()
+
+    def test_evaluation_ttl(self):
+        self.assertLessEqual(Cache.ttls['evaluation'], Cache.ttls['travel_time'])
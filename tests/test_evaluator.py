@@ -1,16 +1,29 @@
 from collections import OrderedDict
+from types import SimpleNamespace
 import unittest
 
-from house_finder.evaluator import EvaluatedListing, ParetoFront
+import numpy as np
+
+from house_finder.cache import SQLiteDictCache
+from house_finder.evaluator import (
+    NOT_COMPUTED, EvaluatedListing, EvaluationStore, Evaluator, Score
+)
+from house_finder.objectives import Cost, Objective
+from house_finder.search import Listing
+from house_finder.outputs.filters import ParetoFront
+
+
+def scores(**values):
+    return OrderedDict((k, Score(v, str(v))) for k, v in values.items())
 
 
 class TestParetoFront(unittest.TestCase):
 
     def test_works(self):
-        in_pareto_1 = EvaluatedListing(None, OrderedDict(x=0, y=0), constraints={})
-        in_pareto_2 = EvaluatedListing(None, OrderedDict(x=1, y=0), constraints={})
-        in_pareto_3 = EvaluatedListing(None, OrderedDict(x=0, y=1), constraints={})
-        not_in_pareto = EvaluatedListing(None, OrderedDict(x=1, y=1), constraints={})
+        in_pareto_1 = EvaluatedListing(None, scores(x=0, y=0), constraints={})
+        in_pareto_2 = EvaluatedListing(None, scores(x=1, y=0), constraints={})
+        in_pareto_3 = EvaluatedListing(None, scores(x=0, y=1), constraints={})
+        not_in_pareto = EvaluatedListing(None, scores(x=1, y=1), constraints={})
 
         evaluated_listings = [
             in_pareto_1, in_pareto_2, in_pareto_3, not_in_pareto,
@@ -23,3 +36,185 @@ class TestParetoFront(unittest.TestCase):
         self.assertIn(in_pareto_2, results)
         self.assertIn(in_pareto_3, results)
         self.assertNotIn(not_in_pareto, results)
+
+
+class FakeObjective(Objective):
+
+    def __init__(self, name, maximum=None):
+        super().__init__(name, maximum)
+
+    def calculate(self, listing):
+        return getattr(listing, self.name)
+
+    def present(self, score):
+        return f'{score}!'
+
+
+class TestEvaluationResult(unittest.TestCase):
+
+    def setUp(self):
+        self.objectives = [FakeObjective('x', maximum=10), FakeObjective('y')]
+        self.listings = [
+            SimpleNamespace(address='a', location=(0, 0), x=1, y=2),
+            SimpleNamespace(address='b', location=(1, 1), x=20, y=2),
+            SimpleNamespace(address='c', location=(2, 2), x=3, y=None),
+        ]
+
+        self.result = Evaluator(self.listings, self.objectives).result
+
+    def test_score_matrix(self):
+        np.testing.assert_array_equal(
+            self.result.score_matrix, [[1, 2], [20, np.nan], [3, np.nan]]
+        )
+        np.testing.assert_array_equal(
+            self.result.computed, [[True, True], [True, False], [True, True]]
+        )
+
+    def test_filters(self):
+        self.assertEqual(list(self.result.is_valid), [True, False, False])
+        self.assertEqual(list(self.result.satisfies_constraints), [True, False, False])
+
+        valid = self.result[self.result.is_valid & self.result.satisfies_constraints]
+        self.assertEqual(len(valid), 1)
+        self.assertIs(valid[0].listing, self.listings[0])
+
+    def test_views(self):
+        evaluated_listing = self.result[2]
+
+        self.assertEqual(str(evaluated_listing.scores['x']), '3!')
+        self.assertIsNone(evaluated_listing.scores['y'])
+
+        self.assertIs(self.result[1].scores['y'], NOT_COMPUTED)
+        self.assertIs(self.result[[0, 1]][1].scores['y'], NOT_COMPUTED)
+
+    def test_locations(self):
+        np.testing.assert_array_equal(self.result.locations, [[0, 0], [1, 1], [2, 2]])
+
+
+class LocalObjective(FakeObjective):
+
+    def __init__(self, name, maximum=None):
+        super().__init__(name, maximum)
+        self.calculated = []
+
+    def calculate(self, listing):
+        self.calculated.append(listing.address)
+        return super().calculate(listing)
+
+    def estimate_cost(self, listings):
+        return Cost.local
+
+
+class NetworkObjective(LocalObjective):
+
+    def estimate_cost(self, listings):
+        return Cost.network
+
+
+class TestLazyEvaluation(unittest.TestCase):
+
+    def test_short_circuits_on_constraints(self):
+        network = NetworkObjective('y')
+        local = LocalObjective('x', maximum=10)
+
+        listings = [
+            SimpleNamespace(address='a', location=(0, 0), x=1, y=2),
+            SimpleNamespace(address='b', location=(1, 1), x=20, y=2),
+        ]
+
+        evaluated_listings = Evaluator(listings, [network, local])
+
+        self.assertEqual(local.calculated, ['a', 'b'])
+        self.assertEqual(network.calculated, ['a'])
+        self.assertEqual(list(evaluated_listings[1].scores), ['y', 'x'])
+        self.assertIs(evaluated_listings[1].scores['y'], NOT_COMPUTED)
+
+    def test_short_circuits_on_missing_scores(self):
+        first = LocalObjective('x')
+        second = NetworkObjective('y')
+
+        Evaluator([SimpleNamespace(address='a', location=(0, 0), x=None, y=2)], [first, second])
+
+        self.assertEqual(second.calculated, [])
+
+
+class CountingObjective(FakeObjective):
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.definition = {'name': name}
+        self.calculated = []
+
+    def calculate(self, listing):
+        self.calculated.append(listing.id)
+        return super().calculate(listing)
+
+
+class BulkObjective(FakeObjective):
+
+    supports_calculate_many = True
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.batches = []
+
+    def calculate(self, listing):
+        raise AssertionError('calculate should not be called')
+
+    def calculate_many(self, listings):
+        self.batches.append(len(listings))
+        return [getattr(listing, self.name) for listing in listings]
+
+
+class TestCalculateMany(unittest.TestCase):
+
+    def test_uses_bulk_path(self):
+        objective = BulkObjective('x')
+        listings = [
+            SimpleNamespace(address=str(x), location=(0, 0), x=x) for x in [1, None, 3]
+        ]
+
+        result = Evaluator(listings, [objective], workers=4).result
+
+        self.assertEqual(objective.batches, [3])
+        np.testing.assert_array_equal(result.score_matrix, [[1], [np.nan], [3]])
+
+
+class TestEvaluationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = EvaluationStore(SimpleNamespace(data=SQLiteDictCache(':memory:')))
+
+    def listing(self, id, x):
+        return Listing(id, (0, 0), x, '', '', '', '', '')
+
+    def test_reuses_scores(self):
+        listings = [self.listing('a', 1), self.listing('b', 2)]
+
+        Evaluator(listings, [CountingObjective('price')], store=self.store)
+
+        objective = CountingObjective('price')
+        result = Evaluator(
+            [self.listing('a', 1), self.listing('b', 3)], [objective], store=self.store
+        ).result
+
+        self.assertEqual(objective.calculated, ['b'])
+        self.assertEqual(list(result.column('price')), [1, 3])
+
+    def test_changed_objective(self):
+        Evaluator([self.listing('a', 1)], [CountingObjective('price')], store=self.store)
+
+        objective = CountingObjective('price')
+        objective.definition = {'name': 'price', 'maximum': 10}
+        Evaluator([self.listing('a', 1)], [objective], store=self.store)
+
+        self.assertEqual(objective.calculated, ['a'])
+
+    def test_changed_routing(self):
+        Evaluator([self.listing('a', 1)], [CountingObjective('price')], store=self.store)
+
+        self.store.routing = {'backend': 'OfflineTravelTimeBackend', 'config': {'graph': 'derby.osm'}}
+        objective = CountingObjective('price')
+        Evaluator([self.listing('a', 1)], [objective], store=self.store)
+
+        self.assertEqual(objective.calculated, ['a'])
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+import unittest
+
+import numpy as np
+
+from house_finder.evaluator import EvaluatedListing, EvaluationResult, Score, object_array
+from house_finder.objectives import Objective
+from house_finder.outputs.filters import (
+    RankEvaluator, ScalarisedRankEvaluator, ScoreStatistics, TopK,
+    non_dominated_sort, scalarise,
+)
+
+
+def evaluated_listing(**scores):
+    return EvaluatedListing(
+        None,
+        OrderedDict((k, Score(v, str(v))) for k, v in scores.items()),
+        constraints={},
+    )
+
+
+class TestNonDominatedSort(unittest.TestCase):
+
+    def test_fronts(self):
+        fronts = non_dominated_sort(np.array([
+            [0, 0], [1, 0], [0, 1], [1, 1], [2, 2], [3, 0],
+        ], dtype=float))
+
+        self.assertEqual(list(fronts), [0, 0, 0, 1, 2, 0])
+
+    def test_matches_repeated_pareto_fronts(self):
+        table = np.random.RandomState(0).randint(0, 20, size=(300, 3)).astype(float)
+        fronts = non_dominated_sort(table)
+
+        remaining = np.arange(len(table))
+        front = 0
+
+        while remaining.size:
+            is_pareto = np.ones(remaining.size, dtype=bool)
+            for i, c in enumerate(table[remaining]):
+                if is_pareto[i]:
+                    is_pareto[is_pareto] = np.any(table[remaining][is_pareto] <= c, axis=1)
+
+            self.assertTrue(np.all(fronts[remaining[is_pareto]] == front))
+            remaining = remaining[~is_pareto]
+            front += 1
+
+
+class TestRankEvaluator(unittest.TestCase):
+
+    def test_ranks(self):
+        best = evaluated_listing(x=0, y=0)
+        worst = evaluated_listing(x=1, y=1)
+
+        self.assertEqual(list(RankEvaluator([worst, best])), [[best], [worst]])
+
+    def test_empty(self):
+        self.assertEqual(len(RankEvaluator([])), 0)
+
+
+def objective(name, weight=1, closest_to=None, maximum=None):
+    objective = Objective(name, maximum)
+    objective.weight = weight
+    objective.closest_to = closest_to
+    return objective
+
+
+def result(score_table, objectives):
+    score_table = np.asarray(score_table, dtype=float)
+
+    return EvaluationResult(
+        object_array(list(range(len(score_table)))), objectives,
+        score_table, score_table.astype(str).astype(object),
+    )
+
+
+class TestScalarise(unittest.TestCase):
+
+    def setUp(self):
+        self.table = np.array([[0, 100], [10, 0], [5, 50]], dtype=float)
+
+    def test_weighted_sum(self):
+        objectives = [objective('x', weight=2), objective('y')]
+        statistics = ScoreStatistics.of(self.table)
+
+        costs = scalarise(self.table, objectives, statistics)
+
+        np.testing.assert_allclose(costs, [1, 2, 1.5])
+
+    def test_chebyshev(self):
+        objectives = [objective('x', weight=2), objective('y')]
+        statistics = ScoreStatistics.of(self.table)
+
+        costs = scalarise(self.table, objectives, statistics, 'chebyshev')
+
+        np.testing.assert_allclose(costs, [1, 2, 1])
+
+    def test_closest_to(self):
+        objectives = [objective('x', closest_to=10), objective('y', weight=0)]
+        statistics = ScoreStatistics.of(np.abs(self.table - [10, 0]))
+
+        costs = scalarise(self.table, objectives, statistics)
+
+        self.assertEqual(list(np.argsort(costs)), [1, 2, 0])
+
+    def test_zscore(self):
+        statistics = ScoreStatistics.of(self.table)
+        normalised = statistics.normalise(self.table, 'zscore')
+
+        np.testing.assert_allclose(normalised.mean(axis=0), 0, atol=1e-12)
+        np.testing.assert_allclose(normalised.std(axis=0), 1)
+
+    def test_statistics_in_chunks(self):
+        table = np.random.RandomState(0).uniform(0, 100, size=(250, 3))
+
+        statistics = ScoreStatistics(3)
+        for chunk in np.array_split(table, 7):
+            statistics.update(chunk)
+
+        np.testing.assert_allclose(statistics.mean, table.mean(axis=0))
+        np.testing.assert_allclose(statistics.standard_deviation, table.std(axis=0))
+        np.testing.assert_allclose(statistics.minimum, table.min(axis=0))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            scalarise(self.table, [objective('x'), objective('y')],
+                      ScoreStatistics.of(self.table), 'unknown')
+
+
+class TestTopK(unittest.TestCase):
+
+    def setUp(self):
+        self.objectives = [objective('x', weight=2), objective('y', maximum=90)]
+
+    def test_streams(self):
+        table = np.random.RandomState(0).uniform(0, 100, size=(1000, 2))
+        everything = result(table, self.objectives)
+
+        top = TopK(self.objectives, 10)
+        for start in range(0, len(table), 100):
+            top.extend(everything[start:start + 100])
+
+        self.assertEqual(len(top), 10)
+        self.assertEqual(top.seen, 1000)
+
+        # the same as ranking every listing which satisfies its constraints
+        satisfied = everything[everything.satisfies_constraints]
+        expected = [r.listings[0] for r in list(ScalarisedRankEvaluator(satisfied))[:10]]
+        self.assertEqual([r.listings[0] for r in top.ranked()], expected)
+
+    def test_drops_invalid(self):
+        top = TopK(self.objectives, 5)
+        top.extend(result([[1, np.nan], [1, 95], [2, 2]], self.objectives))
+
+        self.assertEqual(list(top.result.listings), [2])
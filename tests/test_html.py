@@ -0,0 +1,61 @@
+import io
+import json
+import re
+from types import SimpleNamespace
+import unittest
+
+import numpy as np
+
+from house_finder.evaluator import EvaluationResult, object_array
+from house_finder.objectives import Objective
+from house_finder.outputs.filters import RankEvaluator
+from house_finder.outputs.html import listings_payload, render_html
+
+
+class TestRenderHtml(unittest.TestCase):
+
+    def setUp(self):
+        self.objectives = [Objective('x'), Objective('y')]
+
+        listings = object_array([
+            SimpleNamespace(
+                location=(52.9, -1.5), address='1 </script> Street',
+                url='http://example.com/1', image_url='http://example.com/1.jpg',
+            ),
+            SimpleNamespace(
+                location=(52.8, -1.4), address='2 Example Street',
+                url='http://example.com/2', image_url='http://example.com/2.jpg',
+            ),
+        ])
+
+        result = EvaluationResult(
+            listings, self.objectives,
+            np.array([[1.0, 2.0], [2.0, 3.0]]),
+            np.array([['1!', '2!'], ['2!', '3!']], dtype=object),
+        )
+
+        self.ranked = RankEvaluator(result)
+
+    def test_payload(self):
+        payload = listings_payload(self.ranked, self.objectives)
+
+        self.assertNotIn('</script>', payload)
+        self.assertEqual(json.loads(payload), {
+            'objectives': ['x', 'y'],
+            'listings': [
+                [52.9, -1.5, 0, '1 </script> Street', 'http://example.com/1',
+                 'http://example.com/1.jpg', ['1!', '2!']],
+                [52.8, -1.4, 1, '2 Example Street', 'http://example.com/2',
+                 'http://example.com/2.jpg', ['2!', '3!']],
+            ],
+        })
+
+    def test_render(self):
+        file = io.StringIO()
+        render_html({'google': SimpleNamespace(key='key')}, self.ranked, self.objectives, file)
+
+        html = file.getvalue()
+        payload = re.search(r'<script type="application/json" id="listings">(.*?)</script>', html)
+
+        self.assertEqual(len(json.loads(payload.group(1))['listings']), 2)
+        self.assertIn('2 Example Street', html)
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+import unittest
+
+import numpy as np
+
+from house_finder.cache import SQLiteDictCache
+from house_finder.isochrone import Isochrone, IsochroneFinder
+from house_finder.objectives.travel_time import Direction, SingleTravelTimeObjective
+
+
+class TestIsochrone(unittest.TestCase):
+
+    def setUp(self):
+        # a square roughly 1.1km across
+        self.isochrone = Isochrone([(0, 0), (0.01, 0), (0.01, 0.01), (0, 0.01)])
+
+    def test_contains(self):
+        np.testing.assert_array_equal(
+            self.isochrone.contains([(0.005, 0.005), (0.02, 0.005), (0.005, -0.001)]),
+            [True, False, False],
+        )
+
+    def test_margin(self):
+        np.testing.assert_array_equal(
+            self.isochrone.contains([(0.005, -0.001), (0.005, -0.01)], margin=200),
+            [True, False],
+        )
+
+
+class FakeMaps:
+    """
+    Travel times of a second per metre east of zero longitude, and none at all
+    to the west.
+    """
+
+    travel_time_backend = None
+    routing_key = 'google'
+
+    def __init__(self):
+        self.one_to_many_calls = []
+        self.find_isochrone = IsochroneFinder(
+            self, SimpleNamespace(data=SQLiteDictCache(':memory:'))
+        )
+
+    def calculate_one_to_many_travel_times(self, location, others, mode, arrival_time=None, departure_time=None, reverse=False):
+        self.one_to_many_calls.append(len(others))
+        return [
+            other[1] * 111_320 if other[1] >= -1e-9 else None
+            for other in others
+        ]
+
+
+class TestIsochroneFinder(unittest.TestCase):
+
+    def setUp(self):
+        self.maps = FakeMaps()
+
+    def test_samples_once_and_caches(self):
+        self.maps.find_isochrone((0, 0), 'walking', 600)
+        isochrone = self.maps.find_isochrone((0, 0), 'walking', 600)
+
+        self.assertEqual(self.maps.one_to_many_calls, [16 * 8])
+        np.testing.assert_array_equal(
+            isochrone.contains([(0, 0.004), (0, 0.02), (0, -0.02)]),
+            [True, False, False],
+        )
+
+    def test_cached_per_routing(self):
+        self.maps.find_isochrone((0, 0), 'walking', 600)
+        self.maps.routing_key = {'backend': 'OfflineTravelTimeBackend', 'config': None}
+        self.maps.find_isochrone((0, 0), 'walking', 600)
+
+        self.assertEqual(self.maps.one_to_many_calls, [16 * 8, 16 * 8])
+
+    def test_objective_skips_unreachable_listings(self):
+        routed = []
+
+        def one_to_many(location, others, *args, **kwargs):
+            routed.extend(others)
+            return [1] * len(others)
+
+        objective = SingleTravelTimeObjective(
+            'work', 600, self.maps, (0, 0), Direction.from_listing, 'walking',
+            isochrone=True,
+        )
+        objective.isochrone  # sample before replacing the router
+
+        self.maps.calculate_one_to_many_travel_times = one_to_many
+
+        listings = [
+            SimpleNamespace(location=(0, 0.004)),
+            SimpleNamespace(location=(0, 0.5)),
+        ]
+
+        self.assertEqual(objective.calculate_many(listings), [1, None])
+        self.assertEqual(routed, [(0, 0.004)])
@@ -0,0 +1,123 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+import unittest
+from unittest import mock
+
+from house_finder.evaluator import Evaluator
+from house_finder.journal import RunJournal
+from house_finder.objectives import Objective
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FlakyObjective(Objective):
+    """
+    Scores listings by their number, failing once 'fail_at' is reached.
+    """
+
+    def __init__(self, name, fail_at=None):
+        super().__init__(name)
+        self.fail_at = fail_at
+        self.calculated = []
+
+    def calculate(self, listing):
+        if listing.number == self.fail_at:
+            raise Interrupted()
+
+        self.calculated.append(listing.number)
+        return listing.number
+
+    def present(self, score):
+        return str(score)
+
+
+class TestRunJournal(unittest.TestCase):
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = Path(directory.name) / 'run.journal'
+
+        self.searches = []
+
+    def search(self, query):
+        self.searches.append(query)
+        return [
+            SimpleNamespace(id=str(i), number=i, address=str(i), location=(0, 0))
+            for i in range(250)
+        ]
+
+    def start_run(self, objective, resume):
+        journal = RunJournal(self.filename, 'key', resume=resume)
+        self.addCleanup(journal.file.close)
+
+        listings = journal.search(self.search, 'query')
+        return journal, Evaluator(listings, [objective], store=journal.store())
+
+    def test_resumes(self):
+        with self.assertRaises(Interrupted):
+            self.start_run(FlakyObjective('x', fail_at=220), resume=False)
+
+        objective = FlakyObjective('x')
+        journal, evaluated_listings = self.start_run(objective, resume=True)
+
+        self.assertEqual(self.searches, ['query'])
+        self.assertEqual(objective.calculated, list(range(200, 250)))
+        self.assertEqual(len(evaluated_listings), 250)
+        self.assertEqual(evaluated_listings[219].scores['x'].value, 219)
+
+        journal.finish()
+        self.assertFalse(self.filename.exists())
+
+    def test_ignores_damaged_records(self):
+        with self.assertRaises(Interrupted):
+            self.start_run(FlakyObjective('x', fail_at=220), resume=False)
+
+        with open(self.filename, 'ab') as file:
+            file.write(b'\x80\x05\x95')
+
+        journal = RunJournal(self.filename, 'key', resume=True)
+        self.addCleanup(journal.file.close)
+
+        self.assertEqual(len(journal.scores), 200)
+        self.assertEqual(journal.searched, {'query'})
+        self.assertEqual(len(journal.listings['query']), 250)
+
+    def test_interrupted_while_resuming(self):
+        with self.assertRaises(Interrupted):
+            self.start_run(FlakyObjective('x', fail_at=220), resume=False)
+
+        def interrupt(journal, record):
+            raise Interrupted()
+
+        with mock.patch.object(RunJournal, '_write', interrupt), \
+                self.assertRaises(Interrupted):
+            RunJournal(self.filename, 'key', resume=True)
+
+        journal = RunJournal(self.filename, 'key', resume=True)
+        self.addCleanup(journal.file.close)
+
+        self.assertEqual(len(journal.scores), 200)
+        self.assertEqual(len(journal.listings['query']), 250)
+
+    def test_restarts_unfinished_searches(self):
+        with self.assertRaises(Interrupted):
+            self.start_run(FlakyObjective('x', fail_at=120), resume=False)
+
+        objective = FlakyObjective('x')
+        self.start_run(objective, resume=True)
+
+        self.assertEqual(self.searches, ['query', 'query'])
+        self.assertEqual(objective.calculated, list(range(100, 250)))
+
+    def test_different_inputs(self):
+        with self.assertRaises(Interrupted):
+            self.start_run(FlakyObjective('x', fail_at=120), resume=False)
+
+        journal = RunJournal(self.filename, 'other key', resume=True)
+        self.addCleanup(journal.file.close)
+
+        self.assertEqual(journal.scores, {})
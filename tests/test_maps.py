@@ -0,0 +1,276 @@
+from types import SimpleNamespace
+import unittest
+
+import googlemaps
+
+from house_finder.cache import CacheStatistics, SQLiteDictCache
+from house_finder.maps import (
+    AreaPlacesFinder, Maps, TravelTimeCalulator, TravelTimeMatrixCalculator,
+    quantise_location,
+)
+from house_finder.secrets import KeysExhaustedError, Secret
+
+
+class FakeGoogleMaps:
+
+    def __init__(self):
+        self.calls = []
+
+    def distance_matrix(self, origins, destinations, **kwargs):
+        self.calls.append((origins, destinations, kwargs))
+
+        return {
+            'rows': [
+                {
+                    'elements': [
+                        {'status': 'OK', 'duration': {'value': int(o[0] + d[0])}}
+                        for d in destinations
+                    ]
+                }
+                for o in origins
+            ]
+        }
+
+
+class FakeMaps:
+
+    def __init__(self, cache, statistics):
+        self.gmaps = FakeGoogleMaps()
+        self.calculate_travel_time = TravelTimeCalulator(self, cache, statistics)
+
+    def query(self, function, name=None):
+        return function(self.gmaps)
+
+
+def params(origin, destination, mode='transit'):
+    return {
+        'origin': origin,
+        'destination': destination,
+        'mode': mode,
+        'arrival_time': None,
+        'departure_time': None,
+    }
+
+
+class TestTravelTimeMatrixCalculator(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SimpleNamespace(data=SQLiteDictCache(':memory:'))
+        self.statistics = CacheStatistics()
+        self.maps = FakeMaps(self.cache, self.statistics)
+        self.calculator = TravelTimeMatrixCalculator(self.maps, self.cache, self.statistics)
+
+    def test_fills_cache(self):
+        self.calculator([
+            params((1, 0), (100, 0)),
+            params((2, 0), (100, 0)),
+        ])
+
+        self.assertEqual(len(self.maps.gmaps.calls), 1)
+        self.assertEqual(self.maps.calculate_travel_time(**params((1, 0), (100, 0))), 101)
+        self.assertEqual(self.maps.calculate_travel_time(**params((2, 0), (100, 0))), 102)
+
+    def test_chunks_requests(self):
+        self.calculator(params((i, 0), (1000, 0)) for i in range(60))
+
+        self.assertEqual(
+            [len(origins) for origins, _, _ in self.maps.gmaps.calls],
+            [25, 25, 10],
+        )
+
+    def test_packs_distinct_destinations(self):
+        self.calculator(params((i, 0), (1000 + i, 0)) for i in range(50))
+
+        self.assertEqual(len(self.maps.gmaps.calls), 5)
+        for origins, destinations, _ in self.maps.gmaps.calls:
+            self.assertLessEqual(len(origins) * len(destinations), 100)
+
+        self.assertEqual(self.maps.calculate_travel_time(**params((49, 0), (1049, 0))), 1098)
+
+    def test_packs_a_grid(self):
+        self.calculator(params((i, 0), (1000 + j, 0)) for i in range(10) for j in range(5))
+
+        origins, destinations, _ = self.maps.gmaps.calls[0]
+        self.assertEqual(len(self.maps.gmaps.calls), 1)
+        self.assertEqual((len(origins), len(destinations)), (10, 5))
+
+    def test_fixes_smallest_side(self):
+        self.calculator(params((0, 0), (i, 0)) for i in range(10))
+
+        origins, destinations, _ = self.maps.gmaps.calls[0]
+        self.assertEqual(len(self.maps.gmaps.calls), 1)
+        self.assertEqual(len(origins), 1)
+        self.assertEqual(len(destinations), 10)
+
+    def test_groups_by_mode(self):
+        self.calculator([
+            params((1, 0), (100, 0), mode='transit'),
+            params((1, 0), (100, 0), mode='walking'),
+        ])
+
+        modes = {kwargs['mode'] for _, _, kwargs in self.maps.gmaps.calls}
+        self.assertEqual(modes, {'transit', 'walking'})
+
+    def test_skips_cached(self):
+        self.cache.data[{'travel_time': params((1, 0), (100, 0))}] = 5
+        self.calculator([params((1, 0), (100, 0)), params((2, 0), (100, 0))])
+        self.calculator([params((1, 0), (100, 0)), params((2, 0), (100, 0))])
+
+        origins, _, _ = self.maps.gmaps.calls[0]
+        self.assertEqual(len(self.maps.gmaps.calls), 1)
+        self.assertEqual(origins, [(2, 0)])
+        self.assertEqual(self.maps.calculate_travel_time(**params((1, 0), (100, 0))), 5)
+
+    def test_statistics(self):
+        self.calculator([
+            params((1, 0), (100, 0)),
+            params((1, 0), (100, 0)),
+            params((2, 0), (100, 0)),
+        ])
+
+        self.assertEqual(self.statistics.hits, 1)
+        self.assertEqual(self.statistics.misses, 2)
+
+    def test_statistics_count_each_request_once(self):
+        self.cache.data[{'travel_time': params((1, 0), (100, 0))}] = 5
+        self.calculator([params((1, 0), (100, 0)), params((2, 0), (100, 0))])
+
+        self.maps.calculate_travel_time(**params((1, 0), (100, 0)))
+        self.maps.calculate_travel_time(**params((2, 0), (100, 0)))
+        self.assertEqual((self.statistics.hits, self.statistics.misses), (1, 1))
+
+        self.maps.calculate_travel_time(**params((1, 0), (100, 0)))
+        self.assertEqual((self.statistics.hits, self.statistics.misses), (2, 1))
+
+    def test_cold_run_has_no_hits(self):
+        locations = [(i, 0) for i in range(10)]
+
+        self.maps.calculate_travel_time.is_cached(**params(locations[0], (100, 0)))
+        self.calculator.one_to_many((100, 0), locations, 'transit', reverse=True)
+
+        stats = self.cache.data.stats()['travel_time']
+        self.assertEqual((stats['hits'], stats['misses']), (0, 10))
+
+    def test_one_to_many(self):
+        times = self.calculator.one_to_many((100, 0), [(1, 0), (2, 0)], 'transit')
+
+        self.assertEqual(times, [101, 102])
+        self.assertEqual(len(self.maps.gmaps.calls), 1)
+
+    def test_one_to_many_reverse(self):
+        self.calculator.one_to_many((100, 0), [(1, 0), (2, 0)], 'transit', reverse=True)
+
+        origins, destinations, _ = self.maps.gmaps.calls[0]
+        self.assertEqual(origins, [(1, 0), (2, 0)])
+        self.assertEqual(destinations, [(100, 0)])
+
+
+class TestQuantiseLocation(unittest.TestCase):
+
+    def test_nearby_locations_share_a_cell(self):
+        self.assertEqual(
+            quantise_location((52.91940, -1.47300), 50),
+            quantise_location((52.91945, -1.47305), 50),
+        )
+
+    def test_snaps_within_radius(self):
+        latitude, longitude = quantise_location((52.91940, -1.47300), 50)
+
+        self.assertAlmostEqual(latitude, 52.91940, delta=50 / 111_320)
+        self.assertAlmostEqual(longitude, -1.47300, delta=50 / 111_320 * 2)
+
+
+class RateLimitedGoogleMaps:
+
+    def __init__(self, key, failures):
+        self.key = key
+        self.failures = failures
+
+    def geocode(self, query):
+        if self.failures:
+            self.failures -= 1
+            raise googlemaps.exceptions._OverQueryLimit('OVER_QUERY_LIMIT', '')
+
+        return self.key
+
+
+class TestMaps(unittest.TestCase):
+
+    def setUp(self):
+        self.maps = Maps(
+            Secret(['AIza-1', 'AIza-2'], {'queries_per_second': 1000, 'cooldown': 0.01}),
+            SimpleNamespace(data={}),
+        )
+
+    def test_query_retries_on_rate_limit(self):
+        self.maps._clients = {
+            'AIza-1': RateLimitedGoogleMaps('AIza-1', failures=1000),
+            'AIza-2': RateLimitedGoogleMaps('AIza-2', failures=1),
+        }
+
+        results = {self.maps.query(lambda gmaps: gmaps.geocode('Derby')) for _ in range(4)}
+
+        self.assertEqual(results, {'AIza-2'})
+
+    def test_query_gives_up_when_always_rate_limited(self):
+        self.maps.max_rate_limited_attempts = 4
+        self.maps._clients = {
+            'AIza-1': RateLimitedGoogleMaps('AIza-1', failures=1000),
+            'AIza-2': RateLimitedGoogleMaps('AIza-2', failures=1000),
+        }
+
+        with self.assertRaises(KeysExhaustedError):
+            self.maps.query(lambda gmaps: gmaps.geocode('Derby'))
+
+        failures = sum(1000 - gmaps.failures for gmaps in self.maps._clients.values())
+        self.assertEqual(failures, 4)
+
+    def test_gmaps_for(self):
+        self.assertIs(self.maps.gmaps_for('AIza-1'), self.maps.gmaps_for('AIza-1'))
+        self.assertIsNot(self.maps.gmaps_for('AIza-1'), self.maps.gmaps_for('AIza-2'))
+
+
+class FakePlacesGoogleMaps:
+
+    def __init__(self, pages=1):
+        self.locations = []
+        self.pages = pages
+
+    def places_nearby(self, location, page_token=None, **kwargs):
+        self.locations.append(location)
+
+        page = 0 if page_token is None else int(page_token)
+        response = {'results': [{'place_id': f'{location}:{page}'}]}
+
+        if page + 1 < self.pages:
+            response['next_page_token'] = str(page + 1)
+
+        return response
+
+
+class TestAreaPlacesFinder(unittest.TestCase):
+
+    def setUp(self):
+        self.gmaps = FakePlacesGoogleMaps()
+        self.maps = SimpleNamespace(query=lambda function, name=None: function(self.gmaps))
+        self.finder = AreaPlacesFinder(self.maps, SimpleNamespace(data=SQLiteDictCache(':memory:')))
+        self.finder.page_delay = 0
+
+    def test_tiles_are_cached(self):
+        bounds = (52.90, -1.50), (52.91, -1.49)
+
+        first = self.finder(bounds, 'supermarket', 2000)
+        calls = len(self.gmaps.locations)
+        second = self.finder(bounds, 'supermarket', 2000)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.gmaps.locations), calls)
+        self.assertEqual(calls, 9)  # one tile padded on every side
+
+    def test_follows_pages(self):
+        self.gmaps.pages = 5
+
+        results = self.finder._search_tile((0, 0), (52.9, -1.5), 'supermarket', 2000)
+
+        self.assertEqual(len(results), AreaPlacesFinder.max_pages)
+        self.assertEqual(len(self.gmaps.locations), AreaPlacesFinder.max_pages)
@@ -0,0 +1,63 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import unittest
+
+from house_finder.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counters(self):
+        self.metrics.count('requests')
+        self.metrics.count('requests', 2)
+
+        self.assertEqual(self.metrics.summary()['counters'], {'requests': 3})
+
+    def test_hit_ratios(self):
+        self.metrics.count('cache.geocode.hits', 3)
+        self.metrics.count('cache.geocode.misses', 1)
+
+        self.assertEqual(self.metrics.summary()['hit_ratios'], {'cache.geocode': 0.75})
+
+    def test_hit_ratios_without_hits(self):
+        self.metrics.count('cache.geocode.misses', 2)
+
+        self.assertEqual(self.metrics.summary()['hit_ratios'], {'cache.geocode': 0.0})
+
+    def test_timers(self):
+        for duration in [0.0005, 0.005, 0.05, 0.5, 5, 50]:
+            self.metrics.record('query', duration)
+
+        with self.metrics.timer('query'):
+            pass
+
+        summary = self.metrics.summary()['timers']['query']
+
+        self.assertEqual(summary['count'], 7)
+        self.assertEqual(summary['max'], 50)
+        self.assertEqual(summary['histogram'], {
+            '<0.001s': 2, '<0.01s': 1, '<0.1s': 1, '<1s': 1, '<10s': 1, '>=10s': 1,
+        })
+
+    def test_spans(self):
+        self.metrics.record('query', 1)
+
+        with self.metrics.timer('query'):
+            pass
+
+        (start, end), = self.metrics.spans['query']
+        self.assertLessEqual(start, end)
+
+    def test_dump_json(self):
+        self.metrics.count('requests')
+
+        with TemporaryDirectory() as directory:
+            filename = Path(directory) / 'metrics.json'
+            self.metrics.dump_json(filename)
+
+            with open(filename) as file:
+                self.assertEqual(json.load(file)['counters'], {'requests': 1})
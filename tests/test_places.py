@@ -0,0 +1,32 @@
+import unittest
+
+from house_finder.places import PlaceIndex
+
+
+def place(place_id, latitude, longitude):
+    return {
+        'place_id': place_id,
+        'geometry': {'location': {'lat': latitude, 'lng': longitude}},
+    }
+
+
+class TestPlaceIndex(unittest.TestCase):
+
+    def test_closest(self):
+        index = PlaceIndex()
+        index.add([place('a', 52.90, -1.50), place('b', 52.95, -1.45)])
+
+        self.assertEqual(
+            index.closest([(52.91, -1.49), (52.94, -1.46)]),
+            [(52.90, -1.50), (52.95, -1.45)],
+        )
+
+    def test_deduplicates_places(self):
+        index = PlaceIndex()
+        index.add([place('a', 52.90, -1.50)])
+        index.add([place('a', 52.90, -1.50)])
+
+        self.assertEqual(len(index), 1)
+
+    def test_empty(self):
+        self.assertEqual(PlaceIndex().closest([(52.91, -1.49)]), [None])
@@ -0,0 +1,41 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+import unittest
+
+import numpy as np
+
+from house_finder.evaluator import EvaluationResult, object_array
+from house_finder.objectives import Objective
+from house_finder.outputs import output_plot
+
+
+class TestOutputPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.objectives = [Objective('x'), Objective('y'), Objective('z')]
+
+        random = np.random.RandomState(0)
+        listings = object_array([
+            SimpleNamespace(address=f'{i} Example Street', location=(0, 0))
+            for i in range(100)
+        ])
+        score_matrix = random.uniform(0, 100, size=(100, 3))
+
+        self.result = EvaluationResult(
+            listings, self.objectives, score_matrix,
+            np.full(score_matrix.shape, '', dtype=object),
+        )
+
+    def test_formats(self):
+        with TemporaryDirectory() as directory:
+            for extension in ['png', 'svg', 'pdf']:
+                filename = Path(directory) / f'plot.{extension}'
+                output_plot(self.result, self.objectives, str(filename), annotate=True)
+                self.assertGreater(filename.stat().st_size, 0)
+
+    def test_empty(self):
+        with TemporaryDirectory() as directory:
+            filename = Path(directory) / 'plot.png'
+            output_plot(self.result[np.zeros(100, dtype=bool)], self.objectives, str(filename))
+            self.assertTrue(filename.exists())
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import unittest
+
+from house_finder.maps import backend_from_config
+from house_finder.outputs import outputs
+from house_finder.plugins import Registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_loads_by_path(self):
+        registry = Registry('thing', {'dumps': 'json:dumps', 'now': 'datetime:datetime.now'})
+
+        import datetime
+        import json
+        self.assertIs(registry.load('dumps'), json.dumps)
+        self.assertEqual(registry.load('now'), datetime.datetime.now)
+
+    def test_register(self):
+        registry = Registry('thing')
+        registry.register('len', len)
+
+        self.assertIn('len', registry)
+        self.assertIs(registry.load('len'), len)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            Registry('thing').load('missing')
+
+    def test_outputs(self):
+        self.assertEqual(outputs.names(), ['html', 'plot'])
+
+    def test_backends(self):
+        self.assertIsNone(backend_from_config(None))
+        self.assertIsNone(backend_from_config({'backend': 'google'}))
+
+        with self.assertRaises(ValueError):
+            backend_from_config({'backend': 'missing'})
+
+    def test_lazy_imports(self):
+        modules = ['matplotlib', 'jinja2', 'requests_cache', 'house_finder.routing']
+
+        process = subprocess.run([
+            sys.executable, '-c',
+            f'import sys, house_finder.cli; print([m for m in {modules!r} if m in sys.modules])',
+        ], capture_output=True, text=True, check=True)
+
+        self.assertEqual(process.stdout.strip(), '[]')
@@ -0,0 +1,118 @@
+from pathlib import Path
+from types import SimpleNamespace
+from tempfile import TemporaryDirectory
+import unittest
+
+import numpy as np
+
+from house_finder.isochrone import Isochrone
+from house_finder.maps import NoTravelTimeError
+from house_finder.routing import OfflineTravelTimeBackend, RoadGraph
+
+
+# four nodes roughly 111m apart along a line of latitude, the last
+# connected by a one way street and a footpath
+OSM = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="52.000" lon="0"/>
+  <node id="2" lat="52.001" lon="0"/>
+  <node id="3" lat="52.002" lon="0"/>
+  <node id="4" lat="52.003" lon="0"/>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="residential"/>
+  </way>
+  <way id="11">
+    <nd ref="3"/><nd ref="4"/>
+    <tag k="highway" v="residential"/>
+    <tag k="oneway" v="yes"/>
+  </way>
+  <way id="12">
+    <nd ref="4"/><nd ref="1"/>
+    <tag k="highway" v="footway"/>
+  </way>
+</osm>
+'''
+
+
+def params(origin, destination, mode):
+    return {
+        'origin': origin, 'destination': destination, 'mode': mode,
+        'arrival_time': None, 'departure_time': None,
+    }
+
+
+class TestOfflineTravelTimeBackend(unittest.TestCase):
+
+    def setUp(self):
+        with TemporaryDirectory() as directory:
+            filename = Path(directory) / 'extract.osm'
+            filename.write_text(OSM)
+
+            self.graph = RoadGraph.from_osm(str(filename))
+
+        self.backend = OfflineTravelTimeBackend(self.graph)
+
+    def test_loads_graph(self):
+        self.assertEqual(len(self.graph.locations), 4)
+
+    def test_walking(self):
+        seconds = self.backend(**params((52.000, 0), (52.002, 0), 'walking'))
+        self.assertAlmostEqual(seconds, 2 * 111.32 / 1.4, delta=1)
+
+    def test_walking_uses_footpaths(self):
+        seconds = self.backend(**params((52.000, 0), (52.003, 0), 'walking'))
+        self.assertAlmostEqual(seconds, 3 * 111.32 / 1.4, delta=1)
+
+    def test_driving_respects_one_way_streets(self):
+        seconds = self.backend(**params((52.000, 0), (52.003, 0), 'driving'))
+        self.assertAlmostEqual(seconds, 3 * 111.32 / 8.0, delta=1)
+
+        with self.assertRaises(NoTravelTimeError):
+            self.backend(**params((52.003, 0), (52.000, 0), 'driving'))
+
+    def test_prefetch_searches_once_per_fixed_point(self):
+        self.backend.prefetch([
+            params((52.000, 0), (52.002, 0), 'walking'),
+            params((52.001, 0), (52.002, 0), 'walking'),
+            params((52.003, 0), (52.002, 0), 'walking'),
+        ])
+
+        self.assertEqual(len(self.backend.searches), 1)
+
+        self.backend(**params((52.001, 0), (52.002, 0), 'walking'))
+        self.assertEqual(len(self.backend.searches), 1)
+
+    def test_transit_is_not_supported(self):
+        with self.assertRaises(NoTravelTimeError):
+            self.backend(**params((52.000, 0), (52.002, 0), 'transit'))
+
+    def test_check_objectives(self):
+        self.backend.check_objectives([
+            SimpleNamespace(name='Price'),
+            SimpleNamespace(name='Work', mode='bicycling'),
+        ])
+
+        with self.assertRaisesRegex(ValueError, 'Work'):
+            self.backend.check_objectives([SimpleNamespace(name='Work', mode='transit')])
+
+    def test_one_to_many(self):
+        times = self.backend.one_to_many(
+            (52.002, 0), [(52.000, 0), (52.003, 0)], 'driving', reverse=True
+        )
+
+        self.assertEqual(len(self.backend.searches), 1)
+        self.assertAlmostEqual(times[0], 2 * 111.32 / 8.0, delta=1)
+        self.assertIsNone(times[1])
+
+    def test_one_to_many_transit(self):
+        times = self.backend.one_to_many((52.002, 0), [(52.000, 0)], 'transit')
+        self.assertEqual(times, [None])
+
+    def test_isochrone(self):
+        polygon = self.backend.isochrone((52.000, 0), 'walking', 2 * 111.32 / 1.4)
+        isochrone = Isochrone(polygon)
+
+        np.testing.assert_array_equal(
+            isochrone.contains([(52.001, 0), (52.010, 0)]), [True, False]
+        )
@@ -1,6 +1,6 @@
 import unittest
 
-from house_finder.secrets import KeysExhaustedError, Secret, Secrets
+from house_finder.secrets import KeyPool, KeysExhaustedError, Secret, Secrets
 
 
 class TestSecret(unittest.TestCase):
@@ -49,3 +49,77 @@ class TestSecrets(unittest.TestCase):
 
         self.assertEqual(secrets['service_a'].key, 'key')
         self.assertEqual(secrets['service_b'].key, 'key1')
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestKeyPool(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def pool(self, keys, **kwargs):
+        return KeyPool(keys, clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_spreads_requests(self):
+        pool = self.pool(['a', 'b'], queries_per_second=2)
+
+        self.assertEqual(sorted(pool.acquire() for _ in range(4)), ['a', 'a', 'b', 'b'])
+        self.assertEqual(self.clock.now, 0)
+
+    def test_rate_limits(self):
+        pool = self.pool(['a'], queries_per_second=2)
+
+        for _ in range(6):
+            pool.acquire()
+
+        self.assertAlmostEqual(self.clock.now, 2, places=2)
+
+    def test_cooldown_returns_key_to_service(self):
+        pool = self.pool(['a', 'b'], queries_per_second=100, cooldown=10)
+
+        pool.report_rate_limited('a')
+        self.assertEqual({pool.acquire() for _ in range(5)}, {'b'})
+
+        self.clock.now += 10
+        self.assertIn('a', {pool.acquire() for _ in range(5)})
+
+    def test_backoff_grows(self):
+        pool = self.pool(['a'], cooldown=10)
+
+        pool.report_rate_limited('a')
+        pool.report_rate_limited('a')
+        pool.acquire()
+
+        self.assertGreaterEqual(self.clock.now, 10)
+        self.assertLessEqual(self.clock.now, 20)
+
+    def test_daily_quota(self):
+        today = [1]
+        pool = KeyPool(['a', 'b'], daily_quota=1, clock=self.clock,
+                       sleep=self.clock.sleep, today=lambda: today[0])
+
+        self.assertEqual({pool.acquire(), pool.acquire()}, {'a', 'b'})
+
+        with self.assertRaises(KeysExhaustedError):
+            pool.acquire()
+
+        today[0] = 2
+        pool.acquire()
+
+    def test_from_secret(self):
+        secret = Secret.from_config({'api_keys': ['a', 'b'], 'queries_per_second': 5})
+        pool = KeyPool.from_secret(secret)
+
+        self.assertEqual(pool.queries_per_second, 5)
+        self.assertEqual(sorted(pool.acquire() for _ in range(2)), ['a', 'b'])
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from types import SimpleNamespace
+import unittest
+
+from house_finder.cache import CacheStatistics, SQLiteDictCache
+from house_finder.maps import TravelTimeCalulator, TravelTimeMatrixCalculator
+from house_finder.objectives.travel_time import Direction, MultipleTravelTimeObjective
+
+
+def place(latitude, longitude):
+    return {'geometry': {'location': {'lat': latitude, 'lng': longitude}}}
+
+
+class FakeGoogleMaps:
+
+    def __init__(self):
+        self.matrices = []
+
+    def distance_matrix(self, origins, destinations, **kwargs):
+        self.matrices.append((origins, destinations))
+
+        return {
+            'rows': [
+                {'elements': [{'status': 'OK', 'duration': {'value': 60}} for _ in destinations]}
+                for _ in origins
+            ]
+        }
+
+
+class FakeMaps:
+
+    def __init__(self, places):
+        cache = SimpleNamespace(data=SQLiteDictCache(':memory:'))
+        statistics = CacheStatistics()
+
+        self.gmaps = FakeGoogleMaps()
+        self.calculate_travel_time = TravelTimeCalulator(self, cache, statistics)
+        self.calculate_travel_times = TravelTimeMatrixCalculator(self, cache, statistics)
+        self.calculate_one_to_many_travel_times = self.calculate_travel_times.one_to_many
+        self.find_places_in_area = lambda bounds, place_type, tile_size: places
+
+    def query(self, function, name=None):
+        return function(self.gmaps)
+
+
+def listing(i):
+    return SimpleNamespace(id=str(i), location=(52.90 + i / 1000, -1.50))
+
+
+class TestMultipleTravelTimeObjective(unittest.TestCase):
+
+    def setUp(self):
+        self.maps = FakeMaps([place(52.90, -1.50), place(52.92, -1.50)])
+        self.objective = MultipleTravelTimeObjective(
+            'Station', None, self.maps, 'train_station', Direction.from_listing,
+            'transit', place_tile_size=2000,
+        )
+
+    def test_places_share_requests(self):
+        listings = [listing(i) for i in range(20)]
+
+        times = self.objective.calculate_many(listings)
+
+        self.assertEqual(times, [60] * 20)
+        self.assertEqual(len(self.maps.gmaps.matrices), 1)
+
+        origins, destinations = self.maps.gmaps.matrices[0]
+        self.assertEqual((len(origins), len(destinations)), (20, 2))
+
+    def test_prefetch_finds_nearby_places_on_the_executor(self):
+        threads = set()
+
+        def find_nearby_places(location, place_type):
+            threads.add(threading.current_thread())
+            return [place(52.90, -1.50)]
+
+        self.maps.find_nearby_places = find_nearby_places
+        self.objective.place_tile_size = None
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.objective.prefetch([listing(i) for i in range(20)], executor)
+
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(len(self.maps.gmaps.matrices), 1)
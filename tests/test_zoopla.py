@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+import threading
+import unittest
+
+from house_finder.search import Query, Zoopla
+from house_finder.secrets import Secret
+
+
+def raw_listing(listing_id):
+    return {
+        'listing_id': str(listing_id),
+        'latitude': 52.9,
+        'longitude': -1.5,
+        'price': '500',
+        'details_url': f'http://example.com/{listing_id}',
+        'displayable_address': f'{listing_id} Example Street',
+        'image_url': 'http://example.com/image.jpg',
+        'description': 'A house.',
+        'furnished_state': 'furnished',
+    }
+
+
+class FakeSession:
+
+    def __init__(self, result_count, page_size=100):
+        self.result_count = result_count
+        self.page_size = page_size
+        self.requested_pages = []
+        self.lock = threading.Lock()
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def get(self, url, params):
+        page_number = params['page_number']
+
+        with self.lock:
+            self.requested_pages.append(page_number)
+
+        first = (page_number - 1) * self.page_size
+        last = min(first + self.page_size, self.result_count)
+
+        # every page repeats the previous page's last listing
+        listings = [raw_listing(i) for i in range(max(first - 1, 0), last)]
+
+        return SimpleNamespace(json=lambda: {
+            'result_count': self.result_count,
+            'listing': listings,
+        })
+
+
+class TestZoopla(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession(result_count=250)
+        self.zoopla = Zoopla(Secret(['key']), SimpleNamespace(requests_session=self.session))
+        self.query = Query.from_config({
+            'area': 'Derby', 'listing': 'rent', 'bedrooms': 2, 'price': [0, 1000],
+        })
+
+    def test_search(self):
+        listings = list(self.zoopla.search(self.query))
+
+        self.assertEqual(sorted(self.session.requested_pages), [1, 2, 3])
+        self.assertEqual([listing.id for listing in listings], [str(i) for i in range(250)])
+
+    def test_search_is_lazy(self):
+        listings = self.zoopla.search(self.query)
+
+        self.assertEqual(next(listings).id, '0')